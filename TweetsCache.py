@@ -0,0 +1,244 @@
+import json, sqlite3, threading
+from time import time
+from collections import OrderedDict
+
+
+
+class SqliteCache():
+    """
+    Persistent key-value cache stored in a SQLite file, shared across runs.
+    Keys are strings, values are anything that can be serialized as json.
+    Values can have an expiration time, after which they are ignored.
+    """
+
+
+    def __init__(self, filename, table='cache'):
+        """
+        Class initialization. The table is created if it doesn't exist.
+
+        Args:
+            filename: path of the SQLite file.
+            table: name of the table, so that different caches can share the same file.
+        """
+        self.filename = filename
+        self.table = table
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT, expires REAL)')
+
+        # tables created before the expiration time was introduced
+        columns = [row[1] for row in self.connection.execute(f'PRAGMA table_info({table})')]
+        if 'expires' not in columns:
+            self.connection.execute(f'ALTER TABLE {table} ADD COLUMN expires REAL')
+        self.connection.commit()
+
+
+
+    def get_many(self, keys, with_expires=False):
+        """
+        Retrieves the cached values of some keys.
+
+        Args:
+            keys: iterable of keys.
+            with_expires: if True, the expiration time of each value is returned too.
+
+        Returns:
+            A dictionary with the keys found in the cache (and not expired) and their values, or (value, expiration time) tuples.
+        """
+        keys = list(keys)
+        now = time()
+        data = {}
+        with self.lock:
+            # sqlite limits the number of variables of a single query
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i+500]
+                query = f'SELECT key, value, expires FROM {self.table} WHERE key IN ({",".join("?" * len(chunk))})'
+                for key, value, expires in self.connection.execute(query, chunk):
+                    if expires is None or expires > now:
+                        data[key] = (json.loads(value), expires) if with_expires else json.loads(value)
+        return data
+
+
+
+    def set_many(self, data, ttl=None):
+        """
+        Stores some values in the cache, replacing the old ones, with a single commit.
+
+        Args:
+            data: dictionary from keys to values.
+            ttl: seconds after which the values expire, or a function returning them from each value; if None, they never expire.
+        """
+        now = time()
+        ttls = ttl if callable(ttl) else (lambda value: ttl)
+        rows = []
+        for key, value in data.items():
+            seconds = ttls(value)
+            rows.append((key, json.dumps(value), None if seconds is None else now + seconds))
+        with self.lock:
+            self.connection.executemany(f'INSERT OR REPLACE INTO {self.table} (key, value, expires) VALUES (?, ?, ?)', rows)
+            self.connection.commit()
+
+
+
+    def close(self):
+        """
+        Closes the connection to the SQLite file.
+        """
+        self.connection.close()
+
+
+
+
+class GeocodeCache():
+    """
+    Cache of geocoded locations, keyed on the normalized location string.
+    A bounded in-memory LRU cache sits in front of a persistent SQLite cache; 
+    locations that couldn't be geocoded are stored too, but they expire after negative_ttl seconds.
+    """
+
+
+    def __init__(self, filename, maxsize=100000, negative_ttl=30*24*3600):
+        """
+        Class initialization.
+
+        Args:
+            filename: path of the SQLite file.
+            maxsize: maximum number of locations kept in memory.
+            negative_ttl: seconds after which a failed geocoding is attempted again.
+        """
+        self.store = SqliteCache(filename, 'geocode')
+        self.maxsize = maxsize
+        self.negative_ttl = negative_ttl
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+
+
+    def get(self, key):
+        """
+        Retrieves a geocoded location.
+
+        Args:
+            key: normalized location.
+
+        Returns:
+            A tuple (found, value), where value is None for locations that couldn't be geocoded.
+        """
+        found = self.get_many([key])
+        return (True, found[key]) if key in found else (False, None)
+
+
+
+    def get_many(self, keys):
+        """
+        Retrieves some geocoded locations, reading the ones missing from memory with a single query.
+
+        Args:
+            keys: iterable of normalized locations.
+
+        Returns:
+            A dictionary with the locations found in the cache and their values (None for locations that couldn't be geocoded).
+        """
+        found = {}
+        absent = []
+        with self.lock:
+            now = time()
+            for key in dict.fromkeys(keys):
+                if key in self.memory and (self.memory[key][1] is None or self.memory[key][1] > now):
+                    self.memory.move_to_end(key)
+                    self.memory_hits += 1
+                    found[key] = self.memory[key][0]
+                else:
+                    absent.append(key)
+
+        data = self.store.get_many(absent, with_expires=True) if len(absent) > 0 else {}
+        with self.lock:
+            self.disk_hits += len(data)
+            self.misses += len(absent) - len(data)
+            for key, (value, expires) in data.items():
+                self.__remember(key, value, expires)
+                found[key] = value
+        return found
+
+
+
+    def set(self, key, value):
+        """
+        Stores a geocoded location.
+
+        Args:
+            key: normalized location.
+            value: geocoded location, or None if it couldn't be geocoded.
+        """
+        self.set_many({key: value})
+
+
+
+    def set_many(self, data):
+        """
+        Stores some geocoded locations, with a single commit.
+
+        Args:
+            data: dictionary from normalized locations to geocoded locations, or None if they couldn't be geocoded.
+        """
+        if len(data) == 0:
+            return
+        self.store.set_many(data, self.__ttl)
+        now = time()
+        with self.lock:
+            for key, value in data.items():
+                ttl = self.__ttl(value)
+                self.__remember(key, value, None if ttl is None else now + ttl)
+
+
+
+    def stats(self):
+        """
+        Returns the hit and miss counters.
+
+        Returns:
+            A dictionary with memory hits, disk hits, misses and hit ratio.
+        """
+        total = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits, 
+            'disk_hits': self.disk_hits, 
+            'misses': self.misses, 
+            'hit_ratio': (self.memory_hits + self.disk_hits) / total if total > 0 else 0
+        }
+
+
+
+    def close(self):
+        """
+        Closes the SQLite file.
+        """
+        self.store.close()
+
+
+
+    def __ttl(self, value):
+        """
+        Returns the seconds after which a value expires: only the failed geocodings expire.
+        """
+        return None if value is not None else self.negative_ttl
+
+
+
+    def __remember(self, key, value, expires=None):
+        """
+        Adds a location to the in-memory LRU cache, evicting the least recently used one when full; 
+        failed geocodings expire in memory at the same time as on disk.
+
+        Args:
+            key: normalized location.
+            value: geocoded location.
+            expires: expiration time of the location, or None if it never expires.
+        """
+        self.memory[key] = (value, expires)
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
@@ -0,0 +1,522 @@
+import heapq, pickle, zlib
+import pandas as pd
+import numpy as np
+from collections import Counter
+
+from TweetsUtils import get_mentions
+
+
+
+class ExactCounter():
+    """
+    Exact frequencies of a stream of items, mergeable with other ExactCounter objects.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+
+
+
+    def add(self, item, count=1):
+        """
+        Counts an item.
+
+        Args:
+            item: a hashable item.
+            count: number of occurrences.
+        """
+        self.counts[item] += count
+
+
+
+    def update(self, items):
+        """
+        Counts some items.
+
+        Args:
+            items: iterable of hashable items.
+        """
+        self.counts.update(items)
+
+
+
+    def merge(self, other):
+        """
+        Adds the frequencies of another counter.
+
+        Args:
+            other: an ExactCounter object.
+
+        Returns:
+            The counter itself.
+        """
+        self.counts.update(other.counts)
+        return self
+
+
+
+    def estimate(self, item):
+        """
+        Returns the frequency of an item.
+        """
+        return self.counts[item]
+
+
+
+    def top(self, k=None):
+        """
+        Returns the most frequent items.
+
+        Args:
+            k: number of items; if None, every item is returned.
+
+        Returns:
+            A Pandas Series from items to frequencies, sorted as pd.value_counts does.
+        """
+        return _to_series(self.counts.most_common(k))
+
+
+
+
+class SpaceSaving():
+    """
+    Approximate top-k of a stream of items with bounded memory (Space-Saving algorithm, Metwally et al.).
+
+    At most capacity items are monitored: when a new item arrives and the summary is full, it replaces the least frequent one,
+    inheriting its count as overestimation error. Every item with a frequency higher than total / capacity is guaranteed to be monitored,
+    and the estimated frequencies exceed the true ones by at most their error.
+    Summaries built on different partitions (e.g. years) can be merged, as in Agarwal et al., "Mergeable summaries".
+    """
+
+    def __init__(self, capacity=1000):
+        """
+        Class initialization.
+
+        Args:
+            capacity: maximum number of monitored items.
+        """
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        # min-heap of (count, item), with stale entries skipped when popping
+        self.heap = []
+
+
+
+    def add(self, item, count=1):
+        """
+        Counts an item.
+
+        Args:
+            item: a hashable item.
+            count: number of occurrences.
+        """
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+        else:
+            minimum, evicted = self.__pop_minimum()
+            del self.counts[evicted]
+            del self.errors[evicted]
+            self.counts[item] = minimum + count
+            self.errors[item] = minimum
+
+        heapq.heappush(self.heap, (self.counts[item], item))
+        if len(self.heap) > 4 * self.capacity:
+            self.__rebuild_heap()
+
+
+
+    def update(self, items):
+        """
+        Counts some items.
+
+        Args:
+            items: iterable of hashable items.
+        """
+        for item in items:
+            self.add(item)
+
+
+
+    def merge(self, other):
+        """
+        Adds the frequencies of another summary; items missing from a full summary are assumed to have its minimum count.
+
+        Args:
+            other: a SpaceSaving object.
+
+        Returns:
+            The summary itself.
+        """
+        min_self = self.__minimum()
+        min_other = other.__minimum()
+        counts, errors = {}, {}
+        for item in self.counts.keys() | other.counts.keys():
+            counts[item] = self.counts.get(item, min_self) + other.counts.get(item, min_other)
+            errors[item] = self.errors.get(item, min_self) + other.errors.get(item, min_other)
+
+        self.capacity = max(self.capacity, other.capacity)
+        kept = sorted(counts, key=lambda item: counts[item], reverse=True)[:self.capacity]
+        self.counts = {item: counts[item] for item in kept}
+        self.errors = {item: errors[item] for item in kept}
+        self.__rebuild_heap()
+        return self
+
+
+
+    def estimate(self, item):
+        """
+        Returns the estimated frequency of an item (an upper bound of the true one).
+        """
+        return self.counts.get(item, self.__minimum())
+
+
+
+    def guaranteed(self, item):
+        """
+        Returns the guaranteed frequency of an item (a lower bound of the true one).
+        """
+        return self.counts.get(item, 0) - self.errors.get(item, 0)
+
+
+
+    def top(self, k=None):
+        """
+        Returns the most frequent items.
+
+        Args:
+            k: number of items; if None, every monitored item is returned.
+
+        Returns:
+            A Pandas Series from items to estimated frequencies, sorted by frequency.
+        """
+        items = sorted(self.counts.items(), key=lambda x: x[1], reverse=True)
+        return _to_series(items[:k] if k is not None else items)
+
+
+
+    # count of the least frequent monitored item, 0 if the summary isn't full
+    def __minimum(self):
+        if len(self.counts) < self.capacity:
+            return 0
+        while self.heap[0][0] != self.counts.get(self.heap[0][1]):
+            heapq.heappop(self.heap)
+        return self.heap[0][0]
+
+
+    # removes the least frequent monitored item from the heap
+    def __pop_minimum(self):
+        while True:
+            count, item = heapq.heappop(self.heap)
+            if self.counts.get(item) == count:
+                return count, item
+
+
+    def __rebuild_heap(self):
+        self.heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self.heap)
+
+
+
+
+class CountMinSketch():
+    """
+    Approximate frequencies of any item of a stream in a fixed-size table of depth x width counters (Cormode and Muthukrishnan).
+    Estimates never underestimate, and they exceed the true frequency by at most 2 * total / width with probability 1 - 1/2^depth.
+    Items are hashed with crc32, so sketches with the same width and depth can be merged across processes and runs.
+    """
+
+    def __init__(self, width=2**16, depth=4):
+        """
+        Class initialization.
+
+        Args:
+            width: number of counters of each row.
+            depth: number of rows (independent hash functions).
+        """
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+
+
+    def add(self, item, count=1):
+        """
+        Counts an item.
+
+        Args:
+            item: a string (or any item, converted with str).
+            count: number of occurrences.
+        """
+        self.table[np.arange(self.depth), self.__columns([item])[:, 0]] += count
+
+
+
+    def update(self, items):
+        """
+        Counts some items, hashing them all at once.
+
+        Args:
+            items: iterable of strings.
+        """
+        items = list(items)
+        if len(items) == 0:
+            return
+        columns = self.__columns(items)
+        for row in range(self.depth):
+            self.table[row] += np.bincount(columns[row], minlength=self.width)
+
+
+
+    def merge(self, other):
+        """
+        Adds the frequencies of another sketch.
+
+        Args:
+            other: a CountMinSketch object with the same width and depth.
+
+        Returns:
+            The sketch itself.
+        """
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise Exception('Count-Min sketches with different sizes cannot be merged')
+        self.table += other.table
+        return self
+
+
+
+    def estimate(self, item):
+        """
+        Returns the estimated frequency of an item (an upper bound of the true one).
+        """
+        return int(self.table[np.arange(self.depth), self.__columns([item])[:, 0]].min())
+
+
+
+    # column of each item in each row, with double hashing: h1 + row * h2
+    def __columns(self, items):
+        encoded = [str(item).encode('utf-8') for item in items]
+        h1 = np.array([zlib.crc32(b) for b in encoded], dtype=np.int64)
+        h2 = np.array([zlib.crc32(b, 0x9E3779B9) | 1 for b in encoded], dtype=np.int64)
+        rows = np.arange(self.depth, dtype=np.int64)[:, None]
+        return (h1[None, :] + rows * h2[None, :]) % self.width
+
+
+
+
+class TweetStatistics():
+    """
+    Streaming frequencies used by the analyses, updated one tweet (or page) at a time and split by year:
+     - "retweets": ids of the referenced tweets (as in top_retweets)
+     - "authors": author ids (super tweeters)
+     - "hashtags": lowercased hashtags
+     - "mentions": lowercased mentions in the texts
+
+    Counters are exact, or, with approximate=True, Space-Saving summaries for the top items plus Count-Min sketches for any item,
+    which use bounded memory whatever the size of the corpus. Statistics of different runs or partitions can be merged,
+    and saved to answer queries like "top 25 super tweeters of 2021" without reading the tweets again.
+    """
+
+    FIELDS = ['retweets', 'authors', 'hashtags', 'mentions']
+
+
+    def __init__(self, approximate=False, capacity=10000, width=2**16, depth=4):
+        """
+        Class initialization.
+
+        Args:
+            approximate: if True, frequencies are approximated with bounded memory.
+            capacity: approximate only, number of monitored items of each Space-Saving summary.
+            width: approximate only, width of the Count-Min sketches.
+            depth: approximate only, depth of the Count-Min sketches.
+        """
+        self.approximate = approximate
+        self.capacity = capacity
+        self.width = width
+        self.depth = depth
+        self.tweets = Counter()
+        # year -> field -> counter
+        self.counters = {}
+
+
+
+    def update(self, tweet):
+        """
+        Counts a tweet, after the format fix of the merge.
+
+        Args:
+            tweet: dictionary containing a tweet.
+        """
+        year = _year(tweet.get('datetime'))
+        counters = self.__year_counters(year)
+        self.tweets[year] += 1
+
+        values = {
+            'retweets': [r['id'] for r in tweet.get('referenced_tweets', [])],
+            'authors': [tweet['author_id']] if 'author_id' in tweet else [],
+            'hashtags': [h.lower().strip() for h in tweet.get('hashtags', [])],
+            'mentions': [m.lower() for m in get_mentions(tweet.get('text', ''))]
+        }
+        for field, items in values.items():
+            for counter in counters[field]:
+                counter.update(items)
+
+
+
+    def update_many(self, tweets):
+        """
+        Counts some tweets, e.g. a page.
+
+        Args:
+            tweets: iterable of tweets.
+        """
+        for tweet in tweets:
+            self.update(tweet)
+
+
+
+    def merge(self, other):
+        """
+        Adds the frequencies of other statistics, computed with the same parameters.
+
+        Args:
+            other: a TweetStatistics object.
+
+        Returns:
+            The statistics themselves.
+        """
+        if (self.approximate, self.width, self.depth) != (other.approximate, other.width, other.depth):
+            raise Exception('Statistics computed with different parameters cannot be merged')
+        self.tweets.update(other.tweets)
+        for year, fields in other.counters.items():
+            counters = self.__year_counters(year)
+            for field in self.FIELDS:
+                for counter, other_counter in zip(counters[field], fields[field]):
+                    counter.merge(other_counter)
+        return self
+
+
+
+    def top(self, field, k=25, years=None):
+        """
+        Returns the most frequent items of a field.
+
+        Args:
+            field: "retweets", "authors", "hashtags" or "mentions".
+            k: number of items; if None, every (monitored) item is returned.
+            years: list of years to consider; if None, every year is considered.
+
+        Returns:
+            A Pandas Series from items to frequencies, sorted by frequency.
+        """
+        return self.__combined(field, years)[0].top(k)
+
+
+
+    def count(self, field, item, years=None):
+        """
+        Returns the frequency of an item (an upper bound, if approximate).
+
+        Args:
+            field: "retweets", "authors", "hashtags" or "mentions".
+            item: the item, e.g. an author id.
+            years: list of years to consider; if None, every year is considered.
+
+        Returns:
+            The frequency of the item.
+        """
+        return self.__combined(field, years)[-1].estimate(item)
+
+
+
+    def frequent(self, field, threshold, years=None):
+        """
+        Returns the items whose frequency is at least threshold (if approximate, the ones guaranteed by the Space-Saving summary
+        are always returned, while the others may be missing if the summary is too small).
+
+        Args:
+            field: "retweets", "authors", "hashtags" or "mentions".
+            threshold: minimum frequency.
+            years: list of years to consider; if None, every year is considered.
+
+        Returns:
+            A set of items.
+        """
+        counters = self.__combined(field, years)
+        if not self.approximate:
+            return {item for item, count in counters[0].counts.items() if count >= threshold}
+        # the sketch tightens the overestimation of the summary
+        return {item for item, count in counters[0].counts.items() if min(count, counters[1].estimate(item)) >= threshold}
+
+
+
+    def save(self, filename):
+        """
+        Saves the statistics into a pickle file.
+
+        Args:
+            filename: name of the file.
+        """
+        with open(filename, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+
+    @staticmethod
+    def load(filename):
+        """
+        Loads statistics saved by save.
+
+        Args:
+            filename: name of the file.
+
+        Returns:
+            A TweetStatistics object.
+        """
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+
+
+
+    # counters of a year, created if they don't exist
+    def __year_counters(self, year):
+        if year not in self.counters:
+            self.counters[year] = {field: self.__new_counters() for field in self.FIELDS}
+        return self.counters[year]
+
+
+    # exact counter, or Space-Saving summary and Count-Min sketch
+    def __new_counters(self):
+        if self.approximate:
+            return [SpaceSaving(self.capacity), CountMinSketch(self.width, self.depth)]
+        return [ExactCounter()]
+
+
+    # counters of a field merged across some years
+    def __combined(self, field, years):
+        combined = self.__new_counters()
+        for year, fields in self.counters.items():
+            if years is None or year in years:
+                for counter, year_counter in zip(combined, fields[field]):
+                    counter.merge(year_counter)
+        return combined
+
+
+
+
+# year of a datetime (string or object), None if missing
+def _year(date):
+    if date is None:
+        return None
+    if type(date) == str:
+        return int(date[:4])
+    return date.year
+
+
+
+# pandas Series from (item, count) pairs
+def _to_series(items):
+    return pd.Series([c for _, c in items], index=[i for i, _ in items], dtype=np.int64)
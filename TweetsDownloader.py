@@ -1,13 +1,19 @@
-import json, random, string, requests, re, os
+import json, random, string, requests, re, os, threading, warnings
 import pandas as pd
 import numpy as np
 from time import sleep
 from datetime import datetime
 from rapidfuzz import process, fuzz
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 from credentials import *
 from TweetsUtils import *
+from TweetsCache import SqliteCache, GeocodeCache
+from TweetsGazetteer import ItalyGazetteer, get_italy_gazetteer
+from TweetsRegions import get_region_index
+from TweetsGeocoders import NominatimGeocoder, GeocodingError
+from TweetsNetwork import RateLimiter, split_dates_range, split_counts_range, count_in_range, to_api_time, backoff_delay, create_session, TRANSIENT_STATUS_CODES
 
 
 
@@ -23,19 +29,29 @@ class TweetsDownloader():
      - 10 million per month
 
     You need to have access to this API by having the keys, stored in the credentials.py file. 
+    Requests are scheduled by a token bucket, synchronized with the rate limit headers returned by the API. 
     """
 
 
-    def __init__(self, language, max_results_per_request, sleep_time, filename, path):
+    def __init__(self, language, max_results_per_request, sleep_time, filename, path, max_retries=5, backoff_time=2, 
+                 session=None, api_url='https://api.twitter.com/2', nominatim_url='https://nominatim.openstreetmap.org', geocoder=None, 
+                 missing_tweets_ttl=7*24*3600):
         """
         Class initialization. The url for the http request and the fields to retrieve are already initialized. 
 
         Args: 
             language: two-letters country code.
             max_results_per_request: between 10 and 500. 
-            sleep_time: sleep between each request (to avoid exceeding the rate limit). 
+            sleep_time: minimum pause between two consecutive requests, in seconds (the API allows 1 request / 1 second). 
             filename: used to name folders and tweets files. 
             path: where the folder for the tweets will be created. 
+            max_retries: how many times a request is retried after a transient error (rate limit exceeded, server errors, connection errors). 
+            backoff_time: delay of the first retry, in seconds; it doubles at every attempt, with a random jitter. 
+            session: http session used for every request; if None, a pooled keep-alive session is created. 
+            api_url: base url of the Twitter API 2.0. 
+            nominatim_url: base url of the Nominatim geocoder. 
+            geocoder: Geocoder used for locations that don't match a municipality in Italy (e.g. OfflineGeocoder); if None, a NominatimGeocoder is used. 
+            missing_tweets_ttl: seconds after which a referenced tweet missing from a lookup is requested again. 
         """
         self.language = language
         self.max_results_per_request = str(max_results_per_request)
@@ -43,16 +59,52 @@ class TweetsDownloader():
         self.filename = filename
         self.path = path
         self.base_folder = path + filename + '_extended/' 
+        self.checkpoint_file = self.base_folder + filename + '_checkpoint.json'
+        self.watermarks_file = self.base_folder + filename + '_watermarks.json'
+        self.max_retries = max_retries
+        self.backoff_time = backoff_time
 
         # create folder if it doesn't exist
         Path(self.base_folder).mkdir(parents=True, exist_ok=True)
 
-        self.search_url = "https://api.twitter.com/2/tweets/search/all"
+        self.api_url = api_url
+        self.nominatim_url = nominatim_url
+        self.search_url = api_url + "/tweets/search/all"
+        self.counts_url = api_url + "/tweets/counts/all"
+        self.monthly_cap = 10000000
+        self.auth_headers = {"Authorization": "Bearer "+BEARER_TOKEN}
         self.expansions = ['referenced_tweets.id', 'author_id', 'geo.place_id']
         self.tweet_fields = ['created_at', 'geo', 'public_metrics', 'source', 'entities']
         self.user_fields = ['description', 'location', 'public_metrics', 'verified']
         self.place_fields = ['id', 'full_name', 'place_type', 'country', 'contained_within', 'geo']
 
+        # connections are reused by every request
+        if session is None:
+            session = create_session(host_limits={api_url: 10, nominatim_url: 1})
+        self.session = session
+
+        if geocoder is None:
+            geocoder = NominatimGeocoder(session, nominatim_url)
+        self.geocoder = geocoder
+
+        # shared by every thread performing search requests
+        self.search_limiter = RateLimiter(max_requests=300, window=900, min_interval=sleep_time)
+        self.lookup_limiter = RateLimiter(max_requests=300, window=900, min_interval=sleep_time)
+        self.counts_limiter = RateLimiter(max_requests=300, window=900, min_interval=sleep_time)
+
+        # referenced tweets retrieved in previous runs, opened when needed
+        self.tweets_cache = None
+        self.missing_tweets_ttl = missing_tweets_ttl
+
+        # italian places used for geolocalization, read when needed
+        self.italy_context = None
+
+        # index built on the places DataFrame passed to geolocalize, with the DataFrame itself
+        self.places_gazetteer = None
+
+        # locations geolocalized in previous runs, opened when needed
+        self.geocode_cache = None
+
 
 
 
@@ -61,33 +113,185 @@ class TweetsDownloader():
     #--------------------------------
 
 
-    def download(self, keywords, dates_range, next_token=None, max_requests=-1, original_tweets=False, verbose=True):
+    def download(self, keywords, dates_range, next_token=None, max_requests=-1, original_tweets=False, verbose=True, n_slices=1, workers=None, 
+                 incremental=False, balanced=False):
         """
         Downloads and saves tweets, based on keywords, between two dates. It retrieves them by performing multiple http get requests to the Twitter API 2.0.
+        The dates range can be split into independent time slices, downloaded in parallel, each one with its own pagination. 
+        The progress of every slice is saved in a checkpoint file inside the base folder: if the same download is started again, 
+        it resumes from the last saved page of each slice. 
+        The newest tweet downloaded for each query (its high-water mark) is stored in a watermarks file inside the base folder, 
+        once every slice is done; in incremental mode, only the tweets newer than the mark are requested (with since_id), 
+        so that periodic refreshes cost time proportional to the new tweets. 
 
         Args: 
             keywords: list of keywords which have to be present in the tweets (retrieved if one keyword is inside the text).
             dates_range: tuple with start and end date; format: ("yyyy-mm-dd", )
-            next_token: token for consecutive requests; can be found inside the previous tweet payload. If None, it starts from the first tweet. 
+            next_token: token for consecutive requests; can be found inside the previous tweet payload. If None, it starts from the first tweet (or from the checkpoint). 
             max_requests: how many requests will be performed at max; if -1, the requests will continue till every tweet in the dates range is downloaded. 
             original_tweets: if True, retweets, quotes and replies will be filtered out. 
             verbose: if True, prints a "." everytime a request is performed correctly. 
+            n_slices: number of time slices in which the dates range is split; ignored if next_token is not None or when resuming from a checkpoint. 
+            workers: number of slices downloaded at the same time; if None, every slice is downloaded at the same time. 
+            incremental: if True and the query was already downloaded, it requests only the tweets newer than the last downloaded one, 
+                         up to the end date (if None, up to now); the start date is used only if the query was never downloaded. 
+            balanced: if True, the slices have about the same number of tweets instead of the same width, according to the counts endpoint (see plan). 
         
         Raises:
-            Exception: when http request isn't performed correctly. 
+            Exception: when http request isn't performed correctly, even after the retries. 
+        """
+        query = self.__build_query(keywords, original_tweets)
+        since_id = None
+        if incremental and next_token is None:
+            since_id = self.get_watermark(keywords, original_tweets).get('newest_id')
+        if since_id is not None:
+            dates_range = (None, dates_range[1] if dates_range is not None else None)
+        elif dates_range is None:
+            raise Exception('The dates range is needed for the first download of a query')
+        checkpoint = self.__load_checkpoint(query, dates_range, n_slices, next_token, since_id, balanced)
+        slices = [s for s in checkpoint['slices'] if not s['done']]
+
+        # requests budget, shared by every slice
+        self.__requests_left = max_requests
+        self.__requests_lock = threading.Lock()
+        self.__checkpoint_lock = threading.Lock()
+
+        if len(slices) == 1:
+            self.__download_slice(query, slices[0], checkpoint, verbose)
+        elif len(slices) > 1:
+            if workers is None:
+                workers = max(1, len(slices))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self.__download_slice, query, s, checkpoint, verbose) for s in slices]
+                for future in futures:
+                    future.result()
+
+        # the mark moves only when the whole range is downloaded, otherwise the next refresh would skip the missing pages
+        if all(s['done'] for s in checkpoint['slices']):
+            self.__update_watermark(query, checkpoint['slices'])
+
+
+
+    def get_watermark(self, keywords, original_tweets=False):
         """
-        i = 0
-        old_token = ''
+        Returns the high-water mark of a query, i.e. the newest tweet downloaded for it. 
+
+        Args:
+            keywords: list of keywords or query string, as given to download. 
+            original_tweets: if True, retweets, quotes and replies were filtered out. 
+
+        Returns:
+            A dictionary with "newest_id" and "newest_time", empty if the query was never downloaded. 
+        """
+        query = self.__build_query(keywords, original_tweets)
+        if not os.path.exists(self.watermarks_file):
+            return {}
+        return read_file(self.watermarks_file).get(query, {})
+
+
+
+    def plan(self, keywords, dates_range, n_slices=1, original_tweets=False, granularity='hour'):
+        """
+        Estimates a download before starting it, with the tweets counts of the full-archive counts endpoint: 
+        the dates range is split into slices with about the same number of tweets, and the requests, the time 
+        and the share of the monthly tweets cap needed to download them are estimated. 
+
+        Args: 
+            keywords: list of keywords which have to be present in the tweets (retrieved if one keyword is inside the text).
+            dates_range: tuple with start and end date; format: ("yyyy-mm-dd", )
+            n_slices: number of time slices in which the dates range is split. 
+            original_tweets: if True, retweets, quotes and replies will be filtered out. 
+            granularity: granularity of the counts, either "minute", "hour" or "day"; finer counts give more balanced slices. 
+
+        Returns:
+            A dictionary with the total number of "tweets", the "slices" (with "start", "end", and their estimated "tweets" and "requests"), 
+            the number of "requests", the estimated "time" in seconds (with the search rate limits) and the "cap_usage", 
+            i.e. the fraction of the monthly tweets cap used by the download. 
+
+        Raises:
+            Exception: when http request isn't performed correctly, even after the retries. 
+        """
+        query = self.__build_query(keywords, original_tweets)
+        counts = self.__get_counts(query, dates_range, granularity)
+        max_results = int(self.max_results_per_request)
+
+        slices = []
+        for start, end in split_counts_range(dates_range, counts, n_slices):
+            tweets = count_in_range(counts, (start, end))
+            slices.append({'start': start, 'end': end, 'tweets': round(tweets), 'requests': max(1, int(np.ceil(round(tweets) / max_results)))})
+
+        tweets = sum(c['tweet_count'] for c in counts)
+        n_requests = sum(s['requests'] for s in slices)
+        return {
+            'tweets': tweets, 
+            'slices': slices, 
+            'requests': n_requests, 
+            'time': self.search_limiter.estimate_time(n_requests), 
+            'cap_usage': tweets / self.monthly_cap
+        }
+
+
+
+    def __get_counts(self, query, dates_range, granularity='hour'):
+        """
+        Retrieves the tweets counts of a query over time, following the pagination of the full-archive counts endpoint. 
+
+        Args:
+            query: query string, as returned by __build_query.
+            dates_range: tuple with start and end date. 
+            granularity: granularity of the counts, either "minute", "hour" or "day". 
+
+        Returns:
+            A list of buckets, as dictionaries with "start", "end" and "tweet_count". 
+
+        Raises:
+            Exception: when http request isn't performed correctly, even after the retries. 
+        """
+        url = self.counts_url + "?query=" + query
+        url += "&start_time=" + to_api_time(dates_range[0])
+        url += "&end_time=" + to_api_time(dates_range[1])
+        url += "&granularity=" + granularity
+
+        counts = []
+        next_token = None
+        while True:
+            req = self.__get(url + ("&next_token=" + next_token if next_token else ''), self.counts_limiter, self.auth_headers)
+            if req.status_code != 200:
+                raise Exception('Http request failed. Response code: ' + str(req.status_code) + ' ' + req.text)
+            data = req.json()
+            counts += data.get('data', [])
+            next_token = data.get('meta', {}).get('next_token')
+            if next_token is None:
+                return counts
+
+
+
+    def __download_slice(self, query, time_slice, checkpoint, verbose):
+        """
+        Downloads and saves the tweets of a single time slice, following its pagination and updating the checkpoint after each page. 
+
+        Args: 
+            query: query string, as returned by __build_query.
+            time_slice: dictionary with start and end date of the slice, last next_token and number of downloaded pages. 
+            checkpoint: dictionary containing every slice of the download. 
+            verbose: if True, prints a "." everytime a request is performed correctly. 
+        
+        Raises:
+            Exception: when http request isn't performed correctly, even after the retries. 
+        """
+        since_id = checkpoint.get('since_id')
+        next_token = time_slice['next_token']
         if next_token is None:
-            # random string for the first file name
-            next_token = '0000000000' + ''.join(random.choices(string.ascii_letters + string.digits, k=35))
+            # fixed string for the first file name, so that a resumed slice overwrites its first page
+            first = 'since' + since_id if since_id is not None else time_slice['start']
+            next_token = '0000000000' + ''.join(c for c in first if c.isalnum())
 
-        while next_token != old_token and i != max_requests:
+        while not time_slice['done'] and self.__take_request():
             
-            req = self.__http_request(keywords, dates_range, next_token, original_tweets)
+            req = self.__http_request(query, (time_slice['start'], time_slice['end']), next_token, since_id)
             
             if req.status_code != 200:
-                raise Exception('Http request failed. Response code: ' + str(req.json()))
+                raise Exception('Http request failed. Response code: ' + str(req.status_code) + ' ' + req.text)
 
             if verbose:
                 print('.', end='')
@@ -95,28 +299,122 @@ class TweetsDownloader():
             data = req.json()
             name = self.base_folder + self.filename + '_' + next_token + '.json'
             save_file(data, name)
-            sleep(self.sleep_time)
             
-            old_token = next_token
-            if 'next_token' in data['meta']:
-                next_token = data['meta']['next_token']
+            with self.__checkpoint_lock:
+                time_slice['pages'] += 1
+                for tweet in data.get('data', []):
+                    if time_slice.get('newest_id') is None or int(tweet['id']) > int(time_slice['newest_id']):
+                        time_slice['newest_id'] = tweet['id']
+                        time_slice['newest_time'] = tweet.get('created_at')
+                if 'next_token' in data['meta'] and data['meta']['next_token'] != next_token:
+                    next_token = data['meta']['next_token']
+                    time_slice['next_token'] = next_token
+                else:
+                    time_slice['done'] = True
+                self.__save_checkpoint(checkpoint)
+
+
+
+    def __take_request(self):
+        """
+        Takes a request from the budget shared by the slices. 
 
-            i += 1
+        Returns:
+            True if the request can be performed, False if the budget is over. 
+        """
+        with self.__requests_lock:
+            if self.__requests_left == 0:
+                return False
+            self.__requests_left -= 1
+            return True
 
 
 
-    def __http_request(self, keywords, dates_range, next_token, original_tweets):
+    def __load_checkpoint(self, query, dates_range, n_slices, next_token, since_id=None, balanced=False):
         """
-        Perform an http request to the Twitter API 2.0. 
+        Loads the checkpoint of a previous download with the same query and dates range, or creates a new one. 
+
+        Args:
+            query: query string, as returned by __build_query.
+            dates_range: tuple with start and end date; the start date is None for incremental downloads, the end date may be None (now). 
+            n_slices: number of time slices in which the dates range is split. 
+            next_token: if not None, the checkpoint is replaced by a single slice starting from this token. 
+            since_id: if not None, only the tweets newer than this id are downloaded, in a single slice. 
+            balanced: if True, the slices have about the same number of tweets, according to the counts endpoint. 
+
+        Returns:
+            A dictionary with the query, the dates range, the since_id and the list of slices. 
+        """
+        dates_range = [to_api_time(d) if d is not None else None for d in dates_range]
+
+        if next_token is None and os.path.exists(self.checkpoint_file):
+            checkpoint = read_file(self.checkpoint_file)
+            if checkpoint['query'] == query and checkpoint['dates_range'] == dates_range and checkpoint.get('since_id') == since_id:
+                return checkpoint
+
+        if next_token is None and since_id is None and balanced and n_slices > 1:
+            bounds = split_counts_range(dates_range, self.__get_counts(query, dates_range), n_slices)
+        elif next_token is None and since_id is None:
+            bounds = split_dates_range(dates_range, n_slices)
+        else:
+            bounds = [dates_range]
+
+        checkpoint = {
+            'query': query, 
+            'dates_range': dates_range, 
+            'since_id': since_id, 
+            'slices': [{'start': s, 'end': e, 'next_token': next_token, 'pages': 0, 'done': False} for s, e in bounds]
+        }
+        self.__save_checkpoint(checkpoint)
+        return checkpoint
+
+
+
+    def __save_checkpoint(self, checkpoint):
+        """
+        Atomically writes the checkpoint file, so that an interrupted write never corrupts it. 
+
+        Args:
+            checkpoint: dictionary containing every slice of the download. 
+        """
+        tmp_name = self.checkpoint_file + '.tmp'
+        save_file(checkpoint, tmp_name)
+        os.replace(tmp_name, self.checkpoint_file)
+
+
+
+    def __update_watermark(self, query, slices):
+        """
+        Moves the high-water mark of a query to the newest tweet of the downloaded slices, if newer. 
+
+        Args:
+            query: query string, as returned by __build_query.
+            slices: list of slices, with the newest tweet id and time of their pages. 
+        """
+        watermarks = read_file(self.watermarks_file) if os.path.exists(self.watermarks_file) else {}
+        mark = watermarks.get(query, {})
+        for s in slices:
+            if s.get('newest_id') is not None and (mark.get('newest_id') is None or int(s['newest_id']) > int(mark['newest_id'])):
+                mark = {'newest_id': s['newest_id'], 'newest_time': s['newest_time']}
+        if len(mark) == 0 or watermarks.get(query) == mark:
+            return
+        watermarks[query] = mark
+        tmp_name = self.watermarks_file + '.tmp'
+        save_file(watermarks, tmp_name)
+        os.replace(tmp_name, self.watermarks_file)
+
+
+
+    def __build_query(self, keywords, original_tweets):
+        """
+        Builds the (url encoded) query string. 
 
         Args:
             keywords: list of keywords which have to be present in the tweets (retrieved if one keyword is inside the text) or a query string. 
-            dates_range: tuple with start and end date, with format: ("yyyy-mm-dd", "yyyy-mm-dd"). 
-            next_token: token for consecutive requests; can be found inside the previous tweet payload. 
             original_tweets: if True, retweets, quotes and replies will be filtered out. 
 
         Returns:
-            The http request object. 
+            The query string. 
         """
         if type(keywords) == list:
             query = '(' + '%20OR%20'.join(['"' + x+'"' if ' ' in x else x for x in keywords]) + ')'
@@ -126,37 +424,109 @@ class TweetsDownloader():
         
         if original_tweets:
              query += '%20-is%3Aretweet%20-is%3Aquote%20-is%3Areply'
-        
+        return query
+
+
+
+    def __get(self, url, limiter, headers=None):
+        """
+        Performs an http get request, waiting for the rate limiter and retrying with exponential backoff on transient errors. 
+
+        Args:
+            url: the url of the request. 
+            limiter: RateLimiter of the endpoint. 
+            headers: headers of the request. 
+
+        Returns:
+            The http request object of the last attempt. 
+
+        Raises:
+            Exception: when the request keeps failing because of connection errors. 
+        """
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire()
+            try:
+                req = self.session.get(url, headers=headers)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise Exception('Http request failed. ' + str(e))
+                sleep(backoff_delay(attempt, self.backoff_time))
+                continue
+
+            limiter.update(req.headers)
+            if req.status_code not in TRANSIENT_STATUS_CODES or attempt == self.max_retries:
+                return req
+            sleep(backoff_delay(attempt, self.backoff_time))
+
+
+
+    def __http_request(self, query, dates_range, next_token, since_id=None):
+        """
+        Perform an http request to the Twitter API 2.0. 
+
+        Args:
+            query: query string, as returned by __build_query. 
+            dates_range: tuple with start and end date, with format: ("yyyy-mm-dd", "yyyy-mm-dd") or ("yyyy-mm-ddTHH:MM:SS.00Z", "yyyy-mm-ddTHH:MM:SS.00Z"); 
+                         a None date is not sent. 
+            next_token: token for consecutive requests; can be found inside the previous tweet payload. 
+            since_id: if not None, only tweets newer than this id are returned, and the start date is not sent. 
+
+        Returns:
+            The http request object. 
+        """
         url = self.search_url + "?query=" + query
         if next_token[:10] != '0000000000':
             url += "&next_token=" + next_token
-        url += "&start_time=" + dates_range[0] + 'T00:00:00.00Z'
-        url += "&end_time=" + dates_range[1] + 'T00:00:00.00Z'
+        if since_id is not None:
+            url += "&since_id=" + since_id
+        elif dates_range[0] is not None:
+            url += "&start_time=" + to_api_time(dates_range[0])
+        if dates_range[1] is not None:
+            url += "&end_time=" + to_api_time(dates_range[1])
         url += "&tweet.fields=" + ','.join(self.tweet_fields)
         url += "&expansions=" + ','.join(self.expansions)
         url += "&user.fields=" + ','.join(self.user_fields)
         url += "&place.fields=" + ','.join(self.place_fields)
         url += "&max_results=" + self.max_results_per_request
         
-        headers = {"Authorization": "Bearer "+BEARER_TOKEN}
-        
-        return requests.get(url, headers=headers)
+        return self.__get(url, self.search_limiter, self.auth_headers)
 
 
 
-    def __single_tweet_request(self, tweet_id):
+    def __lookup_tweets_texts(self, tweet_ids):
         """
-        Download a single tweet given an id. 
+        Retrieves the text of some tweets, using the persistent cache and the multi-id lookup endpoint (100 ids per request). 
+        Tweets missing from the response are cached as None for missing_tweets_ttl seconds, since they may be only temporarily unavailable. 
 
         Args:
-            tweet_id: id of the tweet. 
+            tweet_ids: iterable of tweet ids. 
 
         Returns:
-            The tweet as a dictionary. 
+            A dictionary from tweet id to its text (or None). 
         """
-        url = "https://api.twitter.com/2/tweets/" + str(tweet_id)
-        headers = {"Authorization": "Bearer "+BEARER_TOKEN}
-        return requests.get(url, headers=headers)
+        if self.tweets_cache is None:
+            self.tweets_cache = SqliteCache(self.path + 'tweets_cache.sqlite', 'referenced_tweets')
+
+        texts = self.tweets_cache.get_many(tweet_ids)
+        absent_ids = [_id for _id in tweet_ids if _id not in texts]
+
+        for i in range(0, len(absent_ids), 100):
+            chunk = absent_ids[i:i+100]
+            url = self.api_url + "/tweets?ids=" + ','.join(chunk)
+            req = self.__get(url, self.lookup_limiter, self.auth_headers)
+            if req.status_code != 200:
+                print('error:', req)
+                continue
+
+            data = req.json()
+            d = {tweet['id']: tweet['text'] for tweet in data.get('data', [])}
+            missing = {_id: None for _id in chunk if _id not in d}
+            self.tweets_cache.set_many(d)
+            self.tweets_cache.set_many(missing, self.missing_tweets_ttl)
+            texts.update(d)
+            texts.update(missing)
+
+        return texts
 
 
 
@@ -166,33 +536,202 @@ class TweetsDownloader():
     #--------------------------------
 
 
-    def merge_tweets_content(self, destination_path=None, fix_retweets_text=False):
+    def __get_pages_filenames(self):
         """
-        Merge tweets from different requests into a single one, while fixing their format. 
+        Lists the files of the downloaded pages, excluding merged files and checkpoints. 
 
-        Args:
-            destination_path: new destination folder for the final files. If None, it will use the same folder as before. 
-            fix_retweets_text: if True, replace the truncated text with the full referenced tweet text. 
+        Returns:
+            A list of filenames. 
         """
-        filenames = [self.base_folder + f for f in os.listdir(self.base_folder) if ('contents' not in f) and ('users' not in f) and ('places' not in f)]
-        tweets = []
+        excluded = ['contents', 'users', 'places', 'checkpoint', 'watermarks', 'merged', '.tmp']
+        return [self.base_folder + f for f in os.listdir(self.base_folder) if not any(x in f for x in excluded)]
+
 
-        for f in filenames:
-            tmp = read_file(f)['data']
-            for tweet in tmp:
-                self.__fix_tweet(tweet)
-            tweets += tmp
 
-        if fix_retweets_text:
-            tweets = self.__replace_retweets_text(tweets)
+    def merge(self, destination_path=None, fix_retweets_text=False, geolocalize_locations=False, italy_subset=False, 
+              contents=True, users=True, places=True, _type='jsonl', statistics=None, incremental=False):
+        """
+        Merge tweets, users and places from different requests, while fixing their format, in a single pass over the downloaded pages. 
+        Each page is read once and its items are written incrementally, so the memory usage doesn't depend on the size of the corpus. 
+        Users and places are deduplicated by id; when geolocalizing, the (unique) users are kept until the end, 
+        so that their distinct locations are geolocalized in bulk. 
+        The merged pages are listed in a manifest next to the merged files: in incremental mode, only the pages not merged yet are read, 
+        their tweets and places are appended to the merged files, and their users replace the merged ones with the same id (the others are appended). 
+        Appending is done in place for json lines files, while json and parquet files are rewritten in a streaming pass. 
 
+        Args:
+            destination_path: new destination folder for the final files. If None, it will use the same folder as before. 
+            fix_retweets_text: if True, replace the truncated text with the full referenced tweet text. 
+            geolocalize_locations: if True, geolocalize users location through Nominatim requests. 
+            italy_subset: if True, it geolocalizes only italian users locations and saves only italian places. 
+            contents: if True, merges the tweets. 
+            users: if True, merges the users. 
+            places: if True, merges the places. 
+            _type: format of the destination files, either "jsonl", "json" or "parquet" (typed columns, tweets fields outside get_tweets_schema() are dropped). 
+            statistics: TweetStatistics object (see TweetsCounters) updated with every merged tweet, with its final text. 
+            incremental: if True and the destination files were merged with the same options, only the new pages are merged into them. 
+        """
         if destination_path is None:
             destination_path = self.base_folder
 
         # create folder if it doesn't exist
         Path(destination_path).mkdir(parents=True, exist_ok=True)
 
-        save_file(tweets, destination_path+self.filename+'_contents.json')
+        filenames = {}
+        for part, enabled in [('contents', contents), ('users', users), ('places', places)]:
+            if enabled:
+                filenames[part] = destination_path + self.filename + '_' + part + '.' + _type
+
+        manifest_file = destination_path + self.filename + '_merged.json'
+        options = {'type': _type, 'fix_retweets_text': fix_retweets_text, 'geolocalize_locations': geolocalize_locations, 
+                   'italy_subset': italy_subset, 'parts': sorted(filenames)}
+        pages = self.__get_pages_filenames()
+        merged_pages = self.__load_merged_pages(manifest_file, options, filenames) if incremental else None
+        if merged_pages is not None:
+            pages = [f for f in pages if os.path.basename(f) not in merged_pages]
+            if len(pages) == 0:
+                return
+
+        writers = {}
+        for part, filename in filenames.items():
+            schema = get_tweets_schema() if part == 'contents' and _type == 'parquet' else None
+            if merged_pages is not None and part == 'contents':
+                # new tweets are completed in a separate file, then appended
+                writers[part] = FileWriter(destination_path + self.filename + '_contents_new.' + _type, _type, schema)
+            elif merged_pages is not None and part == 'places':
+                writers[part] = FileWriter(filename, _type, schema, append=True)
+            elif merged_pages is None:
+                writers[part] = FileWriter(filename, _type, schema)
+
+        seen_users, seen_places = set(), set()
+        pending_ids, pending_tweets = set(), set()
+        users_to_geolocalize = []
+        if merged_pages is not None and places:
+            seen_places.update(p['id'] for p in iter_file(filenames['places']))
+
+        for f in pages:
+            page = read_file(f)
+            includes = page.get('includes', {})
+
+            if contents:
+                # referenced tweets are included in the same page
+                referenced_texts = {tw['id']:tw['text'] for tw in includes.get('tweets', [])}
+                for tweet in page.get('data', []):
+                    self.__fix_tweet(tweet)
+                    referenced_id = is_retweet(tweet)
+                    if fix_retweets_text and referenced_id:
+                        if referenced_id in referenced_texts:
+                            tweet['text'] = referenced_texts[referenced_id]
+                        else:
+                            pending_ids.add(referenced_id)
+                            pending_tweets.add(tweet['id'])
+                    # the tweets whose text is pending are counted once their text is replaced
+                    if statistics is not None and tweet['id'] not in pending_tweets:
+                        statistics.update(tweet)
+                    writers['contents'].write(tweet)
+
+            if users:
+                new_users = [u for u in includes.get('users', []) if int(u['id']) not in seen_users]
+                seen_users.update(int(u['id']) for u in new_users)
+                for user in new_users:
+                    for k,v in user.pop('public_metrics', {}).items():
+                        user[k] = v
+                if geolocalize_locations or merged_pages is not None:
+                    # users are geolocalized (or merged with the previous ones) all together at the end
+                    users_to_geolocalize += new_users
+                else:
+                    for user in new_users:
+                        writers['users'].write(user)
+
+            if places:
+                new_places = [p for p in includes.get('places', []) if p['id'] not in seen_places]
+                seen_places.update(p['id'] for p in new_places)
+                for p in new_places:
+                    p['bounding_box'] = p['geo']['bbox']
+                    del p['geo']
+                for p in self.__reformat_places(new_places, italy_subset):
+                    writers['places'].write(p)
+
+        if len(users_to_geolocalize) > 0 and geolocalize_locations:
+            users_to_geolocalize = self.__geolocalize_users_locations(users_to_geolocalize, italy_subset)
+        if merged_pages is not None and len(users_to_geolocalize) > 0:
+            self.__update_users(filenames['users'], users_to_geolocalize, _type)
+        else:
+            for user in users_to_geolocalize:
+                writers['users'].write(user)
+
+        for writer in writers.values():
+            writer.close()
+
+        if pending_ids:
+            self.__replace_retweets_text(writers['contents'].filename, pending_ids, _type, statistics, pending_tweets)
+
+        if merged_pages is not None and contents:
+            writer = FileWriter(filenames['contents'], _type, get_tweets_schema() if _type == 'parquet' else None, append=True)
+            for tweet in iter_file(writers['contents'].filename):
+                writer.write(tweet)
+            writer.close()
+            os.remove(writers['contents'].filename)
+
+        merged_pages = (merged_pages or set()) | {os.path.basename(f) for f in pages}
+        tmp_name = manifest_file + '.tmp'
+        save_file({'options': options, 'pages': sorted(merged_pages)}, tmp_name)
+        os.replace(tmp_name, manifest_file)
+
+
+
+    def __load_merged_pages(self, manifest_file, options, filenames):
+        """
+        Reads the pages already merged into the destination files, if they were merged with the same options. 
+
+        Args:
+            manifest_file: manifest written by the previous merge. 
+            options: options of the current merge. 
+            filenames: dictionary from part to destination file. 
+
+        Returns:
+            The set of the merged pages names, or None if the files must be merged from scratch. 
+        """
+        if not os.path.exists(manifest_file) or not all(os.path.exists(f) for f in filenames.values()):
+            return None
+        manifest = read_file(manifest_file)
+        if manifest['options'] != options:
+            return None
+        return set(manifest['pages'])
+
+
+
+    def __update_users(self, filename, users, _type):
+        """
+        Merges some users into a merged users file, in a streaming pass: the users already in the file are replaced 
+        by the new version (e.g. with updated metrics), the others are appended. 
+
+        Args:
+            filename: merged users file. 
+            users: list of users, where each user is a dictionary. 
+            _type: format of the merged file, either "jsonl", "json" or "parquet". 
+        """
+        updated = {user['id']: user for user in users}
+        writer = FileWriter(filename + '.tmp', _type)
+        for user in iter_file(filename):
+            writer.write(updated.pop(user['id'], user))
+        for user in updated.values():
+            writer.write(user)
+        writer.close()
+        os.replace(filename + '.tmp', filename)
+
+
+
+    def merge_tweets_content(self, destination_path=None, fix_retweets_text=False, _type='json'):
+        """
+        Merge tweets from different requests into a single one, while fixing their format. 
+
+        Args:
+            destination_path: new destination folder for the final files. If None, it will use the same folder as before. 
+            fix_retweets_text: if True, replace the truncated text with the full referenced tweet text. 
+            _type: format of the destination file, either "json", "jsonl" or "parquet". 
+        """
+        self.merge(destination_path, fix_retweets_text=fix_retweets_text, users=False, places=False, _type=_type)
 
 
 
@@ -203,9 +742,8 @@ class TweetsDownloader():
         Args:
             tweet: dictionary containing a tweet. 
         """
-        # fix datetime
-        tweet['datetime'] = str(datetime.strptime(tweet['created_at'], "%Y-%m-%dT%H:%M:%S.%fZ"))
-        del tweet['created_at']
+        # fix datetime: it's kept as a datetime object, written as "yyyy-mm-dd HH:MM:SS" in json files and as a timestamp in parquet files
+        tweet['datetime'] = datetime.fromisoformat(tweet.pop('created_at').rstrip('Z'))
         
         # fix hashtags
         if 'entities' in tweet:
@@ -224,51 +762,39 @@ class TweetsDownloader():
 
 
 
-    def __replace_retweets_text(self, tweets):
+    def __replace_retweets_text(self, filename, referenced_ids, _type, statistics=None, pending_tweets=()):
         """
-        Replaces the truncated text of the retweets with the full text of the reference tweet. If the referenced tweet is not in the downloaded tweets, it retrieves it through the API. 
+        Replaces the truncated text of the retweets whose referenced tweet wasn't included in the downloaded pages, 
+        by retrieving it through the API (or the persistent cache) and rewriting the merged file in a streaming pass. 
 
         Args:
-            tweets: list of tweets. 
-
-        Returns:
-            The updated list of tweets. 
+            filename: merged tweets file. 
+            referenced_ids: set of referenced tweets ids to retrieve. 
+            _type: format of the merged file, either "jsonl", "json" or "parquet". 
+            statistics: TweetStatistics object updated with the retweets whose text was pending. 
+            pending_tweets: ids of the retweets whose text was pending. 
         """
-        retweets = [tw for tw in tweets if is_retweet(tw)]
-        referenced_ids = set([tw['referenced_tweets'][0]['id'] for tw in retweets])
-
-        referenced_tweets = filter_list(tweets, 'id', referenced_ids, multiple=True)
-        referenced_tweets = {x['id']:x['text'] for x in referenced_tweets} # reformat as dict
-
-        absent_ids = referenced_ids.difference(set(referenced_tweets.keys()))
-
-        # search for absent retweets
-        d = {}
-        for _id in absent_ids:
-            req = self.__single_tweet_request(_id)
-            if req.status_code != 200:
-                print('error:', req)
-            else:
-                d[_id] = req.json()['data']['text']
-        
-        # sleep for rate limit
-        sleep(self.sleep_time)
-
-        # merge dictionaries
-        referenced_tweets = {**referenced_tweets, **d}
-
-        # fix retweets text
-        for tw in tweets:
-            if is_retweet(tw):
-                referenced_id = tw['referenced_tweets'][0]['id']
-                if referenced_id in referenced_tweets:
-                    tw['text'] = referenced_tweets[referenced_id]
-
-        return tweets
+        referenced_tweets = self.__lookup_tweets_texts(sorted(referenced_ids))
+        referenced_tweets = {k:v for k,v in referenced_tweets.items() if v is not None}
+        if len(referenced_tweets) == 0:
+            if statistics is not None:
+                statistics.update_many(tw for tw in iter_file(filename) if tw['id'] in pending_tweets)
+            return
+
+        writer = FileWriter(filename + '.tmp', _type, get_tweets_schema() if _type == 'parquet' else None)
+        for tw in iter_file(filename):
+            referenced_id = is_retweet(tw)
+            if referenced_id in referenced_tweets:
+                tw['text'] = referenced_tweets[referenced_id]
+            if statistics is not None and tw['id'] in pending_tweets:
+                statistics.update(tw)
+            writer.write(tw)
+        writer.close()
+        os.replace(filename + '.tmp', filename)
             
 
             
-    def merge_users_info(self, destination_path=None, geolocalize_locations=False, italy_subset=False):
+    def merge_users_info(self, destination_path=None, geolocalize_locations=False, italy_subset=False, _type='json'):
         """
         Merge users information from different requests into a single one, while fixing their format, 
         meaning it flattens some fields, takes unique users, and geolocalizes their location. 
@@ -277,41 +803,20 @@ class TweetsDownloader():
             destination_path: new destination folder for the final files. If None, it will use the same folder as before. 
             geolocalize_locations: if True, geolocalize users location through Nominatim requests. 
             italy_subset: if True and geolocalize_locations is True, it geolocalizes only italian places. 
+            _type: format of the destination file, either "json", "jsonl" or "parquet". 
         """
-        filenames = [self.base_folder + f for f in os.listdir(self.base_folder) if ('contents' not in f) and ('users' not in f) and ('places' not in f)]
-        
-        # concatenate users
-        users = []
-        for f in filenames:
-            users += read_file(f)['includes']['users']
-        
-        # set
-        users = list({u['id']:u for u in users}.values())
-        
-        # flatten 
-        for user in users:
-            for k,v in user['public_metrics'].items():
-                    user[k] = v
-            del user['public_metrics']
-
-        # geolocalization
-        if geolocalize_locations:
-            users = self.__geolocalize_users_locations(users, italy_subset)
-        
-        # save new file
-        if destination_path is None:
-            destination_path = self.base_folder
-
-        # create folder if it doesn't exist
-        Path(destination_path).mkdir(parents=True, exist_ok=True)
-
-        save_file(users, destination_path+self.filename+'_users.json')
+        self.merge(destination_path, geolocalize_locations=geolocalize_locations, italy_subset=italy_subset, 
+                   contents=False, places=False, _type=_type)
 
 
 
     def __geolocalize_users_locations(self, users, italy_subset=False):
         """
         Geolocalize the users location from the users list. 
+        The distinct locations not found in the persistent cache are matched in bulk against the places in Italy, 
+        and only the remaining ones are requested to Nominatim. 
+        Geolocalized locations (and locations without results, for a while) are stored in the cache, shared across runs; 
+        locations whose geocoding failed because of an error are left as they are, not cached, and a warning is issued. 
 
         Args:
             users: list of users, where each user is a dictionary. 
@@ -320,75 +825,83 @@ class TweetsDownloader():
         Returns:
             The same users list, with the location field geolocalized. 
         """
-        df_italy_places = self.__get_italy_places()
-        comuni_words = self.__get_italy_places_words(df_italy_places)
-        regioni = self.__get_italy_regions(df_italy_places)
+        gazetteer, comuni_words, regioni = self.__get_italy_context()
+        if self.geocode_cache is None:
+            self.geocode_cache = GeocodeCache(self.path + 'geocode_cache.sqlite')
 
-        data = {}
+        # italian and worldwide geolocalizations differ
+        prefix = 'italy|' if italy_subset else 'world|'
+
+        # distinct normalized locations
+        users_locations = {}
         for user in users:
             if 'location' in user:
-                loc = user['location']
-                loc = self.__normalize_location(loc)
-                
-                if loc is not None:
-                    if (loc not in data) and (not italy_subset or self.__is_location_useful(loc, comuni_words)):
-                        geo = self.geolocalize(loc, df_italy_places, regioni, italy_subset)
-                        if geo is not None:
-                            data[loc] = {'lat': geo[0], 'lon': geo[1], 'name': loc}
-                            if italy_subset:
-                                data[loc]['region'] = geo[2]
-                            else:
-                                data[loc]['country'] = geo[2]
-
-
-                    if loc in data:
-                        user['location'] = data[loc]
+                loc = self.normalize_location(user['location'])
+                if loc is not None and (not italy_subset or self.__is_location_useful(loc, comuni_words)):
+                    users_locations[user['id']] = loc
+
+        # distinct locations are read from the cache with a single query
+        distinct = set(users_locations.values())
+        cached = self.geocode_cache.get_many(prefix + loc for loc in distinct)
+        data = {loc: cached[prefix + loc] for loc in distinct if prefix + loc in cached}
+        missing = [loc for loc in distinct if prefix + loc not in cached]
+
+        matches = gazetteer.find_similar_matches(missing) if italy_subset else {}
+        geocoded = []
+        failed = set()
+        for loc in missing:
+            data[loc] = None
+            try:
+                geo = self.__complete_match(loc, matches.get(loc), regioni, italy_subset)
+            except GeocodingError:
+                failed.add(loc)
+                continue
+            if geo is not None:
+                data[loc] = {'lat': geo[0], 'lon': geo[1], 'name': loc}
+                if italy_subset:
+                    data[loc]['region'] = geo[2]
+                    if matches.get(loc) is None:
+                        geocoded.append(loc)
+                else:
+                    data[loc]['country'] = geo[2]
+
+        # regions of the geocoded locations come from their coordinates, as the ones of the municipalities
+        if len(geocoded) > 0:
+            located = get_region_index().locate([data[loc]['lat'] for loc in geocoded], [data[loc]['lon'] for loc in geocoded])
+            for loc, region in zip(geocoded, located):
+                if region is not None:
+                    data[loc]['region'] = region
+
+        # and the new ones are written with a single commit, except the failed ones, attempted again next time
+        self.geocode_cache.set_many({prefix + loc: data[loc] for loc in missing if loc not in failed})
+        if len(failed) > 0:
+            warnings.warn(f'{len(failed)} locations could not be geocoded because of errors; they will be attempted again by the next merge')
+
+        for user in users:
+            loc = users_locations.get(user['id'])
+            if loc is not None and data[loc] is not None:
+                user['location'] = dict(data[loc])
         return users
 
 
 
-    def merge_places(self, destination_path=None, italy_subset=False):
+    def merge_places(self, destination_path=None, italy_subset=False, _type='json'):
         """
         Merge tweets places from different requests into a single one, while fixing their format. 
 
         Args:
             destination_path: new destination folder for the final files. If None, it will use the same folder as before. 
             italy_subset: if True, it saves only italian places. 
+            _type: format of the destination file, either "json", "jsonl" or "parquet". 
         """
-        filenames = [self.base_folder + f for f in os.listdir(self.base_folder) if ('contents' not in f) and ('users' not in f) and ('places' not in f)]
-
-        # concatenate places
-        places = []
-        for f in filenames:
-            tmp = read_file(f)['includes']
-            if 'places' in tmp:
-                places += tmp['places']
-        
-        # set
-        places = list({u['id']:u for u in places}.values())
-
-        # flatten coordinates
-        for p in places:
-            p['bounding_box'] = p['geo']['bbox']
-            del p['geo']
-
-        # reformat
-        places = self.__reformat_places(places, italy_subset)
-        
-        # save new file
-        if destination_path is None:
-            destination_path = self.base_folder
-
-        # create folder if it doesn't exist
-        Path(destination_path).mkdir(parents=True, exist_ok=True)
-        
-        save_file(places, destination_path+self.filename+'_places.json')
+        self.merge(destination_path, italy_subset=italy_subset, contents=False, users=False, _type=_type)
 
 
     
     def __reformat_places(self, places, italy_subset=False):
         """
         Calculate coordinates from the place bounding box, filter out non-italian cities, separates name from region. 
+        Regions of italian places are found from the coordinates with the regions borders, without any request. 
 
         Args:
             places: list of places, where each place is a dictionary. 
@@ -397,24 +910,26 @@ class TweetsDownloader():
         Returns:
             The formatted places list. 
         """
-        df_italy_places = self.__get_italy_places()
-        regions = self.__get_italy_regions(df_italy_places)
-
         places = [p for p in places if (p['place_type'] == 'city') and (not italy_subset or p['country'] == 'Italia')]
+        if len(places) == 0:
+            return places
 
         for p in places:
             p['lat'] = np.mean(p['bounding_box'][1::2])
             p['lon'] = np.mean(p['bounding_box'][::2])
 
+        # regions from the centroids, in bulk, falling back to the region in the full name (e.g. "Roma, Lazio")
+        if italy_subset:
+            located = get_region_index().locate([p['lat'] for p in places], [p['lon'] for p in places])
+
+        for i, p in enumerate(places):
             if italy_subset:
-                try:
-                    full_name = p['full_name'].split(', ')
-                    p['name'] = full_name[0]
+                full_name = p['full_name'].split(', ')
+                p['name'] = full_name[0] if len(full_name) > 1 else p['full_name']
+                if located[i] is not None:
+                    p['region'] = located[i]
+                elif len(full_name) > 1:
                     p['region'] = self.__fix_region(full_name[1])
-                except:
-                    geo = self.geolocalize(p['full_name'], df_italy_places, regions, True)
-                    p['name'] = p['full_name']
-                    p['region'] = self.__fix_region(geo[2])
             
             for field in ['bounding_box', 'place_type', 'full_name']:
                 del p[field]
@@ -433,43 +948,65 @@ class TweetsDownloader():
 
     def geolocalize(self, location, italy_places, regions, italy_subset=False):
         """
-        Geolocalize a location. If the location is not inside the list of places in Italy, then it performs a http request to Nominatim to geolocalize the address. 
+        Geolocalize a location. If the location is not inside the list of places in Italy, then it uses the geocoder to geolocalize the address 
+        (by default, a http request to Nominatim). 
 
         Args:
             location: address to be geolocalized. 
-            italy_places: Pandas DataFrame containing every municipality in Italy, with their respective coordinates, province and region. 
+            italy_places: ItalyGazetteer index, or Pandas DataFrame, of every municipality in Italy, with their respective coordinates, province and region. 
+                A DataFrame is indexed the first time it's passed. 
             regions: set of regions. 
             italy_subset: if True, it checks for similar matches in saved places and fix the region if it makes a request. 
 
         Returns:
             A tuple containing the coordinates and the region of the location. 
+
+        Raises:
+            GeocodingError: when the geocoder fails because of an error (e.g. a network error). 
         """
         match = None
         if italy_subset:
-            match = self.__find_similar_match(location, italy_places)
+            if not isinstance(italy_places, ItalyGazetteer):
+                if self.places_gazetteer is None or self.places_gazetteer[0] is not italy_places:
+                    self.places_gazetteer = (italy_places, ItalyGazetteer(italy_places))
+                italy_places = self.places_gazetteer[1]
+            match = italy_places.find_similar_match(location)
+        return self.__complete_match(location, match, regions, italy_subset)
+
+
+
+    def __complete_match(self, location, match, regions, italy_subset=False):
+        """
+        Completes the geolocalization of a location: if there is no match among the places in Italy, it uses the geocoder (Nominatim by default). 
+
+        Args:
+            location: address to be geolocalized. 
+            match: coordinates and region found among the places in Italy, or None. 
+            regions: set of regions. 
+            italy_subset: if True, it fixes the region. 
+
+        Returns:
+            A tuple containing the coordinates and the region of the location. 
+        """
         if match is None:
-            match = self.__coords_http_request(location, regions, italy_subset)
+            match = self.geocoder.geocode(location, regions, italy_subset)
         if italy_subset and match is not None:
             match[2] = self.__fix_region(match[2])
         return match
 
 
 
-    def __get_italy_places(self):
+    def __get_italy_context(self):
         """
-        Reads and return a file containing every municipality in Italy, with their province, province code, region, latitude and longitude. 
+        Returns the italian places index, their words and regions, building them only the first time. 
 
         Returns:
-            A Pandas DataFrame with italian places. 
+            A tuple containing the ItalyGazetteer index, the set of places words and the set of regions. 
         """
-        # Unione di:
-        # CITTA'. https://github.com/MatteoHenryChinaski/Comuni-Italiani-2018-Sql-Json-excel/blob/master/italy_cities.xlsx
-        # COORDINATE. https://github.com/MatteoHenryChinaski/Comuni-Italiani-2018-Sql-Json-excel/blob/master/italy_geo.xlsx
-        # PROVINCE. https://gist.githubusercontent.com/LucaRosaldi/3081928/raw/02cd944c1ad4a24f5d6fcdaaf2a6b5889d712d8b/elenco_province_italiane_json_array.json
-        italy_places = pd.read_csv('files/italy_places.csv')
-        for c in ['municipality', 'province_code', 'province' ,'region']:
-            italy_places[c] = italy_places[c].str.lower()
-        return italy_places
+        if self.italy_context is None:
+            gazetteer = get_italy_gazetteer()
+            self.italy_context = (gazetteer, self.__get_italy_places_words(gazetteer.places), self.__get_italy_regions(gazetteer.places))
+        return self.italy_context
 
 
 
@@ -584,82 +1121,3 @@ class TweetsDownloader():
         """
         intersection = set(location.replace(',',' ').split()).intersection(places_words)
         return len(intersection) > 0
-
-
-
-    def __find_similar_match(self, location, italy_places):
-        """
-        Attempts to find a match between a location and the list of places in Italy. 
-
-        Args:
-            location: a string. 
-            italy_places: Pandas DataFrame containing every municipality in Italy, with their province, province code, region, latitude and longitude. 
-
-        Returns:
-            Coordinates and region of the location if there is a match, None otherwise. 
-        """
-        # returns list of coords and region if match is found, else None
-        italy_places = italy_places.copy()
-        loc2 = location
-        for word in ['italy', 'italia', 'europa', 'europe', ' ita ', ' eu ', ',']:
-            loc2 = loc2.replace(word, ' ')
-        loc2 = ' '.join(loc2.split())
-
-        # removes from the string occurrences of regions, provinces or province codes
-        data = {}
-        for level in ['region', 'province', 'province_code']:
-            intersection = set(loc2.split()).intersection(set(italy_places[level]))
-            if len(intersection) == 1:
-                italy_places = italy_places[italy_places[level]==list(intersection)[0]]
-                data[level] = list(intersection)[0]
-                loc2 = loc2.replace(data[level], '')
-            if len(intersection) >= 2:
-                break
-        
-        if len(intersection) <= 1:
-            name = ' '.join(loc2.split()).strip()
-            if name == '' and 'province' in data:
-                name = data['province']
-
-            # search for a match
-            search = process.extractOne(name, italy_places['municipality'], scorer=fuzz.WRatio)
-            if search is not None and search[1] >= 95:
-                tmp = italy_places[italy_places['municipality']==search[0]]
-                return list(tmp[['lat', 'lon', 'region']].iloc[0])
-        
-        return None
-
-
-
-    def __coords_http_request(self, location, regions, italy_subset=False):
-        """
-        Performs a http request to Nominatim (OpenStreetMap open-source geocoder). 
-
-        Args:
-            location: a string. 
-            regions: set of italian regions. 
-            italy_subset: if True, it geolocalizes only italian places. 
-
-        Returns:
-            Coordinates and region of the location, if the request doesn't. 
-        """
-        url = f'https://nominatim.openstreetmap.org/search?q={location}&format=json&accept-language=en'
-        try:
-            result = requests.get(url=url)
-            result_json = result.json()
-            if len(result_json) > 0:
-                lat = float(result_json[0]['lat'])
-                lon = float(result_json[0]['lon'])
-                name = result_json[0]['display_name']
-                country = result_json[0]['display_name'].split(',')[-1].strip()
-                if not italy_subset:
-                    return [lat, lon, country]
-                elif 'Italia' in name:
-                    region = [reg for reg in regions if reg in name.lower()]
-                    if len(region) > 0:
-                        return [lat, lon, region[0]]
-            return None
-        except Exception as e: 
-            print(e)
-            return None
-
@@ -0,0 +1,223 @@
+import re, os
+import numpy as np
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from TweetsUtils import _chunks
+
+
+# largest 32 bits value, the signature of texts without shingles
+MAX_HASH = np.uint32(0xFFFFFFFF)
+
+
+
+class NearDuplicateDetector():
+    """
+    Finds near-duplicate texts (copy-pasted or templated tweets) with MinHash signatures and LSH banding, in time linear in the number of texts.
+
+    Texts are normalized (lowercase, without urls, mentions and punctuation) and split into shingles of shingle_size bytes.
+    Each text gets num_perm MinHash values, whose agreement estimates the Jaccard similarity of the shingles;
+    signatures are split into bands, and texts sharing a whole band become candidates. Candidates whose estimated similarity
+    is at least threshold are linked, and connected texts get the same cluster id (the position of the first one).
+    Signatures are computed with numpy in batches, on a pool of processes.
+    """
+
+    def __init__(self, threshold=0.7, num_perm=128, bands=32, shingle_size=5, seed=0, workers=None, batch_size=2000):
+        """
+        Class initialization.
+
+        Args:
+            threshold: minimum estimated Jaccard similarity of two near-duplicates.
+            num_perm: number of MinHash values of each signature.
+            bands: number of LSH bands; with r = num_perm / bands rows each, pairs with similarity s are candidates
+                   with probability 1 - (1 - s^r)^bands (e.g. 32 bands of 4 rows: 0.9998 for s = 0.7, 0.23 for s = 0.3).
+            shingle_size: number of bytes of each shingle, at most 8.
+            seed: seed of the hash functions; signatures are comparable only with the same seed.
+            workers: number of processes; if None, one for each core.
+            batch_size: number of texts of each batch.
+        """
+        if num_perm % bands != 0:
+            raise Exception('num_perm must be a multiple of bands')
+        if not 1 <= shingle_size <= 8:
+            raise Exception('shingle_size must be between 1 and 8')
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+
+
+
+    def signatures(self, texts):
+        """
+        Computes the MinHash signatures of some texts.
+
+        Args:
+            texts: iterable of strings.
+
+        Returns:
+            A numpy uint32 array with shape (number of texts, num_perm).
+        """
+        batches = _chunks(texts, self.batch_size)
+        compute = partial(_batch_signatures, num_perm=self.num_perm, shingle_size=self.shingle_size, seed=self.seed)
+        if self.workers == 1:
+            results = [compute(batch) for batch in batches]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(compute, batches))
+        if len(results) == 0:
+            return np.zeros((0, self.num_perm), dtype=np.uint32)
+        return np.concatenate(results)
+
+
+
+    def clusters(self, texts=None, signatures=None):
+        """
+        Assigns a cluster id to each text: near-duplicates share the same id, the position of the first text of the cluster.
+
+        Args:
+            texts: iterable of strings.
+            signatures: signatures of the texts, if already computed (texts are ignored).
+
+        Returns:
+            A numpy int64 array of cluster ids.
+        """
+        if signatures is None:
+            signatures = self.signatures(texts)
+        n = len(signatures)
+        rows = self.num_perm // self.bands
+        valid = np.nonzero(signatures[:, 0] != MAX_HASH)[0]
+        multipliers = _random_odd(rows, self.seed + 3)
+
+        heads, members = [], []
+        for band in range(self.bands):
+            block = signatures[valid, band*rows:(band+1)*rows].astype(np.uint64)
+            keys = (block * multipliers).sum(axis=1, dtype=np.uint64)
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+            # every text of a bucket is linked to the first one
+            starts = np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]])
+            bucket_heads = order[np.maximum.accumulate(np.where(starts, np.arange(len(order)), 0))]
+            linked = bucket_heads != order
+            heads.append(valid[bucket_heads[linked]])
+            members.append(valid[order[linked]])
+
+        labels = np.arange(n, dtype=np.int64)
+        if n == 0 or len(heads) == 0:
+            return labels
+        heads, members = np.concatenate(heads), np.concatenate(members)
+        if len(heads) == 0:
+            return labels
+
+        # candidate pairs are kept only if their estimated similarity is high enough
+        keys = np.unique(np.minimum(heads, members).astype(np.int64) * n + np.maximum(heads, members))
+        pairs = np.stack([keys // n, keys % n], axis=1)
+        similar = np.zeros(len(pairs), dtype=bool)
+        for i in range(0, len(pairs), 100000):
+            chunk = pairs[i:i+100000]
+            similar[i:i+100000] = (signatures[chunk[:, 0]] == signatures[chunk[:, 1]]).mean(axis=1) >= self.threshold
+        return _connected_components(labels, pairs[similar, 0], pairs[similar, 1])
+
+
+
+    def assign(self, tweets, field='cluster_id'):
+        """
+        Adds the cluster id to each tweet.
+
+        Args:
+            tweets: list of tweets.
+            field: name of the field.
+
+        Returns:
+            The numpy array of cluster ids.
+        """
+        clusters = self.clusters([tw.get('text', '') for tw in tweets])
+        for tw, cluster in zip(tweets, clusters.tolist()):
+            tw[field] = cluster
+        return clusters
+
+
+
+    def deduplicate(self, tweets):
+        """
+        Keeps only the first tweet of each cluster of near-duplicates.
+
+        Args:
+            tweets: list of tweets.
+
+        Returns:
+            The list of kept tweets, in their original order.
+        """
+        clusters = self.clusters([tw.get('text', '') for tw in tweets])
+        return [tw for i, (tw, cluster) in enumerate(zip(tweets, clusters.tolist())) if cluster == i]
+
+
+
+
+# normalization of the texts before shingling
+def normalize_text(text):
+    text = re.sub(r'https?://\S+|@\w+', ' ', text.lower())
+    text = re.sub(r'[^\w]+', ' ', text)
+    return ' '.join(text.split())
+
+
+
+# MinHash signatures of a batch of texts
+def _batch_signatures(texts, num_perm, shingle_size, seed):
+    k = shingle_size
+    data = [normalize_text(t).encode('utf-8') for t in texts]
+    lengths = np.array([len(d) for d in data], dtype=np.int64)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+
+    # every text with at least a byte has max(length - k + 1, 1) shingles
+    counts = np.where(lengths > 0, np.maximum(lengths - k + 1, 1), 0)
+    total = int(counts.sum())
+    signatures = np.full((len(texts), num_perm), MAX_HASH, dtype=np.uint32)
+    if total == 0:
+        return signatures
+
+    # shingles packed into 64 bits integers, with bytes past the end of their text set to zero
+    buffer = np.frombuffer(b''.join(data) + b'\0' * k, dtype=np.uint8).astype(np.uint64)
+    first = np.cumsum(counts) - counts
+    positions = np.repeat(starts, counts) + (np.arange(total) - np.repeat(first, counts))
+    text_ends = np.repeat(ends, counts)
+    shingles = np.zeros(total, dtype=np.uint64)
+    for j in range(k):
+        inside = (positions + j < text_ends).astype(np.uint64)
+        shingles |= (buffer[positions + j] * inside) << np.uint64(8 * j)
+
+    # shingles hashed to 32 bits, then permuted by num_perm functions p(x) = a * x + b modulo 2^32 (bijections, since a is odd)
+    x = ((shingles * _random_odd(1, seed)[0]) >> np.uint64(32)).astype(np.uint32)
+    a = _random_odd(num_perm, seed + 1).astype(np.uint32)
+    b = _random_odd(num_perm, seed + 2).astype(np.uint32)
+    nonempty = counts > 0
+    step = max(1, min(num_perm, 2**22 // total))
+    # one row for each function, so that the minimum over the shingles of each text runs on contiguous memory
+    hashes = np.empty((step, total), dtype=np.uint32)
+    for i in range(0, num_perm, step):
+        block = hashes[:min(step, num_perm - i)]
+        np.multiply(a[i:i+step, None], x[None, :], out=block)
+        np.add(block, b[i:i+step, None], out=block)
+        signatures[nonempty, i:i+step] = np.minimum.reduceat(block, first[nonempty], axis=1).T
+    return signatures
+
+
+
+# random odd 64 bits integers
+def _random_odd(n, seed):
+    return np.random.default_rng(seed).integers(0, 2**63, size=n, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+
+
+# smallest position of the component of each node, by pointer jumping
+def _connected_components(labels, u, v):
+    while True:
+        previous = labels.copy()
+        np.minimum.at(labels, u, labels[v])
+        np.minimum.at(labels, v, labels[u])
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            return labels
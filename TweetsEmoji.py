@@ -0,0 +1,188 @@
+import os, re, pickle
+import pandas as pd
+from functools import lru_cache
+
+from TweetsUtils import _trie_pattern
+
+
+# variation selector (emoji presentation) and skin tone modifiers, ignored after an emoji
+MODIFIERS = '\ufe0f\U0001F3FB-\U0001F3FF'
+
+
+
+class EmojiNormalizer():
+    """
+    Replaces the emoji of a text with tokens, using the code table in files/codici_emoji.xlsx (Italian names, or English ones if missing).
+
+    Every sequence of the table (single code points, flags, ZWJ sequences), with and without variation selectors, is compiled into
+    a trie regex, so that each text is scanned once and the longest sequence wins (e.g. a family is a single emoji, not four persons);
+    skin tones and variation selectors following an emoji are dropped. Texts without emoji (most of them) are detected with
+    a character class of a few ranges and returned as they are, so normalization is almost free on them.
+    The table is parsed from the Excel file only once, and cached in a pickle file next to it.
+    """
+
+    def __init__(self, filename='files/codici_emoji.xlsx', replacement=' {token} ', language='italian'):
+        """
+        Class initialization.
+
+        Args:
+            filename: Excel file of the emoji codes, with the columns "Code", "English" and "Italian".
+            replacement: format string of the replacement of each emoji, with the fields "name" (e.g. "sorriso sollevato"),
+                         "token" (e.g. "sorriso_sollevato", "flag_italy"), "english" and "code"; e.g. " " removes the emoji.
+            language: language of the names, either "italian" (English if missing) or "english".
+        """
+        self.filename = filename
+        self.replacement = replacement
+        self.table = self.__load_table()
+
+        self.names = {}
+        self.replacements = {}
+        for sequence, italian, english, code in self.table:
+            name = italian if language == 'italian' and italian else english
+            for variant in [sequence, sequence.replace('\ufe0f', '')]:
+                if len(variant) > 0 and variant not in self.names:
+                    self.names[variant] = name
+                    self.replacements[variant] = replacement.format(name=name, token=re.sub(r'\W+', '_', name.lower()).strip('_'), english=english, code=code)
+
+        # the first characters of the emoji (keycaps start with an ascii character, and contain U+20E3) guard the trie,
+        # and a coarser class of a few ranges tells quickly whether a text contains emoji at all
+        first = sorted({ord(s[0]) for s in self.names if not s[0].isascii()} | {0x20E3})
+        exact = '[' + ''.join(_range(a, b) for a, b in _ranges(first, 1)) + ']|[#*0-9]\ufe0f?\u20e3'
+        self.prefilter = re.compile('[' + ''.join(_range(a, b) for a, b in _ranges(first, 512)) + ']')
+        self.regex = re.compile('(?=' + exact + ')(' + _trie_pattern(sorted(self.names)) + ')[' + MODIFIERS + ']*')
+
+
+
+    def normalize(self, text):
+        """
+        Replaces the emoji of a text.
+
+        Args:
+            text: a string.
+
+        Returns:
+            The normalized text.
+        """
+        if text.isascii() or not self.prefilter.search(text):
+            return text
+        return self.regex.sub(lambda m: self.replacements[m.group(1)], text)
+
+
+
+    def normalize_many(self, texts):
+        """
+        Replaces the emoji of some texts.
+
+        Args:
+            texts: iterable of strings.
+
+        Returns:
+            The list of normalized texts.
+        """
+        sub, search, replacements = self.regex.sub, self.prefilter.search, self.replacements
+        replace = lambda m: replacements[m.group(1)]
+        return [t if t.isascii() or not search(t) else sub(replace, t) for t in texts]
+
+
+
+    def normalize_tweets(self, tweets, field='text', destination=None):
+        """
+        Replaces the emoji of the texts of some tweets.
+
+        Args:
+            tweets: iterable of tweets.
+            field: field containing the text.
+            destination: field of the normalized text; if None, the text itself is replaced.
+
+        Returns:
+            A generator of the same tweets, normalized.
+        """
+        destination = destination or field
+        for tw in tweets:
+            if type(tw.get(field)) == str:
+                tw[destination] = self.normalize(tw[field])
+            yield tw
+
+
+
+    def extract(self, text):
+        """
+        Finds the emoji of a text.
+
+        Args:
+            text: a string.
+
+        Returns:
+            The list of the names of its emoji, in order of appearance (repeated emoji are repeated).
+        """
+        if text.isascii() or not self.prefilter.search(text):
+            return []
+        return [self.names[m.group(1)] for m in self.regex.finditer(text)]
+
+
+
+    def __load_table(self):
+        """
+        Reads the emoji table from the cache, or parses the Excel file and caches it if the cache is missing or older.
+
+        Returns:
+            A list of (sequence, Italian name, English name, code) tuples.
+        """
+        cache_filename = os.path.splitext(self.filename)[0] + '.pkl'
+        if os.path.exists(cache_filename) and os.path.getmtime(cache_filename) >= os.path.getmtime(self.filename):
+            with open(cache_filename, 'rb') as f:
+                return pickle.load(f)
+
+        df = pd.read_excel(self.filename, dtype=str)
+        table = []
+        for code, english, italian in zip(df['Code'], df['English'], df['Italian']):
+            if type(code) != str:
+                continue
+            sequence = ''.join(chr(int(c[2:], 16)) for c in code.split())
+            # a few English names are marked as new emoji
+            english = english.replace('⊛', '').strip() if type(english) == str else ''
+            italian = italian.strip() if type(italian) == str else ''
+            table.append((sequence, italian, english, code))
+
+        with open(cache_filename, 'wb') as f:
+            pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return table
+
+
+
+
+@lru_cache(maxsize=None)
+def get_emoji_normalizer(filename='files/codici_emoji.xlsx', replacement=' {token} ', language='italian'):
+    """
+    Builds the emoji normalizer, only the first time it's called with the same arguments.
+
+    Returns:
+        An EmojiNormalizer object.
+    """
+    return EmojiNormalizer(filename, replacement, language)
+
+
+
+def normalize_emoji(text):
+    """
+    Replaces the emoji of a text with the tokens of their Italian names, e.g. "che bello 😀" -> "che bello  sorriso ".
+    """
+    return get_emoji_normalizer().normalize(text)
+
+
+
+# ranges of sorted code points, merging the ones closer than gap
+def _ranges(codes, gap):
+    ranges = [[codes[0], codes[0]]]
+    for c in codes[1:]:
+        if c - ranges[-1][1] <= gap:
+            ranges[-1][1] = c
+        else:
+            ranges.append([c, c])
+    return ranges
+
+
+
+# character class item of a range of code points
+def _range(a, b):
+    return re.escape(chr(a)) if a == b else re.escape(chr(a)) + '-' + re.escape(chr(b))
@@ -0,0 +1,222 @@
+import re
+import pandas as pd
+
+from TweetsUtils import iter_file, FileWriter, _chunks, _map_texts, _trie_pattern
+
+
+# entity types, with the codes of the stanza NER used by the notebooks
+TYPES = {'LOC': 'Luogo', 'ORG': 'Organizzazione', 'PER': 'Persona'}
+
+# english (and other) names of italian places, mapped to their canonical name
+PLACE_ALIASES = {
+    'italy': 'Italia', 'italia': 'Italia', 'milan': 'Milano', 'rome': 'Roma', 'florence': 'Firenze', 'venice': 'Venezia',
+    'naples': 'Napoli', 'turin': 'Torino', 'genoa': 'Genova', 'padua': 'Padova', 'mantua': 'Mantova', 'sicily': 'Sicilia',
+    'sardinia': 'Sardegna', 'lombardy': 'Lombardia', 'piedmont': 'Piemonte', 'tuscany': 'Toscana', 'apulia': 'Puglia'
+}
+
+# municipalities whose name is mostly used as a common word (or a surname) in italian tweets, never tagged as places
+AMBIGUOUS_PLACES = [
+    'alba', 'alto', 'amaro', 'amato', 'anzi', 'bella', 'bianco', 'bomba', 'bruno', 'calci', 'calcio', 'cambiano', 'campagna',
+    'candida', 'canale', 'capaci', 'carceri', 'cattolica', 'cento', 'chiusa', 'chiusi', 'colonna', 'cori', 'dello', 'erba',
+    'fallo', 'fascia', 'fermo', 'fondi', 'fondo', 'fonte', 'grado', 'grosso', 'lana', 'lei', 'lenta', 'lettere', 'liberi',
+    'massa', 'mattinata', 'medicina', 'mele', 'mese', 'meta', 'mira', 'monti', 'mossa', 'naso', 'nave', 'nomi', 'norma', 'noto',
+    'onore', 'opera', 'ora', 'paese', 'paola', 'parenti', 'pero', 'piatto', 'piscina', 'ponte', 'ponti', 'porte', 'potenza',
+    'premia', 'quarto', 'rende', 'rotonda', 'rubano', 'sacco', 'sale', 'salve', 'scala', 'scena', 'siano', 'sostegno', 'stella',
+    'stra', 'terzo', 'tornata', 'torno', 'troia', 'trovo', 'ultimo', 'vita', 'vittoria'
+]
+
+URLS_REGEX = re.compile(r'https?://\S+|www\.\S+')
+
+
+
+class EntityTagger():
+    """
+    Dictionary-based tagger of places (Luogo), organizations (Organizzazione) and persons (Persona), a fast and reproducible
+    replacement of the stanza NER of colab_entities.ipynb.
+
+    Every surface form of the gazetteers (the municipalities, provinces and regions of files/italy_places.csv, their aliases,
+    and the given places, organizations and persons) is compiled into a single trie regex, matched once over each lowercased text,
+    leftmost-longest and on whole words; each surface form is mapped to the canonical entity it refers to, so that e.g. "Via Tortona"
+    and "#tortona" both give the entity "Tortona", without cleaning the entities afterwards.
+    Multi-word names also match as hashtags without spaces (e.g. "#lacittadina"). Names from italy_places.csv are tagged only
+    when capitalized or used as hashtags, and never if they are common words (exclude), since many municipalities are named after one.
+    Files are tagged on a pool of processes.
+    """
+
+    def __init__(self, places=None, organizations=None, persons=None, places_filename='files/italy_places.csv',
+                 aliases=PLACE_ALIASES, exclude=AMBIGUOUS_PLACES, min_length=3):
+        """
+        Class initialization.
+
+        Args:
+            places: additional places, either a list of names or a dictionary from canonical names to lists of surface forms.
+            organizations: organizations, either a list of names or a dictionary from canonical names to lists of surface forms.
+            persons: persons, either a list of names or a dictionary from canonical names to lists of surface forms.
+            places_filename: file of the italian municipalities, provinces and regions; if None, only the given gazetteers are used.
+            aliases: dictionary from surface forms to canonical names of places.
+            exclude: names from places_filename never tagged.
+            min_length: minimum length of the names from places_filename.
+        """
+        # canonical id -> (name, type); lowercased surface form -> (canonical id, checked), where checked forms must be capitalized
+        self.entities = {}
+        self.surfaces = {}
+        self.hashtags = {}
+
+        # user gazetteers first, since they are more specific
+        for names, code in [(persons, 'PER'), (organizations, 'ORG'), (places, 'LOC')]:
+            for name, forms in _gazetteer(names).items():
+                self.__add(name, code, [name] + list(forms), checked=False)
+        for surface, name in (aliases or {}).items():
+            self.__add(name, 'LOC', [surface], checked=False)
+
+        if places_filename is not None:
+            exclude = set(exclude)
+            df = pd.read_csv(places_filename)
+            # municipalities first, since their names are better capitalized (e.g. "La Spezia" and the province "La spezia")
+            for col in ['municipality', 'province', 'region']:
+                for name in df[col].dropna().unique():
+                    if len(name) >= min_length and name.lower() not in exclude:
+                        self.__add(name, 'LOC', [name], checked=True)
+
+        self.regex = re.compile(r'(?<![\w@])(' + _trie_pattern(sorted(set(self.surfaces) | set(self.hashtags))) + r')(?!\w)')
+
+
+
+    def tag(self, text):
+        """
+        Finds the entities of a text.
+
+        Args:
+            text: a string.
+
+        Returns:
+            A list of distinct entities, in order of appearance, as dictionaries with "id", "text" (the canonical name) and "type".
+        """
+        if type(text) != str or len(text) == 0:
+            return []
+        text = URLS_REGEX.sub(lambda m: ' ' * len(m.group()), text)
+        lower = text.lower().replace('’', "'")
+        # a few characters change length when lowercased: spans can't be used to check capitalization
+        aligned = len(lower) == len(text)
+
+        found = {}
+        for m in self.regex.finditer(lower):
+            surface = m.group(1)
+            hashtag = m.start() > 0 and lower[m.start() - 1] == '#'
+            entry = self.hashtags.get(surface) if hashtag else None
+            if entry is None:
+                entry = self.surfaces.get(surface)
+            if entry is None:
+                continue
+            _id, checked = entry
+            if checked and not hashtag and aligned and not text[m.start()].isupper():
+                continue
+            if _id not in found:
+                name, code = self.entities[_id]
+                found[_id] = {'id': _id, 'text': name, 'type': TYPES[code]}
+        return list(found.values())
+
+
+
+    def tag_many(self, texts):
+        """
+        Finds the entities of some texts, once for each distinct text.
+
+        Args:
+            texts: list of strings.
+
+        Returns:
+            A list with the entities of each text.
+        """
+        cache = {}
+        return [cache[t] if t in cache else cache.setdefault(t, self.tag(t)) for t in texts]
+
+
+
+    def annotate(self, tweets, workers=None, batch_size=5000):
+        """
+        Adds the field "entities" to some tweets.
+
+        Args:
+            tweets: iterable of tweets.
+            workers: number of processes; if None, one for each core.
+            batch_size: number of tweets of each batch.
+
+        Returns:
+            A generator of the same tweets, with the new field, in the same order.
+        """
+        for batch, entities in _map_texts(_batch_entities, self, _chunks(tweets, batch_size), _texts, workers):
+            for tw, e in zip(batch, entities):
+                # repeated texts share their entities in the batch
+                tw['entities'] = [dict(x) for x in e]
+                yield tw
+
+
+
+    def annotate_file(self, filename, destination, _type='jsonl', workers=None, batch_size=5000):
+        """
+        Tags a merged tweets file into another file, streaming over it.
+
+        Args:
+            filename: merged tweets file.
+            destination: name of the destination file.
+            _type: format of the destination file, either "jsonl", "json" or "parquet".
+            workers: number of processes; if None, one for each core.
+            batch_size: number of tweets of each batch.
+
+        Returns:
+            The number of tagged tweets.
+        """
+        writer = FileWriter(destination, _type)
+        n = 0
+        for tw in self.annotate(iter_file(filename), workers, batch_size):
+            writer.write(tw)
+            n += 1
+        writer.close()
+        return n
+
+
+
+    def __add(self, name, code, forms, checked):
+        """
+        Adds an entity and its surface forms; forms already known keep their previous entity.
+
+        Args:
+            name: canonical name.
+            code: entity type code, "LOC", "ORG" or "PER".
+            forms: surface forms.
+            checked: if True, the forms must be capitalized (or hashtags) to be tagged.
+        """
+        _id = code + ':' + ' '.join(name.lower().replace('’', "'").split())
+        self.entities.setdefault(_id, (name, code))
+        for form in forms:
+            form = ' '.join(form.lower().replace('’', "'").split())
+            if len(form) == 0:
+                continue
+            self.surfaces.setdefault(form, (_id, checked))
+            compact = re.sub(r'\W+', '', form)
+            if compact != form and len(compact) > 0:
+                self.hashtags.setdefault(compact, (_id, False))
+
+
+
+
+# dictionary from canonical names to surface forms of a gazetteer given as a list or a dictionary
+def _gazetteer(names):
+    if names is None:
+        return {}
+    if isinstance(names, dict):
+        return {name: ([forms] if type(forms) == str else list(forms)) for name, forms in names.items()}
+    return {name: [] for name in names}
+
+
+
+# entities of a batch of texts
+def _batch_entities(tagger, texts):
+    return tagger.tag_many(texts)
+
+
+
+# texts of a batch of tweets
+def _texts(batch):
+    return [tw.get('text', '') for tw in batch]
@@ -0,0 +1,233 @@
+import numpy as np
+from array import array
+
+from TweetsUtils import get_mentions, get_keyword_matcher, iter_file, FileWriter
+from TweetsStore import Vocabulary
+
+
+# hashtags and outliers of the flu analysis (analysis_segnali_deboli.ipynb)
+FLU_ALLOWED_HASHTAGS = ['influenza', 'salute', 'lunedì', 'primavera', 'malditesta', 'emicrania', 'benemanonbenissimo']
+FLU_ALLOWED_HASHTAGS_SUBSTRINGS = ['buon', 'febbre', 'vaccin', 'virus', 'covid', 'corona']
+FLU_OUTLIERS = ['alessiamorani', 'alessia morani', 'morani', 'temptationisland', 'benji_mascolo',
+                'higuain', 'milan', 'arisa', 'sanremo', 'claudio', 'clario', 'gf16']
+
+# rules, in the order they are applied
+RULES = ['keywords', 'super_tweeters', 'popular_mentions', 'popular_hashtags', 'outliers']
+
+
+
+class SpamFilter():
+    """
+    Noise filter of the weak-signals analysis, in two passes over the tweets instead of one pass for each rule.
+    The rules are applied in order, each one on the tweets kept by the previous ones:
+     - keywords: tweets without any keyword (in the lowercased text) are removed
+     - super_tweeters: tweets of authors with at least max_author_tweets tweets
+     - popular_mentions: tweets mentioning someone mentioned more than max_mentions times
+     - popular_hashtags: tweets containing (in the text) a hashtag used more than max_hashtags times, except the allowed ones
+     - outliers: tweets containing (in the lowercased text) an outlier term
+
+    The first pass (fit) keeps only authors, mentions and hashtags of the tweets with keywords, as integer codes;
+    the frequencies of each rule are then computed from them with numpy, on the tweets kept by the previous rules,
+    so changing the thresholds doesn't require reading the tweets again. The second pass (filter) applies every rule to each tweet at once.
+    Every call of fit starts from scratch, so the same filter can be applied to different tweets (or to the same ones again).
+
+    Differences from the notebook chain: mentions are lowercased on both sides (the notebook compared the raw mentions with
+    a lowercased set), and every hashtag of a tweet is counted, lowercased (the notebook counted only the first character
+    of the first hashtag of each tweet), so the popular hashtags, and the tweets they remove, can differ.
+    """
+
+    def __init__(self, keywords=None, max_author_tweets=50, max_mentions=50, max_hashtags=100,
+                 allowed_hashtags=(), allowed_hashtags_substrings=(), outliers=()):
+        """
+        Class initialization.
+
+        Args:
+            keywords: list of keywords; if None, the keywords rule is skipped.
+            max_author_tweets: authors with at least this number of tweets are removed.
+            max_mentions: mentions used more than this number of times are removed.
+            max_hashtags: hashtags used more than this number of times are removed.
+            allowed_hashtags: hashtags never removed (the keywords are allowed too).
+            allowed_hashtags_substrings: hashtags containing one of these substrings are never removed.
+            outliers: terms whose tweets are removed.
+        """
+        self.keywords = keywords
+        self.max_author_tweets = max_author_tweets
+        self.max_mentions = max_mentions
+        self.max_hashtags = max_hashtags
+        self.allowed_hashtags = set(allowed_hashtags) | set(keywords or [])
+        self.allowed_hashtags_substrings = list(allowed_hashtags_substrings)
+        self.outliers = list(outliers)
+        self.keywords_matcher = get_keyword_matcher(keywords, lowercase=True) if keywords is not None else None
+        self.outliers_matcher = get_keyword_matcher(self.outliers, lowercase=True)
+        self.report = {}
+        self.__reset()
+
+
+
+    def fit(self, tweets):
+        """
+        First pass: collects authors, mentions and hashtags of the tweets with keywords.
+
+        Args:
+            tweets: iterable of tweets (e.g. iter_file of the merged file).
+
+        Returns:
+            The filter itself.
+        """
+        self.__reset()
+        for tw in tweets:
+            if not self.__has_keywords(tw):
+                continue
+            self.tweets_authors.append(self.authors.encode(tw.get('author_id')))
+            self.tweets_mentions.extend(self.mentions.encode(m.lower()) for m in get_mentions(tw['text']))
+            self.mentions_offsets.append(len(self.tweets_mentions))
+            self.tweets_hashtags.extend(self.hashtags.encode(h.lower()) for h in tw.get('hashtags', []))
+            self.hashtags_offsets.append(len(self.tweets_hashtags))
+        return self
+
+
+
+    def statistics(self):
+        """
+        Computes the authors, mentions and hashtags removed with the current thresholds.
+
+        Returns:
+            A dictionary with the sets "super_tweeters" and "popular_mentions", and the KeywordMatcher of the "popular_hashtags".
+        """
+        n = len(self.tweets_authors)
+        authors = np.frombuffer(self.tweets_authors, dtype=np.int32) if n > 0 else np.zeros(0, dtype=np.int32)
+        mentions, mentions_tweets = _flat_codes(self.tweets_mentions, self.mentions_offsets)
+        hashtags, hashtags_tweets = _flat_codes(self.tweets_hashtags, self.hashtags_offsets)
+
+        # super tweeters
+        super_authors = np.bincount(authors, minlength=len(self.authors.values)) >= self.max_author_tweets
+        kept = ~super_authors[authors]
+
+        # popular mentions, among the tweets of the other authors
+        counts = np.bincount(mentions[kept[mentions_tweets]], minlength=len(self.mentions.values))
+        popular_mentions = counts > self.max_mentions
+        mentioning = np.zeros(n, dtype=bool)
+        mentioning[mentions_tweets[popular_mentions[mentions]]] = True
+        kept &= ~mentioning
+
+        # popular hashtags, among the remaining tweets
+        counts = np.bincount(hashtags[kept[hashtags_tweets]], minlength=len(self.hashtags.values))
+        popular_hashtags = [h for h, c in zip(self.hashtags.values, counts) if c > self.max_hashtags and self.__is_removable(h)]
+
+        return {
+            'super_tweeters': {a for a, s in zip(self.authors.values, super_authors) if s},
+            'popular_mentions': {m for m, p in zip(self.mentions.values, popular_mentions) if p},
+            'popular_hashtags': get_keyword_matcher(popular_hashtags, lowercase=True)
+        }
+
+
+
+    def filter(self, tweets):
+        """
+        Second pass: applies every rule to each tweet, counting the tweets removed by each rule in the report attribute.
+
+        Args:
+            tweets: iterable of tweets, the same given to fit (they can be read again from the files).
+
+        Returns:
+            A generator of the kept tweets.
+        """
+        stats = self.statistics()
+        self.report = {rule: 0 for rule in RULES}
+        self.report['kept'] = 0
+        for tw in tweets:
+            rule = self.__removed_by(tw, stats)
+            if rule is None:
+                self.report['kept'] += 1
+                yield tw
+            else:
+                self.report[rule] += 1
+
+
+
+    def apply(self, tweets):
+        """
+        Fits the filter on a list of tweets and filters them.
+
+        Args:
+            tweets: list of tweets.
+
+        Returns:
+            The list of kept tweets.
+        """
+        self.fit(tweets)
+        return list(self.filter(tweets))
+
+
+
+    def filter_file(self, filename, destination, _type='jsonl'):
+        """
+        Filters a merged tweets file into another file, streaming over it twice without keeping the tweets in memory.
+
+        Args:
+            filename: merged tweets file.
+            destination: name of the destination file.
+            _type: format of the destination file, either "jsonl", "json" or "parquet".
+
+        Returns:
+            The report, with the number of tweets removed by each rule.
+        """
+        self.fit(iter_file(filename))
+        writer = FileWriter(destination, _type)
+        for tw in self.filter(iter_file(filename)):
+            writer.write(tw)
+        writer.close()
+        return self.report
+
+
+
+    def __reset(self):
+        """
+        Forgets the authors, mentions and hashtags collected by a previous fit.
+        """
+        self.authors = Vocabulary()
+        self.mentions = Vocabulary()
+        self.hashtags = Vocabulary()
+        self.tweets_authors = array('i')
+        self.tweets_mentions = array('i')
+        self.mentions_offsets = array('q', [0])
+        self.tweets_hashtags = array('i')
+        self.hashtags_offsets = array('q', [0])
+
+
+
+    def __removed_by(self, tweet, stats):
+        """
+        Returns the first rule removing a tweet, or None if the tweet is kept.
+        """
+        if not self.__has_keywords(tweet):
+            return 'keywords'
+        if tweet.get('author_id') in stats['super_tweeters']:
+            return 'super_tweeters'
+        if any(m.lower() in stats['popular_mentions'] for m in get_mentions(tweet['text'])):
+            return 'popular_mentions'
+        if stats['popular_hashtags'].has_any(tweet['text']):
+            return 'popular_hashtags'
+        if self.outliers_matcher.has_any(tweet['text']):
+            return 'outliers'
+        return None
+
+
+
+    def __has_keywords(self, tweet):
+        return self.keywords_matcher is None or self.keywords_matcher.has_any(tweet['text'])
+
+
+
+    def __is_removable(self, hashtag):
+        return hashtag not in self.allowed_hashtags and not any(s in hashtag for s in self.allowed_hashtags_substrings)
+
+
+
+
+# codes of a flattened list of lists, and the position of the list each code belongs to
+def _flat_codes(codes, offsets):
+    codes = np.frombuffer(codes, dtype=np.int32) if len(codes) > 0 else np.zeros(0, dtype=np.int32)
+    offsets = np.frombuffer(offsets, dtype=np.int64)
+    positions = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    return codes, positions
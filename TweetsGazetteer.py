@@ -0,0 +1,313 @@
+import inspect, os
+import pandas as pd
+import numpy as np
+from functools import lru_cache
+from rapidfuzz import process, fuzz
+
+
+# the same processor used by process.extractOne (it changed across rapidfuzz versions)
+EXTRACT_PROCESSOR = inspect.signature(process.extractOne).parameters['processor'].default
+
+# levels used to narrow down the municipalities, in order
+LEVELS = ['region', 'province', 'province_code']
+
+
+
+class ItalyGazetteer():
+    """
+    Immutable index of the municipalities in Italy, built once from files/italy_places.csv.
+
+    It holds hash maps from region, province and province code to the positions of their municipalities,
+    a trigram (and token) index of the municipality names to find fuzzy-matching candidates,
+    and numpy arrays with coordinates and regions.
+    Lookups give the same matches as process.extractOne with WRatio >= 95 over the whole municipalities DataFrame:
+    a WRatio of at least 95 is only possible between names sharing a trigram or a token, so the other names can be skipped.
+    """
+
+
+    def __init__(self, italy_places):
+        """
+        Class initialization.
+
+        Args:
+            italy_places: Pandas DataFrame containing every municipality in Italy, with lowercased municipality, province_code, province and region.
+        """
+        self.places = italy_places.reset_index(drop=True)
+        self.municipalities = self.places['municipality'].to_numpy(dtype=object)
+        self.lat = self.places['lat'].to_numpy(dtype=np.float64)
+        self.lon = self.places['lon'].to_numpy(dtype=np.float64)
+        self.columns = {level: self.places[level].to_numpy(dtype=object) for level in LEVELS}
+
+        # level value -> sorted positions of its municipalities
+        self.level_index = {}
+        for level in LEVELS:
+            positions = {}
+            for i, value in enumerate(self.columns[level]):
+                positions.setdefault(value, []).append(i)
+            self.level_index[level] = {k: np.array(v, dtype=np.int32) for k, v in positions.items()}
+
+        # trigram / token -> sorted positions of the municipalities containing it
+        grams = {}
+        for i, name in enumerate(self.municipalities):
+            if type(name) != str:
+                continue
+            for gram in _grams(_process(name)):
+                grams.setdefault(gram, []).append(i)
+        self.grams_index = {k: np.array(v, dtype=np.int32) for k, v in grams.items()}
+
+        # municipality name -> sorted positions
+        names = {}
+        for i, name in enumerate(self.municipalities):
+            names.setdefault(name, []).append(i)
+        self.names_index = {k: np.array(v, dtype=np.int32) for k, v in names.items()}
+
+        for a in [self.municipalities, self.lat, self.lon, *self.columns.values()]:
+            a.setflags(write=False)
+
+
+
+    def find_similar_match(self, location):
+        """
+        Attempts to find a match between a location and the municipalities in Italy.
+        Regions, provinces and province codes inside the location narrow down the municipalities to search.
+
+        Args:
+            location: a normalized string.
+
+        Returns:
+            Coordinates and region of the location if there is a match, None otherwise.
+        """
+        name, rows = self.__narrow_down(location)
+        if name is None:
+            return None
+        return self.__to_match(self.__best_match(name, rows))
+
+
+
+    def find_similar_matches(self, locations, workers=-1, chunk_size=32):
+        """
+        Attempts to find a match for many locations at once. 
+        With more than one worker, locations without regions, provinces or province codes are scored in bulk with rapidfuzz cdist 
+        running on multiple threads, against the union of the candidates of each chunk; the others are matched one at a time. 
+        With a single worker, every location is matched one at a time, since on a single core the trigram candidates of 
+        find_similar_match are scored faster than the union of the candidates of a chunk. 
+        The matches are the same as find_similar_match. 
+
+        Args:
+            locations: iterable of normalized strings.
+            workers: number of threads used by cdist; -1 uses every core.
+            chunk_size: number of locations scored together; small chunks have fewer candidates in common.
+
+        Returns:
+            A dictionary from each location to its coordinates and region, or None if there is no match.
+        """
+        if workers == -1:
+            workers = os.cpu_count() or 1
+        if workers <= 1:
+            return {location: self.find_similar_match(location) for location in set(locations)}
+
+        matches = {}
+        bulk = {}
+        for location in set(locations):
+            name, rows = self.__narrow_down(location)
+            if name is None:
+                matches[location] = None
+            elif rows is None:
+                bulk[location] = name
+            else:
+                matches[location] = self.__to_match(self.__best_match(name, rows))
+
+        # similar names share candidates
+        bulk = sorted(bulk.items(), key=lambda x: x[1])
+        for i in range(0, len(bulk), chunk_size):
+            chunk = bulk[i:i+chunk_size]
+            candidates = np.unique(np.concatenate([self.candidates(name) for _, name in chunk]))
+            if len(candidates) == 0:
+                matches.update({location: None for location, _ in chunk})
+                continue
+
+            scores = process.cdist([name for _, name in chunk], list(self.municipalities[candidates]), scorer=fuzz.WRatio, 
+                                   processor=EXTRACT_PROCESSOR, score_cutoff=95, workers=workers)
+            # candidates are sorted, so argmax returns the first municipality with the best score, as extractOne
+            best = np.argmax(scores, axis=1)
+            for (location, _), column, score in zip(chunk, best, scores[np.arange(len(chunk)), best]):
+                matches[location] = self.__to_match(int(candidates[column])) if score >= 95 else None
+
+        return matches
+
+
+
+    def __narrow_down(self, location):
+        """
+        Removes from a location the occurrences of regions, provinces and province codes, narrowing down the municipalities to search. 
+
+        Args:
+            location: a normalized string.
+
+        Returns:
+            A tuple with the name to search and the sorted positions of the municipalities to search (None for every municipality); 
+            the name is None if the location contains more than one region, province or province code. 
+        """
+        loc2 = location
+        for word in ['italy', 'italia', 'europa', 'europe', ' ita ', ' eu ', ',']:
+            loc2 = loc2.replace(word, ' ')
+        loc2 = ' '.join(loc2.split())
+
+        # removes from the string occurrences of regions, provinces or province codes
+        rows = None
+        data = {}
+        for level in LEVELS:
+            intersection = set(loc2.split()).intersection(self.__level_values(level, rows))
+            if len(intersection) == 1:
+                value = list(intersection)[0]
+                positions = self.level_index[level][value]
+                rows = positions if rows is None else np.intersect1d(rows, positions, assume_unique=True)
+                data[level] = value
+                loc2 = loc2.replace(value, '')
+            if len(intersection) >= 2:
+                return None, None
+
+        name = ' '.join(loc2.split()).strip()
+        if name == '' and 'province' in data:
+            name = data['province']
+        return name, rows
+
+
+
+    def __to_match(self, position):
+        """
+        Returns coordinates and region of a municipality. 
+
+        Args:
+            position: position of the municipality, or None. 
+
+        Returns:
+            A list with latitude, longitude and region, or None. 
+        """
+        if position is None:
+            return None
+        return [float(self.lat[position]), float(self.lon[position]), self.columns['region'][position]]
+
+
+
+    def candidates(self, name):
+        """
+        Returns the municipalities that can have a WRatio >= 95 with a name, i.e. the ones sharing a trigram or a token with it.
+
+        Args:
+            name: a string.
+
+        Returns:
+            A sorted numpy array of positions.
+        """
+        arrays = [self.grams_index[g] for g in _grams(_process(name)) if g in self.grams_index]
+        if len(arrays) == 0:
+            return np.array([], dtype=np.int32)
+        return np.unique(np.concatenate(arrays))
+
+
+
+    def __best_match(self, name, rows):
+        """
+        Searches the municipality most similar to a name, among some rows.
+
+        Args:
+            name: a string.
+            rows: sorted positions of the municipalities to search; if None, every municipality is searched.
+
+        Returns:
+            The position of the first municipality with the best name (if its score is at least 95), None otherwise.
+        """
+        # only an identical name scores 100
+        if EXTRACT_PROCESSOR is None and name in self.names_index:
+            same_name = self.names_index[name]
+            if rows is not None:
+                same_name = np.intersect1d(same_name, rows, assume_unique=True)
+            if len(same_name) > 0:
+                return int(same_name[0])
+
+        candidates = self.candidates(name)
+        if rows is not None:
+            candidates = np.intersect1d(candidates, rows, assume_unique=True)
+        if len(candidates) == 0:
+            return None
+
+        search = process.extractOne(name, list(self.municipalities[candidates]), scorer=fuzz.WRatio)
+        if search is None or search[1] < 95:
+            return None
+
+        # first row with the same municipality name
+        same_name = candidates[self.municipalities[candidates] == search[0]]
+        return int(same_name[0])
+
+
+
+    def __level_values(self, level, rows):
+        """
+        Returns the set of values of a level among some rows.
+
+        Args:
+            level: "region", "province" or "province_code".
+            rows: sorted positions of the municipalities; if None, every municipality is considered.
+
+        Returns:
+            A set of values.
+        """
+        if rows is None:
+            return self.level_index[level].keys()
+        return set(self.columns[level][rows])
+
+
+
+
+def _process(name):
+    """
+    Applies the extractOne processor, if any, to a name.
+
+    Args:
+        name: a string.
+
+    Returns:
+        The processed string.
+    """
+    return EXTRACT_PROCESSOR(name) if EXTRACT_PROCESSOR is not None else name
+
+
+
+def _grams(name):
+    """
+    Returns the trigrams and the tokens of a name (or the name itself, if it's too short to have trigrams).
+
+    Args:
+        name: a string.
+
+    Returns:
+        A set of strings.
+    """
+    grams = {name[i:i+3] for i in range(len(name) - 2)}
+    grams.update('#' + token for token in name.split())
+    if len(name) < 3:
+        grams.add(name)
+    return grams
+
+
+
+@lru_cache(maxsize=None)
+def get_italy_gazetteer(filename='files/italy_places.csv'):
+    """
+    Reads the italian places file and builds its index, only the first time it's called.
+
+    Args:
+        filename: file containing every municipality in Italy, with their province, province code, region, latitude and longitude.
+
+    Returns:
+        An ItalyGazetteer object.
+    """
+    # Unione di:
+    # CITTA'. https://github.com/MatteoHenryChinaski/Comuni-Italiani-2018-Sql-Json-excel/blob/master/italy_cities.xlsx
+    # COORDINATE. https://github.com/MatteoHenryChinaski/Comuni-Italiani-2018-Sql-Json-excel/blob/master/italy_geo.xlsx
+    # PROVINCE. https://gist.githubusercontent.com/LucaRosaldi/3081928/raw/02cd944c1ad4a24f5d6fcdaaf2a6b5889d712d8b/elenco_province_italiane_json_array.json
+    italy_places = pd.read_csv(filename)
+    for c in ['municipality', 'province_code', 'province' ,'region']:
+        italy_places[c] = italy_places[c].str.lower()
+    return ItalyGazetteer(italy_places)
@@ -0,0 +1,246 @@
+import os, re, csv, pickle, requests
+import numpy as np
+from abc import ABC, abstractmethod
+
+from TweetsNetwork import RateLimiter, create_session
+
+
+
+class GeocodingError(Exception):
+    """
+    Raised when a location can't be geocoded because of an error (e.g. a network error or a server error), 
+    as opposed to a location without results; the location should be attempted again later.
+    """
+
+
+
+
+class Geocoder(ABC):
+    """
+    Interface of the geocoders used by TweetsDownloader.geolocalize, for locations that don't match a municipality in Italy.
+    Subclasses must implement geocode.
+    """
+
+
+    @abstractmethod
+    def geocode(self, location, regions, italy_subset=False):
+        """
+        Geocodes a location.
+
+        Args:
+            location: a normalized string.
+            regions: set of italian regions.
+            italy_subset: if True, it geolocalizes only italian places.
+
+        Returns:
+            A list with latitude, longitude and country (or italian region, if italy_subset is True), or None if there is no result.
+
+        Raises:
+            GeocodingError: when the location can't be geocoded because of an error.
+        """
+
+
+
+
+class NominatimGeocoder(Geocoder):
+    """
+    Geocoder performing http requests to Nominatim (OpenStreetMap open-source geocoder), at most one per second as requested by its usage policy.
+    Pointing the url to a local stub server allows to test it without network access.
+    """
+
+
+    def __init__(self, session=None, url='https://nominatim.openstreetmap.org', min_interval=1):
+        """
+        Class initialization.
+
+        Args:
+            session: http session used for the requests; if None, a new pooled session is created.
+            url: base url of the Nominatim server.
+            min_interval: minimum pause between two consecutive requests, in seconds.
+        """
+        self.session = session if session is not None else create_session(host_limits={url: 1})
+        self.url = url
+        self.limiter = RateLimiter(max_requests=60, window=60, min_interval=min_interval)
+
+
+
+    def geocode(self, location, regions, italy_subset=False):
+        """
+        Performs a http request to Nominatim.
+
+        Args:
+            location: a string.
+            regions: set of italian regions.
+            italy_subset: if True, it geolocalizes only italian places.
+
+        Returns:
+            A list with latitude, longitude and country (or italian region, if italy_subset is True), or None if there is no result.
+
+        Raises:
+            GeocodingError: when the request fails (connection errors, timeouts, error status codes, invalid responses). 
+        """
+        url = f'{self.url}/search?q={location}&format=json&accept-language=en'
+        self.limiter.acquire()
+        try:
+            result = self.session.get(url=url)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise GeocodingError('Nominatim request failed. ' + str(e))
+        if result.status_code != 200:
+            raise GeocodingError('Nominatim request failed. Response code: ' + str(result.status_code))
+        try:
+            result_json = result.json()
+            if len(result_json) == 0:
+                return None
+            lat = float(result_json[0]['lat'])
+            lon = float(result_json[0]['lon'])
+            name = result_json[0]['display_name']
+        except (ValueError, TypeError, KeyError, IndexError) as e:
+            raise GeocodingError('Invalid Nominatim response. ' + str(e))
+
+        country = name.split(',')[-1].strip()
+        if not italy_subset:
+            return [lat, lon, country]
+        elif 'Italia' in name:
+            region = [reg for reg in regions if reg in name.lower()]
+            if len(region) > 0:
+                return [lat, lon, region[0]]
+        return None
+
+
+
+
+class OfflineGeocoder(Geocoder):
+    """
+    Geocoder looking up locations in a local gazetteer, without network requests.
+
+    The gazetteer is a GeoNames dump (e.g. cities15000.txt from https://download.geonames.org/export/dump/),
+    optionally with countryInfo.txt to get country names instead of ISO codes.
+    Names, ascii names and alternate names are normalized and indexed once (the most populated place wins);
+    the index is saved next to the gazetteer, and it's rebuilt only when the gazetteer changes.
+    Italian regions are assigned from the nearest municipality in the ItalyGazetteer.
+    """
+
+
+    def __init__(self, filename, countries_filename=None, italy_gazetteer=None):
+        """
+        Class initialization.
+
+        Args:
+            filename: GeoNames dump of places.
+            countries_filename: GeoNames countryInfo.txt file; if None, countries are ISO codes.
+            italy_gazetteer: ItalyGazetteer used to assign italian regions; if None, italian regions are not assigned.
+        """
+        self.filename = filename
+        self.countries_filename = countries_filename
+        self.italy_gazetteer = italy_gazetteer
+        self.index = self.__load_index()
+
+
+
+    def geocode(self, location, regions, italy_subset=False):
+        """
+        Looks up a location in the gazetteer: first the whole location, then each of its comma separated parts.
+
+        Args:
+            location: a normalized string.
+            regions: set of italian regions.
+            italy_subset: if True, it geolocalizes only italian places.
+
+        Returns:
+            A list with latitude, longitude and country (or italian region, if italy_subset is True), or None.
+        """
+        location = _normalize(location)
+        keys = [location] + [_normalize(part) for part in location.split(',')]
+        for key in keys:
+            if key in self.index:
+                lat, lon, country_code, country = self.index[key]
+                if not italy_subset:
+                    return [lat, lon, country]
+                if country_code == 'IT' and self.italy_gazetteer is not None:
+                    return [lat, lon, self.__nearest_region(lat, lon)]
+                return None
+        return None
+
+
+
+    def __nearest_region(self, lat, lon):
+        """
+        Returns the region of the nearest municipality in Italy.
+
+        Args:
+            lat: latitude.
+            lon: longitude.
+
+        Returns:
+            The region name.
+        """
+        g = self.italy_gazetteer
+        distances = (g.lat - lat) ** 2 + ((g.lon - lon) * np.cos(np.radians(lat))) ** 2
+        return g.columns['region'][int(np.nanargmin(distances))]
+
+
+
+    def __load_index(self):
+        """
+        Loads the prebuilt index, or builds and saves it if it doesn't exist or the gazetteer is newer.
+
+        Returns:
+            A dictionary from normalized names to (latitude, longitude, country code, country).
+        """
+        index_filename = self.filename + '.index.pkl'
+        sources = [f for f in [self.filename, self.countries_filename] if f is not None]
+        if os.path.exists(index_filename) and all(os.path.getmtime(index_filename) >= os.path.getmtime(f) for f in sources):
+            with open(index_filename, 'rb') as f:
+                return pickle.load(f)
+
+        index = self.__build_index()
+        with open(index_filename, 'wb') as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return index
+
+
+
+    def __build_index(self):
+        """
+        Builds the index of the gazetteer.
+
+        Returns:
+            A dictionary from normalized names to (latitude, longitude, country code, country).
+        """
+        countries = {}
+        if self.countries_filename is not None:
+            with open(self.countries_filename, 'r', encoding='utf-8') as f:
+                for row in csv.reader(f, delimiter='\t'):
+                    if len(row) > 4 and not row[0].startswith('#'):
+                        countries[row[0]] = row[4]
+
+        index, population = {}, {}
+        with open(self.filename, 'r', encoding='utf-8') as f:
+            for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
+                if len(row) < 15:
+                    continue
+                names = {row[1], row[2]} | set(row[3].split(','))
+                value = (float(row[4]), float(row[5]), row[8], countries.get(row[8], row[8]))
+                pop = int(row[14] or 0)
+                for name in names:
+                    key = _normalize(name)
+                    if len(key) >= 3 and pop >= population.get(key, -1):
+                        index[key] = value
+                        population[key] = pop
+        return index
+
+
+
+
+def _normalize(name):
+    """
+    Normalizes a name as TweetsDownloader.normalize_location does: lowercase, letters, commas and single whitespaces.
+
+    Args:
+        name: a string.
+
+    Returns:
+        The normalized name.
+    """
+    name = re.sub('[^a-z ,]+', '', name.lower())
+    return ' '.join(name.split()).strip(' ,')
@@ -0,0 +1,297 @@
+import threading, random, requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from time import time, monotonic
+from datetime import datetime
+
+
+
+class RateLimiter():
+    """
+    Token bucket shared by every request performed against the same endpoint.
+
+    The bucket holds at most max_requests tokens and refills at max_requests / window tokens per second,
+    while two consecutive requests are always spaced by at least min_interval seconds.
+    The bucket is kept in sync with the "x-rate-limit-remaining" and "x-rate-limit-reset" headers of the responses:
+    when the remaining budget is over, every request waits for the window reset.
+    """
+
+
+    def __init__(self, max_requests=300, window=900, min_interval=1):
+        """
+        Class initialization.
+
+        Args:
+            max_requests: requests allowed in each window.
+            window: length of the rate limit window, in seconds.
+            min_interval: minimum pause between two consecutive requests, in seconds.
+        """
+        self.capacity = max_requests
+        self.rate = max_requests / window
+        self.min_interval = min_interval
+        self.tokens = float(max_requests)
+        self.blocked_until = 0
+        self.last_refill = monotonic()
+        self.last_request = None
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+
+
+    def acquire(self):
+        """
+        Blocks until a request can be performed, then consumes a token.
+        The lock is released while waiting, so that other threads can update the bucket meanwhile (waking the waiting ones up).
+        """
+        with self.lock:
+            while True:
+                now = monotonic()
+                self.__refill(now)
+
+                wait = 0
+                if self.tokens < 1:
+                    wait = (1 - self.tokens) / self.rate
+                if self.last_request is not None:
+                    wait = max(wait, self.last_request + self.min_interval - now)
+                wait = max(wait, self.blocked_until - time())
+
+                if wait <= 0:
+                    break
+                self.changed.wait(wait)
+
+            self.tokens -= 1
+            self.last_request = monotonic()
+
+
+
+    def update(self, headers):
+        """
+        Synchronizes the bucket with the rate limit headers of a response.
+
+        Args:
+            headers: headers of the http response.
+        """
+        remaining = headers.get('x-rate-limit-remaining')
+        reset = headers.get('x-rate-limit-reset')
+        if remaining is None:
+            return
+
+        with self.lock:
+            self.__refill(monotonic())
+            self.tokens = min(float(self.capacity), float(remaining))
+            if int(remaining) <= 0 and reset is not None:
+                self.blocked_until = float(reset)
+            self.changed.notify_all()
+
+
+
+    def estimate_time(self, n):
+        """
+        Estimates how long it takes to perform some requests, starting from the current bucket, when nothing else is requested. 
+
+        Args:
+            n: number of requests.
+
+        Returns:
+            The estimated time, in seconds.
+        """
+        if n <= 0:
+            return 0.
+        with self.lock:
+            self.__refill(monotonic())
+            tokens = self.tokens
+        return float(max((n - 1) * self.min_interval, (n - tokens) / self.rate, self.blocked_until - time()))
+
+
+
+    def __refill(self, now):
+        """
+        Adds the tokens accumulated since the last refill.
+
+        Args:
+            now: current monotonic time.
+        """
+        self.tokens = min(float(self.capacity), self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+
+
+
+#--------------------------------
+# dates functions
+#--------------------------------
+
+
+def parse_api_time(date):
+    """
+    Parses a date, either in the "yyyy-mm-dd" format or in the API format "yyyy-mm-ddTHH:MM:SS(.ff)Z".
+
+    Args:
+        date: a string.
+
+    Returns:
+        A datetime object.
+    """
+    if len(date) == 10:
+        return datetime.strptime(date, '%Y-%m-%d')
+    return datetime.strptime(date.rstrip('Z').split('.')[0], '%Y-%m-%dT%H:%M:%S')
+
+
+
+def to_api_time(date):
+    """
+    Formats a date as requested by the API.
+
+    Args:
+        date: a datetime object or a string, either in the "yyyy-mm-dd" format or already in the API format.
+
+    Returns:
+        A string with format "yyyy-mm-ddTHH:MM:SS.00Z".
+    """
+    if type(date) == str:
+        date = parse_api_time(date)
+    return date.strftime('%Y-%m-%dT%H:%M:%S') + '.00Z'
+
+
+
+def split_dates_range(dates_range, n):
+    """
+    Splits a dates range into n contiguous slices of the same width.
+
+    Args:
+        dates_range: tuple with start and end date, with format: ("yyyy-mm-dd", "yyyy-mm-dd").
+        n: number of slices.
+
+    Returns:
+        A list of (start, end) tuples, formatted as requested by the API.
+    """
+    start, end = parse_api_time(dates_range[0]), parse_api_time(dates_range[1])
+    n = max(1, min(n, int((end - start).total_seconds())))
+    step = (end - start) / n
+    bounds = [start + step * i for i in range(n)] + [end]
+    bounds = [b.replace(microsecond=0) for b in bounds]
+    return [(to_api_time(bounds[i]), to_api_time(bounds[i+1])) for i in range(n)]
+
+
+
+def split_counts_range(dates_range, counts, n):
+    """
+    Splits a dates range into at most n contiguous slices with about the same number of tweets, given the tweets counts over time 
+    (tweets are assumed to be uniform inside each bucket, so the slices are as balanced as the buckets granularity allows).
+
+    Args:
+        dates_range: tuple with start and end date, with format: ("yyyy-mm-dd", "yyyy-mm-dd").
+        counts: list of contiguous buckets, as dictionaries with "start", "end" and "tweet_count" (as returned by the counts endpoint).
+        n: number of slices.
+
+    Returns:
+        A list of (start, end) tuples, formatted as requested by the API.
+    """
+    start, end = parse_api_time(dates_range[0]), parse_api_time(dates_range[1])
+    buckets = _clip_buckets(counts, start, end)
+    total = sum(c for _, _, c in buckets)
+    if total == 0:
+        return split_dates_range(dates_range, n)
+
+    bounds = [start]
+    done, i = 0, 1
+    for s, e, c in buckets:
+        # every boundary falling inside the bucket is interpolated
+        while i < n and done + c > total * i / n:
+            bound = (s + (e - s) * ((total * i / n - done) / c)).replace(microsecond=0)
+            if bound > bounds[-1]:
+                bounds.append(bound)
+            i += 1
+        done += c
+    if end > bounds[-1]:
+        bounds.append(end)
+    return [(to_api_time(bounds[i]), to_api_time(bounds[i+1])) for i in range(len(bounds) - 1)]
+
+
+
+def count_in_range(counts, dates_range):
+    """
+    Estimates the number of tweets of a dates range, given the tweets counts over time (uniform inside each bucket).
+
+    Args:
+        counts: list of buckets, as dictionaries with "start", "end" and "tweet_count" (as returned by the counts endpoint).
+        dates_range: tuple with start and end date, with format: ("yyyy-mm-dd", "yyyy-mm-dd").
+
+    Returns:
+        The estimated number of tweets.
+    """
+    return sum(c for _, _, c in _clip_buckets(counts, parse_api_time(dates_range[0]), parse_api_time(dates_range[1])))
+
+
+
+# buckets as (start, end, count) tuples, clipped to a dates range with their counts scaled accordingly
+def _clip_buckets(counts, start, end):
+    buckets = []
+    for bucket in counts:
+        s, e, c = parse_api_time(bucket['start']), parse_api_time(bucket['end']), bucket['tweet_count']
+        clipped_s, clipped_e = max(s, start), min(e, end)
+        if clipped_e > clipped_s and c > 0:
+            buckets.append((clipped_s, clipped_e, c * (clipped_e - clipped_s) / (e - s)))
+    return sorted(buckets)
+
+
+
+
+#--------------------------------
+# retry functions
+#--------------------------------
+
+
+# status codes worth retrying: rate limit exceeded and server errors
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+
+def backoff_delay(attempt, base=2, cap=300):
+    """
+    Exponential backoff with full jitter. 
+
+    Args:
+        attempt: number of the failed attempt, starting from 0.
+        base: delay of the first retry, in seconds.
+        cap: maximum delay, in seconds.
+
+    Returns:
+        The seconds to wait before the next attempt.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+
+
+#--------------------------------
+# transport functions
+#--------------------------------
+
+
+def create_session(host_limits=None, pool_maxsize=10, user_agent='tweets-analysis'):
+    """
+    Creates an http session with a pool of keep-alive connections and compressed responses. 
+
+    Args:
+        host_limits: dictionary from base url (e.g. "https://api.twitter.com") to the maximum number of connections opened to that host. 
+        pool_maxsize: maximum number of connections opened to any other host. 
+        user_agent: User-Agent header of every request (required by Nominatim). 
+
+    Returns:
+        A requests.Session object. 
+    """
+    session = requests.Session()
+    session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive', 'User-Agent': user_agent})
+
+    default_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+    session.mount('http://', default_adapter)
+    session.mount('https://', default_adapter)
+
+    for url, limit in (host_limits or {}).items():
+        # pool_block keeps the number of connections to the host within the limit
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=limit, pool_block=True)
+        parsed = urlparse(url)
+        session.mount(parsed.scheme + '://' + parsed.netloc, adapter)
+
+    return session
@@ -0,0 +1,321 @@
+import numpy as np
+from functools import lru_cache
+
+from TweetsUtils import decode_json
+
+
+# maximum number of (point, edge) pairs tested at once
+PAIRS_BATCH = 2**21
+
+
+
+class RegionIndex():
+    """
+    Point-in-polygon index of the regions of a GeoJSON file (by default, files/italy_regions_borders.geojson), with bulk queries over numpy arrays.
+
+    The edges of every polygon ring are stored as numpy arrays, and a uniform grid of cells is laid over the regions:
+     - cells farther than max_distance from every edge are entirely inside a region (or outside all of them),
+       so their region is computed once, from their center, and points falling there are answered with a lookup
+     - the other cells keep the list of their near edges, and each horizontal band of cells the list of the edges crossing it,
+       so points falling there are tested by ray casting only against the edges of their band (even-odd rule, holes included)
+    Points outside every region, but within max_distance of a border (e.g. coastal towns, since borders are simplified),
+    get the region of the nearest edge. Results are deterministic and don't require any network call.
+    """
+
+    def __init__(self, geojson, name_field='NAME_1', cell_size=0.1, max_distance=0.1):
+        """
+        Class initialization.
+
+        Args:
+            geojson: dictionary of a GeoJSON FeatureCollection of Polygon and MultiPolygon features, with [lon, lat] coordinates.
+            name_field: property containing the name of each region.
+            cell_size: side of the grid cells, in degrees.
+            max_distance: maximum distance (in degrees) from a border of the points outside every region assigned to the nearest one.
+        """
+        self.names = []
+        self.cell_size = cell_size
+        self.max_distance = max_distance
+
+        edges, codes = [], []
+        for feature in geojson['features']:
+            geometry = feature['geometry']
+            if geometry is None or geometry['type'] not in ('Polygon', 'MultiPolygon'):
+                continue
+            name = feature['properties'][name_field]
+            if name not in self.names:
+                self.names.append(name)
+            polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+            for ring in (ring for polygon in polygons for ring in polygon):
+                ring = np.asarray(ring, dtype=np.float64)[:, :2]
+                if len(ring) < 3:
+                    continue
+                if not np.array_equal(ring[0], ring[-1]):
+                    ring = np.vstack([ring, ring[:1]])
+                edges.append(np.hstack([ring[:-1], ring[1:]]))
+                codes.append(np.full(len(ring) - 1, self.names.index(name), dtype=np.int32))
+        if len(edges) == 0:
+            raise Exception('No polygons found in the GeoJSON')
+
+        edges = np.concatenate(edges)
+        self.x1, self.y1, self.x2, self.y2 = (np.ascontiguousarray(edges[:, i]) for i in range(4))
+        self.codes = np.concatenate(codes)
+
+        # grid covering the regions, plus the distance of the nearest edge assignment
+        self.x0 = min(self.x1.min(), self.x2.min()) - max_distance
+        self.y0 = min(self.y1.min(), self.y2.min()) - max_distance
+        self.nx = int(np.ceil((max(self.x1.max(), self.x2.max()) + max_distance - self.x0) / cell_size)) + 1
+        self.ny = int(np.ceil((max(self.y1.max(), self.y2.max()) + max_distance - self.y0) / cell_size)) + 1
+
+        # edges crossing each band of cells, and edges near each cell
+        low, high = np.minimum(self.y1, self.y2), np.maximum(self.y1, self.y2)
+        self.band_offsets, self.band_edges = self.__ranges_index(self.__row(low), self.__row(high), self.ny)
+        left, right = np.minimum(self.x1, self.x2), np.maximum(self.x1, self.x2)
+        columns = (self.__column(left - max_distance), self.__column(right + max_distance))
+        rows = (self.__row(low - max_distance), self.__row(high + max_distance))
+        self.cell_offsets, self.cell_edges = self.__cells_index(columns, rows)
+
+        # cells without near edges have the same region of their center (-1 if outside every region), the other ones are marked with -2
+        self.cell_regions = np.full(self.nx * self.ny, -2, dtype=np.int32)
+        free = np.nonzero(np.diff(self.cell_offsets) == 0)[0]
+        centers_x = self.x0 + (free % self.nx + 0.5) * cell_size
+        centers_y = self.y0 + (free // self.nx + 0.5) * cell_size
+        self.cell_regions[free] = self.__contains(centers_x, centers_y)
+
+        for a in [self.x1, self.y1, self.x2, self.y2, self.codes, self.band_offsets, self.band_edges,
+                  self.cell_offsets, self.cell_edges, self.cell_regions]:
+            a.setflags(write=False)
+
+
+
+    def locate(self, lat, lon):
+        """
+        Finds the region of some points.
+
+        Args:
+            lat: array (or list) of latitudes.
+            lon: array (or list) of longitudes, in the same order.
+
+        Returns:
+            A numpy object array with the region name of each point, or None if it's outside every region (or its coordinates are missing).
+        """
+        codes = self.locate_codes(lat, lon)
+        names = np.array(self.names + [None], dtype=object)
+        return names[codes]
+
+
+
+    def locate_codes(self, lat, lon):
+        """
+        Finds the region of some points, as positions in the names attribute.
+
+        Args:
+            lat: array (or list) of latitudes.
+            lon: array (or list) of longitudes, in the same order.
+
+        Returns:
+            A numpy int32 array with the position of the region of each point, or -1 if it's outside every region.
+        """
+        y = np.asarray(lat, dtype=np.float64).ravel()
+        x = np.asarray(lon, dtype=np.float64).ravel()
+        if len(x) != len(y):
+            raise Exception('lat and lon must have the same length')
+        result = np.full(len(x), -1, dtype=np.int32)
+
+        columns, rows = np.floor((x - self.x0) / self.cell_size), np.floor((y - self.y0) / self.cell_size)
+        inside = np.nonzero((columns >= 0) & (columns < self.nx) & (rows >= 0) & (rows < self.ny))[0]
+        cells = rows[inside].astype(np.int64) * self.nx + columns[inside].astype(np.int64)
+        status = self.cell_regions[cells]
+        result[inside] = np.maximum(status, -1)
+
+        # points near a border: ray casting, then nearest edge for the ones outside every region
+        border = inside[status == -2]
+        if len(border) > 0:
+            result[border] = self.__contains(x[border], y[border])
+            outside = status == -2
+            outside[outside] = result[border] == -1
+            if outside.any():
+                result[inside[outside]] = self.__nearest(x[inside[outside]], y[inside[outside]], cells[outside])
+        return result
+
+
+
+    def region_of(self, lat, lon):
+        """
+        Finds the region of a single point.
+
+        Args:
+            lat: latitude.
+            lon: longitude.
+
+        Returns:
+            The region name, or None if the point is outside every region.
+        """
+        return self.locate([lat], [lon])[0]
+
+
+
+    def __contains(self, x, y):
+        """
+        Ray casting of some points against the edges of their bands.
+
+        Args:
+            x: numpy array of longitudes.
+            y: numpy array of latitudes, inside the grid.
+
+        Returns:
+            A numpy int32 array with the position of the region containing each point, or -1.
+        """
+        rows = self.__row(y)
+        pairs = _pairs(self.band_offsets, self.band_edges, rows)
+        result = np.full(len(x), -1, dtype=np.int32)
+        for points, edges in pairs:
+            px, py = x[points], y[points]
+            y1, y2 = self.y1[edges], self.y2[edges]
+            x1, x2 = self.x1[edges], self.x2[edges]
+            # edges crossed by the horizontal ray going east from the point
+            straddle = (y1 > py) != (y2 > py)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                crossing = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            crossed = straddle & (px < crossing)
+            # a point is inside a region if it crosses an odd number of its edges
+            keys = points[crossed].astype(np.int64) * len(self.names) + self.codes[edges[crossed]]
+            keys, counts = np.unique(keys, return_counts=True)
+            keys = keys[counts % 2 == 1]
+            # with overlapping borders, the first region wins
+            keys = keys[::-1]
+            result[keys // len(self.names)] = keys % len(self.names)
+        return result
+
+
+
+    def __nearest(self, x, y, cells):
+        """
+        Assigns some points outside every region to the region of their nearest edge, if within max_distance.
+
+        Args:
+            x: numpy array of longitudes.
+            y: numpy array of latitudes.
+            cells: numpy array with the cell of each point.
+
+        Returns:
+            A numpy int32 array with the position of the region of each point, or -1.
+        """
+        result = np.full(len(x), -1, dtype=np.int32)
+        best = np.full(len(x), np.inf)
+        for points, edges in _pairs(self.cell_offsets, self.cell_edges, cells):
+            px, py = x[points], y[points]
+            x1, y1 = self.x1[edges], self.y1[edges]
+            dx, dy = self.x2[edges] - x1, self.y2[edges] - y1
+            length = dx * dx + dy * dy
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = np.clip(np.where(length > 0, ((px - x1) * dx + (py - y1) * dy) / length, 0), 0, 1)
+            distance = np.hypot(px - x1 - t * dx, py - y1 - t * dy)
+            # the nearest edge of each point, ties broken by the first edge
+            order = np.lexsort((edges, distance, points))
+            points, edges, distance = points[order], edges[order], distance[order]
+            first = np.concatenate([[True], points[1:] != points[:-1]])
+            points, edges, distance = points[first], edges[first], distance[first]
+            better = distance < best[points]
+            best[points[better]] = distance[better]
+            result[points[better]] = self.codes[edges[better]]
+        result[best > self.max_distance] = -1
+        return result
+
+
+
+    def __row(self, y):
+        return np.clip(np.floor((y - self.y0) / self.cell_size), 0, self.ny - 1).astype(np.int64)
+
+
+
+    def __column(self, x):
+        return np.clip(np.floor((x - self.x0) / self.cell_size), 0, self.nx - 1).astype(np.int64)
+
+
+
+    def __ranges_index(self, first, last, size):
+        """
+        Builds a CSR index from each position (band) to the edges covering it.
+
+        Args:
+            first: numpy array with the first position of each edge.
+            last: numpy array with the last position of each edge.
+            size: number of positions.
+
+        Returns:
+            A tuple containing the offsets and the edges of each position.
+        """
+        counts = last - first + 1
+        edges = np.repeat(np.arange(len(first), dtype=np.int32), counts)
+        positions = np.repeat(first, counts) + _local_arange(counts)
+        return _csr(positions, edges, size)
+
+
+
+    def __cells_index(self, columns, rows):
+        """
+        Builds a CSR index from each cell to the edges whose bounding box, expanded by max_distance, covers it.
+
+        Args:
+            columns: tuple with the first and the last column of each edge.
+            rows: tuple with the first and the last row of each edge.
+
+        Returns:
+            A tuple containing the offsets and the edges of each cell.
+        """
+        widths, heights = columns[1] - columns[0] + 1, rows[1] - rows[0] + 1
+        counts = widths * heights
+        edges = np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+        local = _local_arange(counts)
+        cells = (np.repeat(rows[0], counts) + local // np.repeat(widths, counts)) * self.nx \
+                + np.repeat(columns[0], counts) + local % np.repeat(widths, counts)
+        return _csr(cells, edges, self.nx * self.ny)
+
+
+
+
+# 0, 1, ..., count - 1 for each count, concatenated
+def _local_arange(counts):
+    counts = np.asarray(counts, dtype=np.int64)
+    return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+
+# offsets and values of a CSR index, sorted by position
+def _csr(positions, values, size):
+    order = np.argsort(positions, kind='stable')
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(positions, minlength=size), out=offsets[1:])
+    return offsets, values[order]
+
+
+
+# (point, edge) pairs of a CSR index, in batches of at most PAIRS_BATCH pairs (one point is never split)
+def _pairs(offsets, values, positions):
+    counts = offsets[positions + 1] - offsets[positions]
+    cumulative = np.cumsum(counts)
+    start = 0
+    while start < len(positions):
+        end = max(start + 1, int(np.searchsorted(cumulative, (cumulative[start] - counts[start]) + PAIRS_BATCH, side='right')))
+        batch = counts[start:end]
+        points = np.repeat(np.arange(start, end), batch)
+        edges = values[np.repeat(offsets[positions[start:end]], batch) + _local_arange(batch)]
+        yield points, edges
+        start = end
+
+
+
+@lru_cache(maxsize=None)
+def get_region_index(filename='files/italy_regions_borders.geojson', name_field='NAME_1'):
+    """
+    Reads a GeoJSON of region borders and builds its index, only the first time it's called.
+
+    Args:
+        filename: GeoJSON file, by default the borders of the italian regions (whose names are the same of files/italy_places.csv).
+        name_field: property containing the name of each region.
+
+    Returns:
+        A RegionIndex object.
+    """
+    with open(filename, 'rb') as f:
+        return RegionIndex(decode_json(f.read()), name_field)
@@ -0,0 +1,430 @@
+import re, html, pickle, zlib
+import pandas as pd
+import numpy as np
+from time import perf_counter
+from functools import lru_cache
+
+from TweetsUtils import iter_file, FileWriter, _chunks, _map_texts
+from TweetsEmoji import get_emoji_normalizer
+
+
+# sentiment classes, in the order of the model outputs
+CLASSES = ['negative', 'neutral', 'positive']
+
+# columns of the SENTIPOLC 2016 files (the test set has no header)
+SENTIPOLC_COLUMNS = ['idtwitter', 'subj', 'opos', 'oneg', 'iro', 'lpos', 'lneg', 'top', 'text']
+
+# tokens: words, hashtags, mentions, and groups of punctuation (e.g. "!!", ":)")
+TOKENS_REGEX = re.compile(r"[#@]?\w+|[^\w\s]{1,3}")
+URLS_REGEX = re.compile(r'https?://\S+|www\.\S+')
+MENTIONS_REGEX = re.compile(r'@\w+')
+
+# token separating the texts of a batch
+SEPARATOR = '\x00'
+
+
+
+class SentimentClassifier():
+    """
+    Sentiment classifier for italian tweets running on CPU: a multinomial logistic regression over hashed n-grams.
+
+    Each cleaned text is split into tokens, and its features are the unigrams, the bigrams and the prefixes of the words
+    (a cheap stemming), hashed into n_features buckets, so no vocabulary is needed and any text can be featurized independently.
+    Batches are featurized into flat arrays of indices, and scores are computed at once with numpy (a gather and a segmented sum of the weights).
+    The valence of a text is P(positive) - P(negative), between -1 and 1, and its sentiment is given by classify_sentiment.
+    Batches are classified on a pool of processes, each one with a copy of the weights.
+    """
+
+    def __init__(self, n_features=2**18, prefix_size=5, threshold=0.3, emoji=True):
+        """
+        Class initialization.
+
+        Args:
+            n_features: number of hash buckets (a power of 2).
+            prefix_size: length of the prefixes of the words used as features (0 to disable them).
+            threshold: minimum absolute valence of non-neutral texts.
+            emoji: if True, emoji are replaced with their Italian names (see TweetsEmoji), so that they become features.
+        """
+        self.n_features = n_features
+        self.prefix_size = prefix_size
+        self.emoji = emoji
+        self.threshold = threshold
+        self.weights = np.zeros((n_features, len(CLASSES)), dtype=np.float32)
+        self.bias = np.zeros(len(CLASSES), dtype=np.float32)
+
+
+
+    def fit(self, texts, labels, epochs=5, learning_rate=0.3, l2=1e-6, batch_size=32, balanced=True, seed=0):
+        """
+        Trains the model with mini-batch AdaGrad on the cross entropy.
+
+        Args:
+            texts: list of texts.
+            labels: list of classes ("negative", "neutral", "positive").
+            epochs: number of passes over the texts.
+            learning_rate: initial learning rate.
+            l2: L2 regularization of the weights.
+            batch_size: number of texts of each update.
+            balanced: if True, classes are weighted inversely to their frequency.
+            seed: seed of the shuffling.
+
+        Returns:
+            The classifier itself.
+        """
+        indices, offsets = self.features(texts)
+        y = np.array([CLASSES.index(l) for l in labels])
+        n = len(y)
+        counts = np.bincount(y, minlength=len(CLASSES))
+        class_weights = n / (len(CLASSES) * np.maximum(counts, 1)) if balanced else np.ones(len(CLASSES))
+        targets = np.eye(len(CLASSES))[y]
+
+        weights = np.zeros((self.n_features, len(CLASSES)))
+        bias = np.zeros(len(CLASSES))
+        squares = np.full((self.n_features, len(CLASSES)), 1e-8)
+        bias_squares = np.full(len(CLASSES), 1e-8)
+        rng = np.random.default_rng(seed)
+
+        for _ in range(epochs):
+            order = rng.permutation(n)
+            for start in range(0, n, batch_size):
+                rows = order[start:start+batch_size]
+                features, owners = _gather(indices, offsets, rows)
+                scores = np.zeros((len(rows), len(CLASSES)))
+                np.add.at(scores, owners, weights[features])
+                errors = (_softmax(scores + bias) - targets[rows]) * class_weights[y[rows], None] / len(rows)
+
+                # sparse AdaGrad step on the weights of the features in the batch
+                unique, inverse = np.unique(features, return_inverse=True)
+                gradient = np.zeros((len(unique), len(CLASSES)))
+                np.add.at(gradient, inverse, errors[owners])
+                gradient += l2 * weights[unique]
+                squares[unique] += gradient ** 2
+                weights[unique] -= learning_rate * gradient / np.sqrt(squares[unique])
+
+                bias_gradient = errors.sum(axis=0)
+                bias_squares += bias_gradient ** 2
+                bias -= learning_rate * bias_gradient / np.sqrt(bias_squares)
+
+        self.weights = weights.astype(np.float32)
+        self.bias = bias.astype(np.float32)
+        return self
+
+
+
+    def features(self, texts):
+        """
+        Featurizes some texts.
+
+        Args:
+            texts: list of texts.
+
+        Returns:
+            A tuple containing the hashed features of every text (numpy int32 array) and the offset of the features of each text.
+        """
+        if self.emoji:
+            texts = get_emoji_normalizer().normalize_many(t if type(t) == str else '' for t in texts)
+        return _featurize(texts, self.n_features, self.prefix_size)
+
+
+
+    def predict_proba(self, texts):
+        """
+        Computes the probabilities of the classes of some texts.
+
+        Args:
+            texts: list of texts.
+
+        Returns:
+            A numpy array with shape (number of texts, 3), with the probabilities of "negative", "neutral" and "positive".
+        """
+        indices, offsets = self.features(texts)
+        scores = np.zeros((len(texts), len(CLASSES)), dtype=np.float32)
+        nonempty = np.nonzero(np.diff(offsets) > 0)[0]
+        if len(indices) > 0:
+            scores[nonempty] = np.add.reduceat(self.weights[indices], offsets[nonempty], axis=0)
+        return _softmax(scores + self.bias)
+
+
+
+    def valence(self, texts):
+        """
+        Computes the valence of some texts, P(positive) - P(negative).
+
+        Args:
+            texts: list of texts.
+
+        Returns:
+            A numpy array of valences, between -1 and 1.
+        """
+        probabilities = self.predict_proba(texts)
+        return probabilities[:, 2] - probabilities[:, 0]
+
+
+
+    def predict(self, texts):
+        """
+        Classifies some texts.
+
+        Args:
+            texts: list of texts.
+
+        Returns:
+            A list of classes ("negative", "neutral", "positive").
+        """
+        return [classify_sentiment(v, self.threshold) for v in self.valence(texts).tolist()]
+
+
+
+    def classify(self, tweets, workers=None, batch_size=5000):
+        """
+        Adds the fields "valence" and "sentiment" to some tweets.
+
+        Args:
+            tweets: iterable of tweets.
+            workers: number of processes; if None, one for each core.
+            batch_size: number of tweets of each batch.
+
+        Returns:
+            A generator of the same tweets, with the new fields, in the same order.
+        """
+        batches = _chunks(tweets, batch_size)
+        for batch, valences in _map_texts(_batch_valences, self, batches, _texts, workers):
+            for tw, v in zip(batch, valences.tolist()):
+                tw['valence'] = v
+                tw['sentiment'] = classify_sentiment(v, self.threshold)
+                yield tw
+
+
+
+    def classify_file(self, filename, destination, _type='jsonl', workers=None, batch_size=5000):
+        """
+        Classifies a merged tweets file into another file, streaming over it.
+
+        Args:
+            filename: merged tweets file.
+            destination: name of the destination file.
+            _type: format of the destination file, either "jsonl", "json" or "parquet".
+            workers: number of processes; if None, one for each core.
+            batch_size: number of tweets of each batch.
+
+        Returns:
+            The number of classified tweets.
+        """
+        writer = FileWriter(destination, _type)
+        n = 0
+        for tw in self.classify(iter_file(filename), workers, batch_size):
+            writer.write(tw)
+            n += 1
+        writer.close()
+        return n
+
+
+
+    def evaluate(self, texts, labels):
+        """
+        Evaluates the classifier on some labeled texts.
+
+        Args:
+            texts: list of texts.
+            labels: list of classes.
+
+        Returns:
+            A dictionary with the accuracy, the F1 score of each class and their average ("macro_f1").
+        """
+        predictions = np.array(self.predict(texts))
+        labels = np.array(labels)
+        result = {'accuracy': float((predictions == labels).mean())}
+        for c in CLASSES:
+            tp = np.sum((predictions == c) & (labels == c))
+            precision = tp / max(np.sum(predictions == c), 1)
+            recall = tp / max(np.sum(labels == c), 1)
+            result['f1_' + c] = float(2 * precision * recall / (precision + recall)) if tp > 0 else 0.0
+        result['macro_f1'] = float(np.mean([result['f1_' + c] for c in CLASSES]))
+        return result
+
+
+
+    def save(self, filename):
+        """
+        Saves the classifier into a pickle file.
+        """
+        with open(filename, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+
+    @staticmethod
+    def load(filename):
+        """
+        Loads a classifier saved by save.
+
+        Returns:
+            A SentimentClassifier object.
+        """
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+
+
+
+
+def classify_sentiment(valence, threshold=0.3):
+    """
+    Classifies a valence.
+
+    Args:
+        valence: a number between -1 and 1.
+        threshold: minimum absolute valence of non-neutral texts.
+
+    Returns:
+        "positive", "negative" or "neutral".
+    """
+    if valence >= threshold:
+        return 'positive'
+    if valence <= -threshold:
+        return 'negative'
+    return 'neutral'
+
+
+
+def read_sentipolc(filename):
+    """
+    Reads a SENTIPOLC 2016 file, with or without header.
+    Texts with only positive (opos) or only negative (oneg) polarity are "positive" or "negative", the other ones (mixed included) "neutral".
+
+    Args:
+        filename: training or test csv file.
+
+    Returns:
+        A tuple containing the list of texts and the list of their classes.
+    """
+    df = pd.read_csv(filename, escapechar='\\', header=None, names=SENTIPOLC_COLUMNS, dtype=str)
+    df = df[df['idtwitter'] != 'idtwitter'].dropna(subset=['text'])
+    opos, oneg = df['opos'].astype(int), df['oneg'].astype(int)
+    labels = np.where((oneg == 1) & (opos == 0), 'negative', np.where((oneg == 0) & (opos == 1), 'positive', 'neutral'))
+    return df['text'].tolist(), labels.tolist()
+
+
+
+@lru_cache(maxsize=None)
+def get_sentiment_classifier(train_filename='files/training_set_sentipolc16.csv'):
+    """
+    Trains the classifier on the SENTIPOLC training set, only the first time it's called.
+
+    Args:
+        train_filename: SENTIPOLC training file.
+
+    Returns:
+        A SentimentClassifier object.
+    """
+    texts, labels = read_sentipolc(train_filename)
+    return SentimentClassifier().fit(texts, labels)
+
+
+
+def benchmark(train_filename='files/training_set_sentipolc16.csv', test_filename='files/test_set_sentipolc16_gold2000.csv',
+              texts=None, workers=None, batch_size=5000):
+    """
+    Trains the classifier and measures its quality on the SENTIPOLC test set and its throughput.
+
+    Args:
+        train_filename: SENTIPOLC training file.
+        test_filename: SENTIPOLC test file.
+        texts: texts used to measure the throughput; if None, 200000 distinct texts made from the test ones.
+        workers: number of processes; if None, one for each core.
+        batch_size: number of texts of each batch.
+
+    Returns:
+        A dictionary with the evaluation on the test set, the training time, and the texts classified per second.
+    """
+    start = perf_counter()
+    classifier = SentimentClassifier().fit(*read_sentipolc(train_filename))
+    training_time = perf_counter() - start
+
+    test_texts, test_labels = read_sentipolc(test_filename)
+    result = classifier.evaluate(test_texts, test_labels)
+    result['training_seconds'] = training_time
+
+    if texts is None:
+        texts = ['%s %d' % (test_texts[i % len(test_texts)], i) for i in range(200000)]
+    start = perf_counter()
+    n = sum(len(valences) for _, valences in _map_texts(_batch_valences, classifier, _chunks(texts, batch_size), workers=workers))
+    result['texts_per_second'] = n / (perf_counter() - start)
+    return result
+
+
+
+
+# cleaning of the texts: lowercase, without links, "rt" prefix and html entities, and with generic mentions
+def clean_text(text):
+    text = URLS_REGEX.sub(' ', html.unescape(text.lower()))
+    if text.startswith('rt '):
+        text = text[3:]
+    return MENTIONS_REGEX.sub('@user', text).replace(SEPARATOR, ' ')
+
+
+
+# hashed unigrams, bigrams and word prefixes of some texts, tokenized at once: every distinct token is hashed only once
+# and bigrams are hashed with numpy from the hashes of their tokens
+def _featurize(texts, n_features, prefix_size):
+    cleaned = [clean_text(t) if type(t) == str else '' for t in texts]
+    tokens = TOKENS_REGEX.findall((' ' + SEPARATOR + ' ').join(cleaned))
+    vocabulary = {SEPARATOR: 0}
+    ids = np.array([vocabulary.setdefault(t, len(vocabulary)) for t in tokens], dtype=np.int64)
+    words = list(vocabulary)
+    hashes = np.array([zlib.crc32(t.encode('utf-8')) for t in words], dtype=np.uint32)
+
+    separators = ids == 0
+    documents = np.cumsum(separators)
+    valid = ~separators
+    features = [hashes[ids[valid]]]
+    owners = [documents[valid]]
+
+    # bigrams of consecutive tokens of the same text
+    pairs = valid[:-1] & valid[1:]
+    with np.errstate(over='ignore'):
+        features.append(hashes[ids[:-1][pairs]] * np.uint32(0x9E3779B1) + hashes[ids[1:][pairs]] * np.uint32(0x85EBCA6B) + np.uint32(1))
+    owners.append(documents[:-1][pairs])
+
+    if prefix_size > 0:
+        long_words = np.array([len(t) > prefix_size for t in words])
+        prefixes = np.zeros(len(words), dtype=np.uint32)
+        prefixes[long_words] = [zlib.crc32(('>' + t[:prefix_size]).encode('utf-8')) for t, l in zip(words, long_words) if l]
+        prefixed = valid & long_words[ids]
+        features.append(prefixes[ids[prefixed]])
+        owners.append(documents[prefixed])
+
+    # distinct features of each text, sorted by text
+    keys = np.concatenate(owners) * n_features + (np.concatenate(features) & np.uint32(n_features - 1))
+    keys.sort()
+    keys = keys[np.concatenate([[True], keys[1:] != keys[:-1]])[:len(keys)]]
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // n_features, minlength=len(texts)), out=offsets[1:])
+    return (keys % n_features).astype(np.int32), offsets
+
+
+
+# features of some rows of a CSR matrix, and the position (in rows) each one belongs to
+def _gather(indices, offsets, rows):
+    counts = offsets[rows + 1] - offsets[rows]
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return indices[np.repeat(offsets[rows], counts) + local], np.repeat(np.arange(len(rows)), counts)
+
+
+
+def _softmax(scores):
+    scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+    return scores / scores.sum(axis=1, keepdims=True)
+
+
+
+# valences of a batch of texts, computed once for each distinct text
+def _batch_valences(classifier, texts):
+    unique = {}
+    inverse = np.array([unique.setdefault(t, len(unique)) for t in texts], dtype=np.int64)
+    return classifier.valence(list(unique))[inverse]
+
+
+
+# texts of a batch of tweets
+def _texts(batch):
+    return [tw.get('text', '') for tw in batch]
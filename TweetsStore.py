@@ -0,0 +1,479 @@
+import numpy as np
+from array import array
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+
+from TweetsUtils import iter_file
+
+
+# metrics flattened by TweetsDownloader.__fix_tweet, with their array typecode
+METRICS = {'retweet_count': 'i', 'reply_count': 'i', 'like_count': 'i', 'quote_count': 'i', 'impression_count': 'q'}
+
+# string fields with few distinct values, dictionary encoded
+CATEGORICAL = ['author_id', 'source', 'lang']
+
+# order of the fields in the views (fields outside the store columns come after)
+FIELDS = ['id', 'text', 'author_id', 'datetime', 'source', 'lang', *METRICS,
+          'hashtags', 'geo', 'referenced_tweets', 'edit_history_tweet_ids']
+
+EPOCH = datetime(1970, 1, 1)
+
+# missing values of the numeric columns
+MISSING = -1
+MISSING_TIME = np.iinfo(np.int64).min
+
+
+
+class Vocabulary():
+    """
+    Interned strings: every distinct string is stored once and referenced by its code.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+
+    def encode(self, value):
+        """
+        Returns the code of a string, adding it to the vocabulary if it's new.
+
+        Args:
+            value: a string.
+
+        Returns:
+            An integer code.
+        """
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+
+
+
+class TweetStore():
+    """
+    Compact in-memory collection of tweets, as returned by the merge of TweetsDownloader, stored as a struct of arrays:
+     - ids as int64, timestamps as int64 seconds (datetime64[s]) and metrics as int32/int64 arrays
+     - author ids, sources and languages dictionary encoded, hashtags interned
+     - texts as a single utf-8 buffer with offsets
+     - referenced tweets as parallel arrays of types and ids
+    Values that don't fit the columns (and any other field) are kept as they are, only for the tweets that have them.
+
+    Indexing or iterating the store returns read-only TweetView objects, which behave as the original dictionaries,
+    so the functions of TweetsUtils keep working; TweetView.copy returns a plain dictionary.
+    Timestamps have a resolution of one second, as the "created_at" field of the API.
+    """
+
+    def __init__(self, tweets=()):
+        """
+        Class initialization.
+
+        Args:
+            tweets: iterable of tweets (dictionaries) to append.
+        """
+        self.ids = array('q')
+        self.times = array('q')
+        self.metrics = {m: array(typecode) for m, typecode in METRICS.items()}
+        self.vocabularies = {field: Vocabulary() for field in CATEGORICAL + ['hashtags', 'referenced_tweets']}
+        self.categorical = {field: array('i') for field in CATEGORICAL}
+        self.text_buffer = bytearray()
+        self.text_offsets = array('q', [0])
+        self.has_text = array('b')
+        self.hashtags = array('i')
+        self.hashtags_offsets = array('i', [0])
+        self.has_hashtags = array('b')
+        self.references_types = array('b')
+        self.references_ids = array('q')
+        self.references_offsets = array('i', [0])
+        self.has_references = array('b')
+        # 0: missing, 1: equal to [id], 2: kept in the extra fields
+        self.edit_history = array('b')
+        self.geo = {}
+        self.extra = {}
+        # datetime type of the appended tweets, either str (as written by the merge) or datetime
+        self.datetime_type = None
+        self.extend(tweets)
+
+
+
+    @classmethod
+    def from_file(cls, filename):
+        """
+        Reads a file of tweets one item at a time, without materializing the dictionaries.
+
+        Args:
+            filename: name of a json, json lines or parquet file.
+
+        Returns:
+            A TweetStore object.
+        """
+        return cls(iter_file(filename))
+
+
+
+    def __len__(self):
+        return len(self.ids)
+
+
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [TweetView(self, p) for p in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if position < 0 or position >= len(self):
+            raise IndexError('TweetStore index out of range')
+        return TweetView(self, position)
+
+
+
+    def __iter__(self):
+        for p in range(len(self)):
+            yield TweetView(self, p)
+
+
+
+    def append(self, tweet):
+        """
+        Appends a tweet.
+
+        Args:
+            tweet: dictionary containing a tweet.
+        """
+        p = len(self)
+        extra = {field: value for field, value in tweet.items() if field not in FIELDS}
+
+        # id
+        tweet_id = tweet.get('id')
+        if type(tweet_id) == str and tweet_id.isdigit() and str(int(tweet_id)) == tweet_id and int(tweet_id) < 2**63:
+            self.ids.append(int(tweet_id))
+        else:
+            self.ids.append(MISSING)
+            if 'id' in tweet:
+                extra['id'] = tweet_id
+
+        # text
+        text = tweet.get('text')
+        if type(text) == str:
+            self.text_buffer += text.encode('utf-8', 'surrogatepass')
+            self.has_text.append(1)
+        else:
+            self.has_text.append(0)
+            if 'text' in tweet:
+                extra['text'] = text
+        self.text_offsets.append(len(self.text_buffer))
+
+        # datetime
+        self.times.append(self.__encode_datetime(tweet, extra))
+
+        # dictionary encoded strings
+        for field in CATEGORICAL:
+            value = tweet.get(field)
+            if type(value) == str:
+                self.categorical[field].append(self.vocabularies[field].encode(value))
+            else:
+                self.categorical[field].append(MISSING)
+                if field in tweet:
+                    extra[field] = value
+
+        # metrics
+        for m, column in self.metrics.items():
+            value = tweet.get(m)
+            if type(value) == int and 0 <= value < 2**31:
+                column.append(value)
+            else:
+                column.append(MISSING)
+                if m in tweet:
+                    extra[m] = value
+
+        # hashtags
+        hashtags = tweet.get('hashtags')
+        if type(hashtags) == list and all(type(h) == str for h in hashtags):
+            self.hashtags.extend(self.vocabularies['hashtags'].encode(h) for h in hashtags)
+            self.has_hashtags.append(1)
+        else:
+            self.has_hashtags.append(0)
+            if 'hashtags' in tweet:
+                extra['hashtags'] = hashtags
+        self.hashtags_offsets.append(len(self.hashtags))
+
+        # referenced tweets
+        references = tweet.get('referenced_tweets')
+        if type(references) == list and all(_is_reference(r) for r in references):
+            self.references_types.extend(self.vocabularies['referenced_tweets'].encode(r['type']) for r in references)
+            self.references_ids.extend(int(r['id']) for r in references)
+            self.has_references.append(1)
+        else:
+            self.has_references.append(0)
+            if 'referenced_tweets' in tweet:
+                extra['referenced_tweets'] = references
+        self.references_offsets.append(len(self.references_ids))
+
+        # edit history, usually the id of the tweet itself
+        history = tweet.get('edit_history_tweet_ids')
+        if 'edit_history_tweet_ids' not in tweet:
+            self.edit_history.append(0)
+        elif history == [tweet_id] and 'id' not in extra:
+            self.edit_history.append(1)
+        else:
+            self.edit_history.append(2)
+            extra['edit_history_tweet_ids'] = history
+
+        # geotagged tweets are a small minority
+        if 'geo' in tweet:
+            self.geo[p] = tweet['geo']
+        if len(extra) > 0:
+            self.extra[p] = extra
+
+
+
+    def extend(self, tweets):
+        """
+        Appends some tweets.
+
+        Args:
+            tweets: iterable of tweets (dictionaries).
+        """
+        for tweet in tweets:
+            self.append(tweet)
+
+
+
+    def column(self, field):
+        """
+        Returns a copy of a numeric column as a numpy array.
+
+        Args:
+            field: "id", "datetime" (as datetime64[s]), a metric, or a dictionary encoded field (as codes, see the vocabularies).
+
+        Returns:
+            A numpy array, with -1 (NaT for datetime) for missing values.
+        """
+        if field == 'id':
+            return _as_numpy(self.ids, np.int64)
+        if field == 'datetime':
+            return _as_numpy(self.times, np.int64).view('datetime64[s]')
+        if field in self.metrics:
+            return _as_numpy(self.metrics[field], np.int32 if METRICS[field] == 'i' else np.int64)
+        if field in self.categorical:
+            return _as_numpy(self.categorical[field], np.int32)
+        raise Exception(f'"{field}" is not a numeric column')
+
+
+
+    def to_dicts(self):
+        """
+        Returns the tweets as a list of dictionaries.
+        """
+        return [view.copy() for view in self]
+
+
+
+    def memory_usage(self):
+        """
+        Returns the approximate memory used by the store, in bytes (the extra fields are not deeply measured).
+        """
+        arrays = [self.ids, self.times, self.text_offsets, self.has_text, self.hashtags, self.hashtags_offsets,
+                  self.has_hashtags, self.references_types, self.references_ids, self.references_offsets,
+                  self.has_references, self.edit_history, *self.metrics.values(), *self.categorical.values()]
+        total = sum(a.itemsize * len(a) for a in arrays) + len(self.text_buffer)
+        for vocabulary in self.vocabularies.values():
+            total += sum(len(v) + 49 for v in vocabulary.values) * 2
+        total += (len(self.geo) + len(self.extra)) * 200
+        return total
+
+
+
+    def get(self, p, field):
+        """
+        Returns the value of a field of the tweet at a position.
+
+        Args:
+            p: position of the tweet.
+            field: name of the field.
+
+        Returns:
+            The value of the field.
+
+        Raises:
+            KeyError: if the tweet doesn't have the field.
+        """
+        extra = self.extra.get(p)
+        if extra is not None and field in extra:
+            return extra[field]
+
+        if field == 'id':
+            if self.ids[p] != MISSING:
+                return str(self.ids[p])
+        elif field == 'text':
+            if self.has_text[p]:
+                return self.text_buffer[self.text_offsets[p]:self.text_offsets[p+1]].decode('utf-8', 'surrogatepass')
+        elif field == 'datetime':
+            if self.times[p] != MISSING_TIME:
+                date = EPOCH + timedelta(seconds=self.times[p])
+                return str(date) if self.datetime_type == str else date
+        elif field in self.categorical:
+            code = self.categorical[field][p]
+            if code != MISSING:
+                return self.vocabularies[field].values[code]
+        elif field in self.metrics:
+            if self.metrics[field][p] != MISSING:
+                return self.metrics[field][p]
+        elif field == 'hashtags':
+            if self.has_hashtags[p]:
+                values = self.vocabularies['hashtags'].values
+                return [values[c] for c in self.hashtags[self.hashtags_offsets[p]:self.hashtags_offsets[p+1]]]
+        elif field == 'referenced_tweets':
+            if self.has_references[p]:
+                types = self.vocabularies['referenced_tweets'].values
+                i, j = self.references_offsets[p], self.references_offsets[p+1]
+                return [{'type': types[t], 'id': str(r)} for t, r in zip(self.references_types[i:j], self.references_ids[i:j])]
+        elif field == 'edit_history_tweet_ids':
+            if self.edit_history[p] == 1:
+                return [str(self.ids[p])]
+        elif field == 'geo':
+            if p in self.geo:
+                return self.geo[p]
+        raise KeyError(field)
+
+
+
+    def has(self, p, field):
+        """
+        Checks if the tweet at a position has a field.
+
+        Args:
+            p: position of the tweet.
+            field: name of the field.
+
+        Returns:
+            True if the tweet has the field.
+        """
+        extra = self.extra.get(p)
+        if extra is not None and field in extra:
+            return True
+        if field == 'id':
+            return self.ids[p] != MISSING
+        if field == 'text':
+            return self.has_text[p] == 1
+        if field == 'datetime':
+            return self.times[p] != MISSING_TIME
+        if field in self.categorical:
+            return self.categorical[field][p] != MISSING
+        if field in self.metrics:
+            return self.metrics[field][p] != MISSING
+        if field == 'hashtags':
+            return self.has_hashtags[p] == 1
+        if field == 'referenced_tweets':
+            return self.has_references[p] == 1
+        if field == 'edit_history_tweet_ids':
+            return self.edit_history[p] == 1
+        if field == 'geo':
+            return p in self.geo
+        return False
+
+
+
+    def fields(self, p):
+        """
+        Returns the fields of the tweet at a position.
+
+        Args:
+            p: position of the tweet.
+
+        Returns:
+            A list of field names.
+        """
+        extra = self.extra.get(p, {})
+        fields = [f for f in FIELDS if f not in extra and self.has(p, f)]
+        return fields + [f for f in extra if f not in fields]
+
+
+
+    def __encode_datetime(self, tweet, extra):
+        """
+        Converts the datetime of a tweet into seconds from the epoch.
+
+        Args:
+            tweet: dictionary containing a tweet.
+            extra: extra fields of the tweet, where a datetime that can't be converted is kept.
+
+        Returns:
+            The seconds from the epoch, or MISSING_TIME.
+        """
+        value = tweet.get('datetime')
+        if type(value) not in [str, datetime]:
+            if 'datetime' in tweet:
+                extra['datetime'] = value
+            return MISSING_TIME
+        if self.datetime_type is None:
+            self.datetime_type = type(value)
+
+        try:
+            date = datetime.fromisoformat(value) if type(value) == str else value
+        except ValueError:
+            date = None
+        # the original value is kept if it can't be rebuilt exactly
+        if date is None or type(value) != self.datetime_type or date.tzinfo is not None or date.microsecond != 0 \
+           or (type(value) == str and str(date) != value):
+            extra['datetime'] = value
+            return MISSING_TIME
+        return (date - EPOCH) // timedelta(seconds=1)
+
+
+
+
+class TweetView(Mapping):
+    """
+    Read-only dictionary-like view of a tweet inside a TweetStore.
+    """
+    __slots__ = ('store', 'position')
+
+
+    def __init__(self, store, position):
+        self.store = store
+        self.position = position
+
+
+    def __getitem__(self, field):
+        return self.store.get(self.position, field)
+
+
+    def __contains__(self, field):
+        return self.store.has(self.position, field)
+
+
+    def __iter__(self):
+        return iter(self.store.fields(self.position))
+
+
+    def __len__(self):
+        return len(self.store.fields(self.position))
+
+
+    def copy(self):
+        return {field: self[field] for field in self}
+
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+
+
+# a reference to a tweet, with only type and numeric id
+def _is_reference(r):
+    return type(r) == dict and r.keys() == {'type', 'id'} and type(r['id']) == str and r['id'].isdigit() \
+           and str(int(r['id'])) == r['id'] and int(r['id']) < 2**63 and type(r['type']) == str
+
+
+
+# numpy copy of an array.array (a view would prevent the array from growing)
+def _as_numpy(a, dtype):
+    if len(a) == 0:
+        return np.array([], dtype=dtype)
+    return np.frombuffer(a, dtype=dtype).copy()
@@ -1,10 +1,24 @@
 import pandas as pd
 import numpy as np
-import json
+import json, re, gc, os
+from bisect import bisect_left
+from functools import lru_cache
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 
 def filter_year(tweets, year):
+    if isinstance(tweets, TweetCollection) and len(tweets) > 0:
+        if type(tweets[0]['datetime']) == str:
+            return tweets.in_range('datetime', str(year), str(year+1))
+        return tweets.in_range('datetime', datetime(year,1,1), datetime(year+1,1,1))
     if type(tweets[0]['datetime']) == str:
         return [tw for tw in tweets if tw['datetime'].startswith(str(year))]
     else:
@@ -14,6 +28,8 @@ def filter_year(tweets, year):
 # returns the tweets that match the value in the field
 # if value2 is not None, then it's a range between the two values
 def filter_list(tweets, field, value, value2=None, multiple=False):
+    if isinstance(tweets, TweetCollection):
+        return tweets.filter(field, value, value2, multiple)
     if value2:
         return list(filter(lambda tw: (tw[field] >= value and tw[field] < value2), tweets))
     elif multiple:
@@ -29,6 +45,8 @@ def filter_list(tweets, field, value, value2=None, multiple=False):
 
 # return the sorted tweets by the field
 def sort_list(tweets, by, reverse=True):
+    if isinstance(tweets, TweetCollection) and by == 'datetime':
+        return tweets.sorted_by('datetime', reverse)
     return sorted(tweets, key=lambda tw: tw[by], reverse=reverse)
 
 
@@ -93,14 +111,14 @@ def is_original(tweet):
 
 # counts how many keywords are present in a text
 def count_keywords(text, keywords):
-    return np.sum([k in text for k in keywords])
+    return get_keyword_matcher(keywords).count(text)
 
 
 
 # returns tweets with the keyword k, in combination with other (n-1) keywords
 def keyword_in_combination(tweets, k, keywords, n):
-    tmp = [tw for tw in tweets if k in tw['text'].lower()]
-    return [tw for tw in tmp if count_keywords(tw['text'], keywords) >= n]
+    matcher = get_keyword_matcher(keywords)
+    return [tw for tw in tweets if k in tw['text'].lower() and matcher.count(tw['text']) >= n]
 
 
 
@@ -120,87 +138,854 @@ def has_mentions(text, all_mentions):
 
 # check if a text contains at least one word
 def has_words(text, words):
-    for w in words:
-        if w in text.lower():
-            return True
-    return False
+    return get_keyword_matcher(words, lowercase=True).has_any(text)
+
+
 
+# as a dataframe, joining tweets with their places (geolocalization) or, if not geotagged, with their authors location (user_location)
+# if chunksize is not None, it returns a generator of dataframes, one for each chunk of tweets (tweets can be an iterator)
+def get_tweets_with_location(tweets, users, places, chunksize=None):
+    df_places = pd.DataFrame([p for p in places if 'id' in p]).drop_duplicates('id').rename(columns={'id': 'place_id'})
+    df_users = pd.DataFrame([dict(u['location'], author_id=u['id']) for u in users if ('location' in u) and (type(u['location'])==dict)])
+    df_users = df_users.drop_duplicates('author_id')
 
+    if chunksize is None:
+        return _join_locations(tweets, df_places, df_users)
+    return (_join_locations(chunk, df_places, df_users) for chunk in _chunks(tweets, chunksize))
 
-# as a dataframe
-def get_tweets_with_location(tweets, users, places):
-    # get data
-    tmp = select_fields(tweets, ['datetime', 'text', 'geo', 'author_id'])
-    df = pd.DataFrame(tmp)
+
+
+def _join_locations(tweets, df_places, df_users):
+    df = pd.DataFrame(select_fields(tweets, ['datetime', 'text', 'geo', 'author_id']))
+    for field in ['datetime', 'text', 'geo', 'author_id']:
+        if field not in df:
+            df[field] = None
     
-    # geolocalization
-    df_geo = df.copy()
-    df_geo['geo'] = df_geo['geo'].apply(lambda x: x['place_id'] if type(x)==dict and 'place_id' in x else None)
-    df_geo = df_geo.dropna()
-    place_ids = select_fields(places, ['id'], as_list=True, unique=True)
-    df_geo = df_geo[df_geo['geo'].isin(place_ids)].reset_index(drop=True)
-    rows = []
-    for g in df_geo['geo']:
-        rows.append(filter_list(places, 'id', g)[0])
-    tmp = pd.DataFrame(rows).reset_index(drop=True)
-    df_geo = pd.concat([df_geo, tmp], axis=1)
-    for field in ['geo', 'id']:
-        del df_geo[field]
-
-    # user location
-    df_loc = df[df['geo'].isna()].copy()
-    del df_loc['geo']
-    d = {u['id']:u['location'] for u in users if ('location' in u) and (type(u['location'])==dict)}
-    df_loc['author_id'] = df_loc['author_id'].apply(lambda x: d[x] if x in d else None)
-    df_loc = df_loc.dropna().reset_index(drop=True)
-    tmp = pd.DataFrame(list(df_loc['author_id']))
-    df_loc = pd.concat([df_loc, tmp], axis=1)
+    # geolocalization: hash join on the place id
+    geotagged = df['geo'].notna()
+    df_geo = df[geotagged].copy()
+    df_geo['place_id'] = [x.get('place_id') if type(x)==dict else None for x in df_geo['geo']]
+    df_geo = df_geo.drop(columns='geo').dropna()
+    if len(df_places) > 0:
+        df_geo = df_geo.merge(df_places, on='place_id', how='inner')
+    else:
+        df_geo = df_geo.iloc[0:0]
+    df_geo = df_geo.drop(columns='place_id')
+
+    # user location: hash join on the author id
+    df_loc = df[~geotagged].drop(columns='geo').dropna()
+    if len(df_users) > 0:
+        df_loc = df_loc.merge(df_users, on='author_id', how='inner')
+    else:
+        df_loc = df_loc.iloc[0:0]
 
     # add row type
-    df_geo['type'] = ['geolocalization'] * len(df_geo)
-    df_loc['type'] = ['user_location'] * len(df_loc)
+    df_geo['type'] = 'geolocalization'
+    df_loc['type'] = 'user_location'
     
     # combination
     df = pd.concat([df_geo, df_loc], axis=0)
-    df = df.sort_values(by='datetime')
+    df = df.sort_values(by='datetime', kind='stable')
     del df['author_id']
     
     return df
 
 
 
+# splits an iterable into lists of n items
+def _chunks(items, n):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == n:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+
+# model (e.g. a classifier) of each process of the pool of _map_texts, sent only once
+_worker_model = None
+
+
+
+def _init_worker(model):
+    global _worker_model
+    _worker_model = model
+
+
+
+def _apply_worker(function, texts):
+    return function(_worker_model, texts)
+
+
+
+# batches and the results of function(model, texts of the batch), computed on a pool of processes with a bounded number
+# of pending batches; only the texts (get_texts(batch), in the parent) are sent to the processes, and function must be importable
+def _map_texts(function, model, batches, get_texts=None, workers=None):
+    get_texts = get_texts or (lambda batch: batch)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for batch in batches:
+            yield batch, function(model, get_texts(batch))
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model,)) as executor:
+        pending = []
+        for batch in batches:
+            pending.append((batch, executor.submit(_apply_worker, function, get_texts(batch))))
+            if len(pending) >= 2 * workers:
+                batch, future = pending.pop(0)
+                yield batch, future.result()
+        for batch, future in pending:
+            yield batch, future.result()
+
+
+
+#--------------------------------
+# keyword matching
+#--------------------------------
+
+
+# up to this number of keywords, KeywordMatcher looks for each substring separately
+SUBSTRING_SCAN_LIMIT = 8
+
+
+
+class KeywordMatcher():
+    """
+    Finds which keywords appear in a text with a single scan, by compiling them once into a trie-shaped regular expression. 
+    Every hit is returned as a bitmask, where bit i is set if the i-th (distinct) keyword appears in the text. 
+    Keywords can be substrings (as "k in text" does) or whole words and phrases, e.g. "mal di gola". 
+    """
+
+    def __init__(self, keywords, word_boundaries=False, lowercase=False):
+        """
+        Compiles the keywords. 
+
+        Args:
+            keywords: list of keywords; repeated keywords are counted more than once by count, as count_keywords did. 
+            word_boundaries: if True, keywords match only as whole words. 
+            lowercase: if True, texts are lowercased before matching. 
+        """
+        self.keywords = list(dict.fromkeys(keywords))
+        self.lowercase = lowercase
+        self.bits = {k: 1 << i for i, k in enumerate(self.keywords)}
+        multiplicity = {}
+        for k in keywords:
+            multiplicity[k] = multiplicity.get(k, 0) + 1
+        self.weights = [multiplicity[k] for k in self.keywords] if any(m > 1 for m in multiplicity.values()) else None
+
+        # the empty keyword is in every text
+        self.always = self.bits.get('', 0)
+        words = [k for k in self.keywords if k != '']
+        # a few substrings are found faster one at a time than with a regular expression
+        self.substrings = [(k, self.bits[k]) for k in words] if not word_boundaries and len(words) <= SUBSTRING_SCAN_LIMIT else None
+        if len(words) == 0:
+            self.regex = None
+            return
+
+        boundary = r'\b' if word_boundaries else ''
+        # lookahead, to find overlapping keywords too: at each position, the longest keyword starting there is captured
+        self.regex = re.compile('(?=' + boundary + '(' + _trie_pattern(words) + ')' + boundary + ')')
+
+        # a keyword implies the (shorter) keywords it contains
+        self.implied = {}
+        for k in words:
+            mask = 0
+            for k2 in words:
+                if re.search(boundary + re.escape(k2) + boundary, k):
+                    mask |= self.bits[k2]
+            self.implied[k] = mask
+
+
+    def match(self, text):
+        """
+        Returns the bitmask of the keywords that appear in a text. 
+        """
+        if self.lowercase:
+            text = text.lower()
+        mask = self.always
+        if self.substrings is not None:
+            for k, bit in self.substrings:
+                if k in text:
+                    mask |= bit
+        elif self.regex is not None:
+            for m in self.regex.finditer(text):
+                mask |= self.implied[m.group(1)]
+        return mask
+
+
+    def count(self, text):
+        """
+        Returns how many keywords appear in a text. 
+        """
+        mask = self.match(text)
+        if self.weights is None:
+            return bin(mask).count('1')
+        return sum(w for i, w in enumerate(self.weights) if mask >> i & 1)
+
+
+    def has_any(self, text):
+        """
+        Returns True if at least one keyword appears in a text. 
+        """
+        if self.always:
+            return True
+        if self.lowercase:
+            text = text.lower()
+        return self.regex is not None and self.regex.search(text) is not None
+
+
+    def hits(self, text):
+        """
+        Returns the list of keywords that appear in a text. 
+        """
+        return self.keywords_of(self.match(text))
+
+
+    def keywords_of(self, mask):
+        """
+        Returns the list of keywords of a bitmask. 
+        """
+        return [k for k in self.keywords if mask & self.bits[k]]
+
+
+    def match_many(self, tweets, field='text'):
+        """
+        Returns the bitmasks of a collection of tweets (or texts), as a numpy array (of python ints with more than 64 keywords). 
+        """
+        masks = [self.match(tw if type(tw) == str else tw[field]) for tw in tweets]
+        if len(self.keywords) <= 64:
+            return np.array(masks, dtype=np.uint64)
+        return np.array(masks, dtype=object)
+
+
+    def counts_many(self, tweets, field='text'):
+        """
+        Returns, for each keyword, how many tweets (or texts) of a collection contain it, with a single pass. 
+        """
+        totals = dict.fromkeys(self.keywords, 0)
+        for tw in tweets:
+            mask = self.match(tw if type(tw) == str else tw[field])
+            for k in self.keywords_of(mask):
+                totals[k] += 1
+        return totals
+
+
+
+# compiled matcher of a list of keywords, reused by count_keywords, has_words and keyword_in_combination
+def get_keyword_matcher(keywords, word_boundaries=False, lowercase=False):
+    return _cached_keyword_matcher(tuple(keywords), word_boundaries, lowercase)
+
+
+
+@lru_cache(maxsize=128)
+def _cached_keyword_matcher(keywords, word_boundaries, lowercase):
+    return KeywordMatcher(keywords, word_boundaries, lowercase)
+
+
+
+# regular expression matching any of the words, shaped as a trie so that each position is matched in a single walk
+# at each position it matches the longest word (shorter ones are tried when backtracking)
+def _trie_pattern(words):
+    trie = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[''] = True
+    return _trie_node_pattern(trie)
+
+
+
+def _trie_node_pattern(node):
+    alternatives = [re.escape(ch) + _trie_node_pattern(child) for ch, child in node.items() if ch != '']
+    if len(alternatives) == 0:
+        return ''
+    pattern = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+    if '' in node:
+        pattern = '(?:' + pattern + ')?'
+    return pattern
+
+
+
+#--------------------------------
+# indexed collection
+#--------------------------------
+
+
+class TweetCollection(list):
+    """
+    List of tweets (or users, or places) with lazily built indexes, used by filter_list, filter_year and sort_list instead of full scans:
+     - hash indexes on any field with hashable values (e.g. id, author_id)
+     - a sorted index for range filters (e.g. datetime)
+     - inverted indexes on lowercased hashtags and entities
+
+    It behaves as a normal list; the indexes are dropped whenever the list is modified. 
+    Changes to the tweets themselves (e.g. tw['datetime'] = datetime.strptime(...)) are not seen by the indexes: 
+    call reindex after editing the tweets in place, otherwise filters and sorts use the old values. 
+    Fields with unhashable values (e.g. geo) are filtered with a linear scan. 
+    """
+
+    def __init__(self, tweets=()):
+        super().__init__(tweets)
+        self._indexes = {}
+
+
+    def reindex(self, field=None):
+        """
+        Drops the indexes built on a field, or every index, so that they are built again from the current values when needed. 
+        It must be called after the tweets are modified in place. 
+
+        Args:
+            field: the modified field; if None, every index is dropped. 
+        """
+        if field is None:
+            self._indexes = {}
+        else:
+            self._indexes = {k: v for k, v in self._indexes.items() if k[1] != field}
+
+
+    def filter(self, field, value, value2=None, multiple=False):
+        """
+        Same as filter_list, using the indexes. 
+
+        Returns:
+            A TweetCollection with the matching tweets, in their original order. 
+        """
+        if value2:
+            return self.in_range(field, value, value2)
+        elif field in ['hashtags', 'entities'] and not multiple:
+            positions = self.__inverted_index(field).get(value.lower(), [])
+            return TweetCollection(self[p].copy() for p in positions)
+
+        index = self.__hash_index(field)
+        if index is None:
+            # unhashable values
+            if multiple:
+                return TweetCollection(tw for tw in self if field in tw and tw[field] in value)
+            return TweetCollection(tw for tw in self if field in tw and tw[field] == value)
+        elif multiple:
+            positions = sorted(set(p for v in value if _is_hashable(v) for p in index.get(v, [])))
+            return self.__select(positions)
+        else:
+            return self.__select(index.get(value, []) if _is_hashable(value) else [])
+
+
+    def in_range(self, field, start, end):
+        """
+        Returns the tweets whose field is in [start, end), using binary search on the sorted index. 
+
+        Returns:
+            A TweetCollection with the matching tweets, in their original order. 
+        """
+        keys, positions = self.__sorted_index(field)
+        i, j = bisect_left(keys, start), bisect_left(keys, end)
+        return self.__select(sorted(positions[i:j]))
+
+
+    def sorted_by(self, field, reverse=True):
+        """
+        Same as sort_list, using the sorted index (the order of equal values is kept, as sorted does). 
+
+        Returns:
+            A sorted TweetCollection. 
+        """
+        keys, positions = self.__sorted_index(field)
+        if not reverse:
+            return self.__select(positions)
+
+        # descending values, but equal values in their original order
+        result = []
+        j = len(keys)
+        while j > 0:
+            i = bisect_left(keys, keys[j-1], 0, j)
+            result += positions[i:j]
+            j = i
+        return self.__select(result)
+
+
+    # tweets at the given positions
+    def __select(self, positions):
+        return TweetCollection(self[p] for p in positions)
+
+
+    # value -> positions, or None if some values are unhashable
+    def __hash_index(self, field):
+        key = ('hash', field)
+        if key not in self._indexes:
+            index = {}
+            try:
+                for p, tw in enumerate(self):
+                    if field in tw:
+                        index.setdefault(tw[field], []).append(p)
+            except TypeError:
+                index = None
+            self._indexes[key] = index
+        return self._indexes[key]
+
+
+    # sorted values and their positions
+    def __sorted_index(self, field):
+        key = ('sorted', field)
+        if key not in self._indexes:
+            positions = sorted(range(len(self)), key=lambda p: self[p][field])
+            self._indexes[key] = ([self[p][field] for p in positions], positions)
+        return self._indexes[key]
+
+
+    # lowercased hashtag / entity -> positions
+    def __inverted_index(self, field):
+        key = ('inverted', field)
+        if key not in self._indexes:
+            index = {}
+            for p, tw in enumerate(self):
+                if field in tw:
+                    values = tw[field] if field == 'hashtags' else [x['text'] for x in tw[field]]
+                    for v in set(x.lower() for x in values):
+                        index.setdefault(v, []).append(p)
+            self._indexes[key] = index
+        return self._indexes[key]
+
+
+    # every modification drops the indexes
+    def __invalidate(method):
+        def wrapper(self, *args, **kwargs):
+            self._indexes = {}
+            return method(self, *args, **kwargs)
+        wrapper.__name__ = method.__name__
+        return wrapper
+
+    append = __invalidate(list.append)
+    extend = __invalidate(list.extend)
+    insert = __invalidate(list.insert)
+    pop = __invalidate(list.pop)
+    remove = __invalidate(list.remove)
+    clear = __invalidate(list.clear)
+    sort = __invalidate(list.sort)
+    reverse = __invalidate(list.reverse)
+    __setitem__ = __invalidate(list.__setitem__)
+    __delitem__ = __invalidate(list.__delitem__)
+    __iadd__ = __invalidate(list.__iadd__)
+    del __invalidate
+
+
+    def copy(self):
+        return TweetCollection(self)
+
+
+
+# True if a value can be a key of a dictionary
+def _is_hashable(value):
+    try:
+        hash(value)
+        return True
+    except TypeError:
+        return False
+
+
+
 #--------------------------------
 # read and write functions
 #--------------------------------
 
 
-def read_file(filename):
+@lru_cache(maxsize=None)
+def get_tweets_schema():
+    """
+    Returns the typed columns of the merged tweets, when saved as parquet (other fields are dropped). 
+    It's built only the first time it's called, since pyarrow is needed only for parquet files. 
+
+    Returns:
+        A pyarrow schema. 
+    """
+    pa, _ = _pyarrow()
+    return pa.schema([
+        ('id', pa.string()),
+        ('text', pa.string()),
+        ('author_id', pa.string()),
+        ('datetime', pa.timestamp('s')),
+        ('source', pa.string()),
+        ('lang', pa.string()),
+        ('retweet_count', pa.int64()),
+        ('reply_count', pa.int64()),
+        ('like_count', pa.int64()),
+        ('quote_count', pa.int64()),
+        ('impression_count', pa.int64()),
+        ('hashtags', pa.list_(pa.string())),
+        ('geo', pa.struct([('place_id', pa.string()), 
+                           ('coordinates', pa.struct([('type', pa.string()), ('coordinates', pa.list_(pa.float64()))]))])),
+        ('referenced_tweets', pa.list_(pa.struct([('type', pa.string()), ('id', pa.string())]))),
+        ('edit_history_tweet_ids', pa.list_(pa.string())),
+    ])
+
+
+
+# TWEETS_SCHEMA is still available as a module attribute, built when accessed
+def __getattr__(name):
+    if name == 'TWEETS_SCHEMA':
+        return get_tweets_schema()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+
+# pyarrow is needed only for parquet files, so it's imported when they are read or written
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise Exception('pyarrow is required to read and write parquet files')
+    return pa, pq
+
+
+
+# json library used to read and write files: orjson if installed (several times faster), otherwise the standard json module
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+
+def set_json_backend(backend):
+    """
+    Selects the json library used by read_file, iter_file, save_file and FileWriter. 
+
+    Args:
+        backend: either "orjson" or "json". 
     """
-    Read a json file 
+    global JSON_BACKEND
+    if backend == 'orjson' and orjson is None:
+        raise Exception('orjson is not installed')
+    if backend not in ['orjson', 'json']:
+        raise Exception(f'Unknown json backend "{backend}"')
+    JSON_BACKEND = backend
+
+
+
+def decode_json(data):
+    """
+    Decodes a json document with the selected backend. 
+
+    Args:
+        data: a string or utf-8 encoded bytes. 
+
+    Returns:
+        The decoded object. 
+    """
+    if JSON_BACKEND == 'orjson':
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+
+def encode_json(item):
+    """
+    Encodes an object as json with the selected backend; datetimes are written as "yyyy-mm-dd HH:MM:SS", as str does. 
+
+    Args:
+        item: an object. 
+
+    Returns:
+        The utf-8 encoded json document, as bytes. 
+    """
+    if JSON_BACKEND == 'orjson':
+        try:
+            return orjson.dumps(item, default=_json_default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # e.g. integers larger than 64 bits
+            pass
+    return json.dumps(item, default=_json_default).encode('utf-8')
+
+
+
+# the garbage collector is paused while decoding, since millions of new objects would trigger many useless full collections
+@contextmanager
+def _no_gc():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+
+def _json_default(item):
+    if isinstance(item, datetime):
+        return str(item)
+    raise TypeError(f'Object of type {type(item).__name__} is not JSON serializable')
+
+
+
+def parse_datetimes(values):
+    """
+    Parses many datetime strings at once, with numpy instead of strptime. 
+
+    Args:
+        values: list of strings with format "yyyy-mm-dd HH:MM:SS" (or ISO 8601), or None. 
+
+    Returns:
+        A numpy datetime64[us] array, with NaT for None values. 
+    """
+    return np.array(values, dtype='datetime64[us]')
+
+
+
+def read_file(filename, columns=None, filters=None, as_table=False, parse_dates=False):
+    """
+    Read a json file, a json lines file if the extension is ".jsonl", or a parquet file if the extension is ".parquet". 
 
     Args:
         filename: name of the json file. 
+        columns: parquet only, list of columns to read; if None, every column is read. 
+        filters: parquet only, predicates on the rows to read, e.g. [('datetime', '>=', datetime(2019,1,1))]; 
+                 row groups that don't satisfy them are skipped. 
+        as_table: parquet only, if True it returns a pyarrow Table instead of a list of dictionaries. 
+        parse_dates: if True, the "datetime" field of the tweets is converted into a datetime object, parsing all the dates at once 
+                     (parquet files with a timestamp column already have datetime objects). 
 
     Returns:
-        A dictionary containing the tweets. 
+        A dictionary containing the tweets (a list of dictionaries for json lines and parquet files). 
     """
-    with open(filename, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    if filename.endswith('.parquet'):
+        _, pq = _pyarrow()
+        table = pq.read_table(filename, columns=columns, filters=filters)
+        if as_table:
+            return table
+        data = _from_arrow_table(table)
+    elif filename.endswith('.jsonl'):
+        with _no_gc():
+            data = list(iter_file(filename))
+    else:
+        with open(filename, 'rb') as f, _no_gc():
+            data = decode_json(f.read())
+
+    if parse_dates and type(data) == list:
+        rows = [tw for tw in data if type(tw) == dict and type(tw.get('datetime')) == str]
+        for tw, date in zip(rows, parse_datetimes([tw['datetime'] for tw in rows]).tolist()):
+            tw['datetime'] = date
     return data
 
 
 
-def save_file(text, filename, _type='json'):
+def iter_file(filename):
+    """
+    Iterate over the items of a json lines or parquet file, without reading the whole file, or over the items of a json list. 
+
+    Args:
+        filename: name of the file. 
+
+    Returns:
+        A generator of dictionaries. 
+    """
+    if filename.endswith('.parquet'):
+        pa, pq = _pyarrow()
+        f = pq.ParquetFile(filename)
+        for batch in f.iter_batches():
+            yield from _from_arrow_table(pa.Table.from_batches([batch], schema=f.schema_arrow))
+        return
+    if not filename.endswith('.jsonl'):
+        yield from read_file(filename)
+        return
+    with open(filename, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield decode_json(line)
+
+
+
+def save_file(text, filename, _type='json', schema=None):
     """
     Write a dictionary into a json file. 
 
     Args:
         filename: name of the json file. 
-        _type: format of the destination file, either "txt" or "json"
+        _type: format of the destination file, either "txt", "json", "jsonl" or "parquet"
+        schema: parquet only, pyarrow schema of the columns (e.g. get_tweets_schema()); if None, it's inferred from the data. 
     """
     if _type == 'txt':
         with open(filename, 'w', encoding='utf-8') as f:
             f.write(text)
     elif _type == 'json':
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(text, f)
+        with open(filename, 'wb') as f:
+            f.write(encode_json(text))
+    else:
+        writer = FileWriter(filename, _type, schema)
+        for item in text:
+            writer.write(item)
+        writer.close()
+
+
+
+class FileWriter():
+    """
+    Writes items one at a time into a json lines file, a json list or a parquet file, without keeping them in memory. 
+    Parquet files without a schema are the exception: the items are kept until the file is closed, so that the schema can be inferred from all of them. 
+    Items can be appended to an existing file: json lines files are opened in append mode, while json lists and parquet files 
+    are copied into a temporary file (in a streaming pass), which replaces the original one when closed. 
+    """
+
+    def __init__(self, filename, _type='jsonl', schema=None, batch_size=50000, append=False):
+        """
+        Opens the destination file. 
+
+        Args:
+            filename: name of the destination file. 
+            _type: format of the destination file, either "jsonl", "json" or "parquet". 
+            schema: parquet only, pyarrow schema of the columns; if None, it's inferred from the data. 
+            batch_size: parquet only, number of rows of each row group. 
+            append: if True and the file exists, the items are added after the ones already in the file. 
+        """
+        self.filename = filename
+        self._type = _type
+        self.schema = schema
+        self.batch_size = batch_size
+        self.count = 0
+        self.rows = []
+        self.target = None
+        append = append and os.path.exists(filename)
+        if append and _type != 'jsonl':
+            self.target = filename
+            self.filename = filename + '.tmp'
+        if _type == 'parquet':
+            self.f = None
+        else:
+            self.f = open(self.filename, 'ab' if append and _type == 'jsonl' else 'wb')
+        if _type == 'json':
+            self.f.write(b'[')
+        if self.target is not None:
+            for item in iter_file(self.target):
+                self.write(item)
+
+
+    def write(self, item):
+        """
+        Appends an item to the file. 
+
+        Args:
+            item: a dictionary. 
+        """
+        if self._type == 'json':
+            if self.count > 0:
+                self.f.write(b', ')
+            self.f.write(encode_json(item))
+        elif self._type == 'parquet':
+            self.rows.append(item)
+            if self.schema is not None and len(self.rows) >= self.batch_size:
+                self.__flush()
+        else:
+            self.f.write(encode_json(item) + b'\n')
+        self.count += 1
+
+
+    def close(self):
+        """
+        Closes the file. 
+        """
+        if self._type == 'parquet':
+            if len(self.rows) > 0 or self.f is None:
+                self.__flush()
+        elif self._type == 'json':
+            self.f.write(b']')
+        self.f.close()
+        if self.target is not None:
+            os.replace(self.filename, self.target)
+            self.filename, self.target = self.target, None
+
+
+    def __flush(self):
+        """
+        Writes the buffered rows as a parquet row group. 
+        """
+        table = _to_arrow_table(self.rows, self.schema)
+        if self.f is None:
+            _, pq = _pyarrow()
+            self.f = pq.ParquetWriter(self.filename, table.schema)
+        self.f.write_table(table)
+        self.rows = []
+
+
+
+def _to_arrow_table(rows, schema=None):
+    """
+    Converts a list of dictionaries into a pyarrow Table. 
+    Without a schema, the column types are inferred, and columns with mixed types are stored as json strings. 
+
+    Args:
+        rows: list of dictionaries. 
+        schema: pyarrow schema; fields outside the schema are dropped. 
+
+    Returns:
+        A pyarrow Table. 
+    """
+    pa, _ = _pyarrow()
+    if schema is not None:
+        columns = [_to_arrow_array([r.get(f.name) for r in rows], f.type) for f in schema]
+        return pa.Table.from_arrays(columns, schema=schema)
+
+    names = list(dict.fromkeys(k for r in rows for k in r))
+    arrays, json_columns = [], []
+    for name in names:
+        values = [r.get(name) for r in rows]
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+            arrays.append(pa.array([None if v is None else encode_json(v).decode('utf-8') for v in values], pa.string()))
+            json_columns.append(name)
+    metadata = {'json_columns': json.dumps(json_columns)}
+    return pa.Table.from_arrays(arrays, names=names).replace_schema_metadata(metadata)
+
+
+
+def _to_arrow_array(values, _type):
+    """
+    Converts a list of values into a pyarrow Array of the given type, parsing datetime strings for timestamp columns. 
+
+    Args:
+        values: list of values. 
+        _type: pyarrow DataType. 
+
+    Returns:
+        A pyarrow Array. 
+    """
+    pa, _ = _pyarrow()
+    if pa.types.is_timestamp(_type):
+        values = [datetime.fromisoformat(v) if type(v) == str else v for v in values]
+    return pa.array(values, _type)
+
+
+
+def _from_arrow_table(table):
+    """
+    Converts a pyarrow Table into a list of dictionaries, decoding the json columns and dropping the missing fields. 
+
+    Args:
+        table: pyarrow Table. 
+
+    Returns:
+        A list of dictionaries. 
+    """
+    metadata = table.schema.metadata or {}
+    json_columns = set(json.loads(metadata.get(b'json_columns', b'[]')))
+    rows = table.to_pylist()
+    for r in rows:
+        _drop_missing_fields(r)
+        for k in json_columns & r.keys():
+            r[k] = decode_json(r[k])
+    return rows
+
+
+
+def _drop_missing_fields(d):
+    """
+    Removes the None values from a dictionary and from its nested dictionaries. 
+
+    Args:
+        d: a dictionary, modified in place. 
+    """
+    for k in list(d.keys()):
+        if d[k] is None:
+            del d[k]
+        elif type(d[k]) == dict:
+            _drop_missing_fields(d[k])
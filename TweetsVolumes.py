@@ -0,0 +1,317 @@
+import pickle
+import pandas as pd
+import numpy as np
+
+from TweetsUtils import get_keyword_matcher, is_retweet, is_original, iter_file, parse_datetimes, _chunks
+
+
+# tweet types, the last dimension of the cube
+TYPES = ['original', 'retweet', 'other']
+
+# region of the tweets without a location
+UNKNOWN = 'unknown'
+
+
+
+class VolumeCube():
+    """
+    Hourly volumes of tweets as a dense numpy array with dimensions (hour, keyword, region, type), built in a single pass.
+
+    A tweet is counted for each keyword contained in its lowercased text (as the notebooks do with "k in tw['text'].lower()"),
+    plus once in the "all" slot whatever its keywords. Its region comes from its place if geotagged, otherwise from its author location,
+    as get_tweets_with_location does; types are "original", "retweet" and "other" (replies and quotes).
+    New tweets can be added at any time, and any combination can be sliced and resampled (e.g. "3h", "1d", "1w") without the raw tweets.
+    """
+
+    def __init__(self, keywords, users=(), places=(), area='region'):
+        """
+        Class initialization.
+
+        Args:
+            keywords: list of keywords.
+            users: merged users, with their location.
+            places: merged places.
+            area: location field used as region, either "region" (italian subsets) or "country".
+        """
+        self.keywords = list(dict.fromkeys(keywords))
+        self.area = area
+        self.matcher = get_keyword_matcher(self.keywords, lowercase=True)
+        self.regions = [UNKNOWN]
+        self.regions_codes = {UNKNOWN: 0}
+        self.users_regions = {}
+        self.places_regions = {}
+
+        # first hour of the cube, as hours from the epoch
+        self.origin = None
+        self.counts = np.zeros((0, len(self.keywords) + 1, 1, len(TYPES)), dtype=np.int32)
+        self.hours = 0
+        self.add_locations(users, places)
+
+
+
+    def add_locations(self, users=(), places=()):
+        """
+        Adds users and places, used to assign a region to the tweets added afterwards.
+
+        Args:
+            users: merged users, with their location.
+            places: merged places.
+        """
+        for u in users:
+            if type(u.get('location')) == dict and self.area in u['location']:
+                self.users_regions[u['id']] = self.__region_code(u['location'][self.area])
+        for p in places:
+            if 'id' in p and self.area in p:
+                self.places_regions[p['id']] = self.__region_code(p[self.area])
+
+
+
+    def update(self, tweets, batch_size=50000):
+        """
+        Adds some tweets, in batches processed with numpy.
+
+        Args:
+            tweets: iterable of merged tweets (e.g. iter_file of the merged file, or the tweets of new pages).
+            batch_size: number of tweets of each batch.
+        """
+        for batch in _chunks(tweets, batch_size):
+            self.__update_batch([tw for tw in batch if 'datetime' in tw])
+
+
+
+    def series(self, keyword=None, regions=None, types=None, freq='1d', trim=True):
+        """
+        Returns the volume of a combination, resampled.
+
+        Args:
+            keyword: a keyword; if None, every tweet is counted once.
+            regions: a region or a list of regions; if None, every region (and tweets without region) is considered.
+            types: a type or a list of types ("original", "retweet", "other"); if None, every type is considered.
+            freq: pandas frequency of the buckets, e.g. "1h", "3h", "1d", "1w".
+            trim: if True, hours before the first and after the last tweet of the combination are dropped,
+                  so that buckets are the same as resampling the tweets themselves.
+
+        Returns:
+            A Pandas Series of counts, indexed by bucket.
+        """
+        k = len(self.keywords) if keyword is None else self.keywords.index(keyword)
+        values = self.counts[:self.hours, k][:, self.__positions(regions, self.regions, self.regions_codes)]
+        values = values[:, :, self.__positions(types, TYPES, {t: i for i, t in enumerate(TYPES)})].sum(axis=(1, 2))
+
+        start, end = 0, len(values)
+        if trim:
+            nonzero = np.nonzero(values)[0]
+            if len(nonzero) == 0:
+                return pd.Series([], dtype=np.int64, index=pd.DatetimeIndex([])).resample(freq).sum()
+            start, end = nonzero[0], nonzero[-1] + 1
+
+        index = pd.DatetimeIndex((np.arange(start, end) + (self.origin or 0)).astype('datetime64[h]'))
+        return pd.Series(values[start:end].astype(np.int64), index=index).resample(freq).sum()
+
+
+
+    def frame(self, regions=None, types=None, freq='1d'):
+        """
+        Returns the volume of every keyword, resampled, with their sum in the "total" column (as in the notebooks).
+
+        Args:
+            regions: a region or a list of regions; if None, every region is considered.
+            types: a type or a list of types; if None, every type is considered.
+            freq: pandas frequency of the buckets.
+
+        Returns:
+            A Pandas DataFrame with one column for each keyword, plus "total".
+        """
+        df = pd.DataFrame({k: self.series(k, regions, types, freq, trim=False) for k in self.keywords})
+        nonzero = np.nonzero(df.sum(axis=1).to_numpy())[0]
+        if len(nonzero) > 0:
+            df = df.iloc[nonzero[0]:nonzero[-1]+1]
+        df['total'] = df.sum(axis=1)
+        return df
+
+
+
+    def by_region(self, keyword=None, types=None, freq='1d'):
+        """
+        Returns the volume of each region, resampled.
+
+        Args:
+            keyword: a keyword; if None, every tweet is counted once.
+            types: a type or a list of types; if None, every type is considered.
+            freq: pandas frequency of the buckets.
+
+        Returns:
+            A Pandas DataFrame with one column for each region (tweets without region excluded).
+        """
+        return pd.DataFrame({r: self.series(keyword, r, types, freq, trim=False) for r in self.regions if r != UNKNOWN})
+
+
+
+    def merge(self, other):
+        """
+        Adds the volumes of another cube with the same keywords (e.g. another year or partition).
+
+        Args:
+            other: a VolumeCube object.
+
+        Returns:
+            The cube itself.
+        """
+        if self.keywords != other.keywords:
+            raise Exception('Cubes with different keywords cannot be merged')
+        if other.hours == 0:
+            return self
+        regions = np.array([self.__region_code(r) for r in other.regions])
+        self.__ensure(other.origin, other.origin + other.hours - 1)
+        offset = other.origin - self.origin
+        self.counts[offset:offset + other.hours, :, regions] += other.counts[:other.hours]
+        return self
+
+
+
+    def save(self, filename):
+        """
+        Saves the cube into a pickle file.
+        """
+        self.counts = self.counts[:self.hours]
+        with open(filename, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+
+    @staticmethod
+    def load(filename):
+        """
+        Loads a cube saved by save.
+
+        Returns:
+            A VolumeCube object.
+        """
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+
+
+
+    @classmethod
+    def from_files(cls, keywords, tweets_filename, users_filename=None, places_filename=None, area='region'):
+        """
+        Builds a cube streaming over merged files.
+
+        Args:
+            keywords: list of keywords.
+            tweets_filename: merged tweets file.
+            users_filename: merged users file.
+            places_filename: merged places file.
+            area: location field used as region, either "region" or "country".
+
+        Returns:
+            A VolumeCube object.
+        """
+        users = iter_file(users_filename) if users_filename is not None else ()
+        places = iter_file(places_filename) if places_filename is not None else ()
+        cube = cls(keywords, users, places, area)
+        cube.update(iter_file(tweets_filename))
+        return cube
+
+
+
+    def __update_batch(self, tweets):
+        """
+        Adds a batch of tweets.
+
+        Args:
+            tweets: list of merged tweets, with datetime.
+        """
+        if len(tweets) == 0:
+            return
+        dates = [tw['datetime'] for tw in tweets]
+        dates = parse_datetimes(dates) if type(dates[0]) == str else np.array(dates, dtype='datetime64[us]')
+        hours = dates.astype('datetime64[h]').astype(np.int64)
+        self.__ensure(int(hours.min()), int(hours.max()))
+        hours -= self.origin
+
+        regions = np.array([self.__tweet_region(tw) for tw in tweets], dtype=np.int64)
+        types = np.array([1 if is_retweet(tw) else 0 if is_original(tw) else 2 for tw in tweets], dtype=np.int64)
+
+        # one row for each (tweet, keyword) hit, plus one for each tweet in the "all" slot
+        masks = self.matcher.match_many(tweets)
+        if masks.dtype == np.uint64:
+            bits = (masks[:, None] >> np.arange(len(self.keywords), dtype=np.uint64)) & np.uint64(1)
+        else:
+            bits = np.array([[m >> i & 1 for i in range(len(self.keywords))] for m in masks], dtype=np.uint8)
+        rows, keywords = np.nonzero(bits.reshape(len(tweets), len(self.keywords)))
+        rows = np.concatenate([rows, np.arange(len(tweets))])
+        keywords = np.concatenate([keywords, np.full(len(tweets), len(self.keywords))])
+
+        np.add.at(self.counts, (hours[rows], keywords, regions[rows], types[rows]), 1)
+
+
+
+    def __tweet_region(self, tweet):
+        """
+        Returns the region code of a tweet: the one of its place if geotagged, otherwise the one of its author.
+        """
+        if type(tweet.get('geo')) == dict:
+            return self.places_regions.get(tweet['geo'].get('place_id'), 0)
+        return self.users_regions.get(tweet.get('author_id'), 0)
+
+
+
+    def __region_code(self, region):
+        """
+        Returns the code of a region, adding it to the cube if it's new.
+        """
+        if region not in self.regions_codes:
+            self.regions_codes[region] = len(self.regions)
+            self.regions.append(region)
+        if len(self.regions) > self.counts.shape[2]:
+            padding = np.zeros((self.counts.shape[0], self.counts.shape[1], len(self.regions) - self.counts.shape[2], len(TYPES)),
+                               dtype=self.counts.dtype)
+            self.counts = np.concatenate([self.counts, padding], axis=2)
+        return self.regions_codes[region]
+
+
+
+    def __ensure(self, first, last):
+        """
+        Grows the time dimension to include some hours, with spare capacity at the end.
+
+        Args:
+            first: first hour to include, from the epoch.
+            last: last hour to include, from the epoch.
+        """
+        if self.origin is None:
+            self.origin = first
+        shape = self.counts.shape
+        if first < self.origin:
+            padding = np.zeros((self.origin - first, *shape[1:]), dtype=self.counts.dtype)
+            self.counts = np.concatenate([padding, self.counts])
+            self.hours += self.origin - first
+            self.origin = first
+        needed = last - self.origin + 1
+        if needed > self.counts.shape[0]:
+            capacity = max(needed, 2 * self.counts.shape[0], 24 * 7)
+            padding = np.zeros((capacity - self.counts.shape[0], *shape[1:]), dtype=self.counts.dtype)
+            self.counts = np.concatenate([self.counts, padding])
+        self.hours = max(self.hours, needed)
+
+
+
+    @staticmethod
+    def __positions(values, names, codes):
+        """
+        Returns the positions of some values of a dimension.
+
+        Args:
+            values: a value, a list of values, or None for every value.
+            names: every value of the dimension.
+            codes: dictionary from values to positions.
+
+        Returns:
+            A list of positions.
+        """
+        if values is None:
+            return list(range(len(names)))
+        if type(values) == str:
+            values = [values]
+        return [codes[v] for v in values if v in codes]
@@ -13,8 +13,11 @@ LANGUAGE = 'en'
 td = TweetsDownloader(language=LANGUAGE, max_results_per_request=500, sleep_time=2, filename=FILENAME, path=PATH)
 td.download(KEYWORDS, DATES_RANGE, original_tweets=False)
 
-# merge files
-td.merge_tweets_content(destination_path=DEST_PATH, fix_retweets_text=False)
-td.merge_users_info(destination_path=DEST_PATH, geolocalize_locations=False)
-td.merge_places(destination_path=DEST_PATH)
+# merge files (single pass over the downloaded pages, json lines output)
+td.merge(destination_path=DEST_PATH, fix_retweets_text=False, geolocalize_locations=False)
+
+# or, one file at a time, as json lists
+# td.merge_tweets_content(destination_path=DEST_PATH, fix_retweets_text=False)
+# td.merge_users_info(destination_path=DEST_PATH, geolocalize_locations=False)
+# td.merge_places(destination_path=DEST_PATH)
 
@@ -0,0 +1,100 @@
+import os, sys, json, types, threading, importlib.util
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# the modules live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the API keys are read from credentials.py, which is not part of the repository
+if importlib.util.find_spec('credentials') is None:
+    credentials = types.ModuleType('credentials')
+    credentials.BEARER_TOKEN = ''
+    sys.modules['credentials'] = credentials
+
+from TweetsUtils import TweetCollection
+
+
+
+class StubServer():
+    """
+    Http server on localhost, answering with the routes set by the tests instead of the Twitter API and Nominatim.
+    A route is a function of the query parameters returning the status code, the json body and optionally the headers.
+    """
+
+
+    def __init__(self):
+        """
+        Class initialization. The server is started in a daemon thread, on a free port.
+        """
+        self.routes = {}
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                stub.requests.append((url.path, params))
+                if url.path not in stub.routes:
+                    response = (404, {})
+                else:
+                    response = stub.routes[url.path](params)
+                status, body, headers = response if len(response) == 3 else response + ({},)
+                content = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+
+
+    def requested(self, path):
+        """
+        Returns the query parameters of the requests to a path, in order.
+        """
+        return [params for p, params in self.requests if p == path]
+
+
+
+    def close(self):
+        """
+        Stops the server.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer()
+    yield server
+    server.close()
+
+
+
+@pytest.fixture
+def collection():
+    return TweetCollection({'id': str(i), 'author_id': str(i % 2), 'datetime': '%d-06-01 10:00:00' % (2018 + i % 3),
+                            'geo': {'place_id': 'p%d' % (i % 2)}, 'retweet_count': i % 4,
+                            'hashtags': ['Influenza'] + (['febbre'] if i % 3 == 0 else []),
+                            'entities': [{'text': 'Roma' if i % 2 else 'Milano'}]} for i in range(9))
+
+
+
+
+@pytest.fixture
+def spam_tweets():
+    return [{'id': str(i), 'author_id': str(i % 3), 'text': 'ho la febbre @amico #influenza', 'hashtags': ['influenza']} for i in range(30)]
@@ -0,0 +1,87 @@
+from datetime import datetime
+
+from TweetsUtils import filter_list, filter_year, sort_list
+
+
+
+def test_filter_gives_the_same_tweets_as_a_list(collection):
+    tweets = list(collection)
+    for field, value in [('author_id', '1'), ('id', '3'), ('author_id', '5'), ('retweet_count', 0)]:
+        assert filter_list(collection, field, value) == filter_list(tweets, field, value)
+    assert filter_list(collection, 'id', ['7', '2', '9'], multiple=True) == filter_list(tweets, 'id', ['7', '2', '9'], multiple=True)
+    assert [tw['id'] for tw in filter_list(collection, 'id', ['7', '2', '9'], multiple=True)] == ['2', '7']
+
+
+
+def test_filter_on_hashtags_and_entities_ignores_the_case(collection):
+    tweets = list(collection)
+    assert [tw['id'] for tw in filter_list(collection, 'hashtags', 'FEBBRE')] == ['0', '3', '6']
+    assert filter_list(collection, 'hashtags', 'influenza') == filter_list(tweets, 'hashtags', 'influenza')
+    assert filter_list(collection, 'entities', 'roma') == filter_list(tweets, 'entities', 'roma')
+    assert filter_list(collection, 'hashtags', 'covid') == []
+
+    # the matching tweets are copies, as for lists
+    filter_list(collection, 'hashtags', 'febbre')[0]['id'] = 'x'
+    assert collection[0]['id'] == '0'
+
+
+
+def test_in_range(collection):
+    tweets = list(collection)
+    assert [tw['id'] for tw in filter_list(collection, 'datetime', '2019', '2020')] == ['1', '4', '7']
+    assert filter_list(collection, 'retweet_count', 1, 3) == filter_list(tweets, 'retweet_count', 1, 3)
+    assert collection.in_range('datetime', '2021', '2022') == []
+    assert [tw['id'] for tw in filter_year(collection, 2020)] == ['2', '5', '8']
+
+
+
+def test_sorted_by_keeps_the_order_of_equal_values(collection):
+    tweets = list(collection)
+    for reverse in [True, False]:
+        assert sort_list(collection, 'datetime', reverse) == sort_list(tweets, 'datetime', reverse)
+        assert collection.sorted_by('retweet_count', reverse) == sorted(tweets, key=lambda tw: tw['retweet_count'], reverse=reverse)
+
+
+
+def test_modifications_drop_the_indexes(collection):
+    assert len(filter_list(collection, 'author_id', '1')) == 4
+
+    collection.append({'id': '9', 'author_id': '1', 'datetime': '2019-01-01 10:00:00'})
+    assert len(filter_list(collection, 'author_id', '1')) == 5
+    assert [tw['id'] for tw in filter_year(collection, 2019)] == ['1', '4', '7', '9']
+
+    del collection[1]
+    assert len(filter_list(collection, 'author_id', '1')) == 4
+    collection[0] = {'id': '0', 'author_id': '1', 'datetime': '2019-01-01 10:00:00'}
+    assert len(filter_list(collection, 'author_id', '1')) == 5
+
+
+
+def test_reindex_after_editing_tweets_in_place(collection):
+    assert len(filter_year(collection, 2019)) == 3
+
+    for tw in collection:
+        tw['datetime'] = datetime.strptime(tw['datetime'], '%Y-%m-%d %H:%M:%S')
+    collection.reindex('datetime')
+
+    assert [tw['id'] for tw in filter_year(collection, 2019)] == ['1', '4', '7']
+    assert [tw['id'] for tw in sort_list(collection, 'datetime')] == ['2', '5', '8', '1', '4', '7', '0', '3', '6']
+
+
+
+def test_reindex_drops_only_the_given_field(collection):
+    assert len(filter_list(collection, 'author_id', '1')) == 4
+    collection[0]['author_id'] = '1'
+    collection.reindex('datetime')
+    assert len(filter_list(collection, 'author_id', '1')) == 4
+    collection.reindex()
+    assert len(filter_list(collection, 'author_id', '1')) == 5
+
+
+
+def test_filter_on_unhashable_values(collection):
+    expected = [tw for tw in collection if tw['geo'] == {'place_id': 'p1'}]
+
+    assert filter_list(collection, 'geo', {'place_id': 'p1'}) == expected
+    assert filter_list(collection, 'geo', [{'place_id': 'p1'}], multiple=True) == expected
+    assert filter_list(collection, 'id', {'place_id': 'p1'}) == []
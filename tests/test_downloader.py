@@ -0,0 +1,149 @@
+import pytest
+from time import time
+
+from TweetsDownloader import TweetsDownloader
+
+
+
+SEARCH = '/2/tweets/search/all'
+
+
+
+def make_downloader(stub_server, tmp_path, **kwargs):
+    return TweetsDownloader('it', 10, 0, 'flu', str(tmp_path) + '/', backoff_time=0.001,
+                            api_url=stub_server.url + '/2', nominatim_url=stub_server.url, **kwargs)
+
+
+
+# search route answering with pages of tweet ids, linked by their next tokens
+def search_pages(pages, headers={}):
+    def route(params):
+        n = int(params.get('next_token', '0'))
+        data = [{'id': _id, 'text': 'ho la febbre', 'created_at': '2020-01-01T10:00:00.000Z'} for _id in pages[n]]
+        meta = {'result_count': len(data)}
+        if n + 1 < len(pages):
+            meta['next_token'] = str(n + 1)
+        return 200, {'data': data, 'meta': meta}, headers
+    return route
+
+
+
+def test_download_follows_the_pagination(stub_server, tmp_path):
+    stub_server.routes[SEARCH] = search_pages([['2', '1'], ['3'], ['5', '4']])
+    downloader = make_downloader(stub_server, tmp_path)
+    downloader.download(['febbre'], ('2020-01-01', '2020-01-02'), verbose=False)
+
+    requests = stub_server.requested(SEARCH)
+    assert [params.get('next_token') for params in requests] == [None, '1', '2']
+    assert all(params['start_time'].startswith('2020-01-01T00:00:00') for params in requests)
+    assert all(params['end_time'].startswith('2020-01-02T00:00:00') for params in requests)
+    assert downloader.get_watermark(['febbre'])['newest_id'] == '5'
+
+
+
+def test_incremental_download_requests_only_newer_tweets(stub_server, tmp_path):
+    stub_server.routes[SEARCH] = search_pages([['2', '1']])
+    downloader = make_downloader(stub_server, tmp_path)
+    downloader.download(['febbre'], ('2020-01-01', '2020-01-02'), verbose=False, incremental=True)
+
+    stub_server.routes[SEARCH] = search_pages([['4', '3']])
+    downloader.download(['febbre'], None, verbose=False, incremental=True)
+
+    params = stub_server.requested(SEARCH)[-1]
+    assert params['since_id'] == '2'
+    assert 'start_time' not in params
+    assert downloader.get_watermark(['febbre'])['newest_id'] == '4'
+
+
+
+def test_download_retries_transient_errors(stub_server, tmp_path):
+    errors = [429, 503]
+    pages = search_pages([['1']])
+    stub_server.routes[SEARCH] = lambda params: (errors.pop(0), {}) if len(errors) > 0 else pages(params)
+    downloader = make_downloader(stub_server, tmp_path)
+    downloader.download(['febbre'], ('2020-01-01', '2020-01-02'), verbose=False)
+
+    assert len(stub_server.requested(SEARCH)) == 3
+    assert downloader.get_watermark(['febbre'])['newest_id'] == '1'
+
+
+
+def test_download_fails_after_the_retries(stub_server, tmp_path):
+    stub_server.routes[SEARCH] = lambda params: (503, {})
+    downloader = make_downloader(stub_server, tmp_path, max_retries=2)
+
+    with pytest.raises(Exception):
+        downloader.download(['febbre'], ('2020-01-01', '2020-01-02'), verbose=False)
+    assert len(stub_server.requested(SEARCH)) == 3
+    assert downloader.get_watermark(['febbre']) == {}
+
+
+
+def test_rate_limit_headers_update_the_limiter(stub_server, tmp_path):
+    stub_server.routes[SEARCH] = search_pages([['1']], {'x-rate-limit-remaining': '7', 'x-rate-limit-reset': '0'})
+    downloader = make_downloader(stub_server, tmp_path)
+    downloader.download(['febbre'], ('2020-01-01', '2020-01-02'), verbose=False)
+
+    assert 7 <= downloader.search_limiter.tokens < 8
+
+
+
+def test_exhausted_rate_limit_blocks_until_the_reset(stub_server, tmp_path):
+    reset = int(time()) + 3600
+    stub_server.routes[SEARCH] = search_pages([['1'], ['2']], {'x-rate-limit-remaining': '0', 'x-rate-limit-reset': str(reset)})
+    downloader = make_downloader(stub_server, tmp_path)
+    downloader.download(['febbre'], ('2020-01-01', '2020-01-02'), verbose=False, max_requests=1)
+
+    assert len(stub_server.requested(SEARCH)) == 1
+    assert downloader.search_limiter.blocked_until == reset
+    assert downloader.search_limiter.estimate_time(1) > 3500
+
+
+
+COUNTS = '/2/tweets/counts/all'
+
+
+
+# counts route answering with daily buckets from 2020-01-01, two per page
+def counts_pages(tweet_counts):
+    buckets = [{'start': '2020-01-0%dT00:00:00.000Z' % (d + 1), 'end': '2020-01-0%dT00:00:00.000Z' % (d + 2), 'tweet_count': c}
+               for d, c in enumerate(tweet_counts)]
+    def route(params):
+        n = int(params.get('next_token', '0'))
+        meta = {'total_tweet_count': sum(c['tweet_count'] for c in buckets[n:n+2])}
+        if n + 2 < len(buckets):
+            meta['next_token'] = str(n + 2)
+        return 200, {'data': buckets[n:n+2], 'meta': meta}
+    return route
+
+
+
+def test_plan_balances_the_slices_with_the_counts(stub_server, tmp_path):
+    stub_server.routes[COUNTS] = counts_pages([10, 10, 500, 10, 10, 10, 10])
+    downloader = make_downloader(stub_server, tmp_path)
+    plan = downloader.plan(['febbre'], ('2020-01-01', '2020-01-08'), n_slices=4, granularity='day')
+
+    requests = stub_server.requested(COUNTS)
+    assert [params.get('next_token') for params in requests] == [None, '2', '4', '6']
+    assert requests[0]['granularity'] == 'day'
+    assert plan['tweets'] == 560
+    assert [s['tweets'] for s in plan['slices']] == [140, 140, 140, 140]
+    assert [s['requests'] for s in plan['slices']] == [14, 14, 14, 14]
+    assert plan['requests'] == 56
+    assert plan['cap_usage'] == 560 / downloader.monthly_cap
+
+    # the busy day is split among three slices
+    assert plan['slices'][0]['start'].startswith('2020-01-01T00:00:00')
+    assert [s['end'][:10] for s in plan['slices']] == ['2020-01-03', '2020-01-03', '2020-01-03', '2020-01-08']
+
+
+
+def test_balanced_download_uses_the_planned_slices(stub_server, tmp_path):
+    stub_server.routes[COUNTS] = counts_pages([10, 10, 500, 10, 10, 10, 10])
+    stub_server.routes[SEARCH] = search_pages([['1']])
+    downloader = make_downloader(stub_server, tmp_path)
+    plan = downloader.plan(['febbre'], ('2020-01-01', '2020-01-08'), n_slices=4)
+    downloader.download(['febbre'], ('2020-01-01', '2020-01-08'), n_slices=4, balanced=True, verbose=False)
+
+    starts = sorted(params['start_time'] for params in stub_server.requested(SEARCH))
+    assert starts == [s['start'] for s in plan['slices']]
@@ -0,0 +1,121 @@
+from TweetsFilters import SpamFilter
+from TweetsUtils import FileWriter, iter_file
+
+
+
+def test_apply_twice_gives_the_same_result(spam_tweets):
+    spam_filter = SpamFilter(keywords=['febbre'], max_author_tweets=15)
+
+    first = spam_filter.apply(spam_tweets)
+    first_report = dict(spam_filter.report)
+    second = spam_filter.apply(spam_tweets)
+
+    assert len(first) == 30
+    assert second == first
+    assert spam_filter.report == first_report
+    assert spam_filter.report['super_tweeters'] == 0
+
+
+
+def test_fit_forgets_previous_tweets(spam_tweets):
+    spam_filter = SpamFilter(keywords=['febbre'], max_author_tweets=15)
+    spam_filter.fit(spam_tweets)
+    spam_filter.fit(spam_tweets[:3])
+
+    assert len(spam_filter.tweets_authors) == 3
+    assert spam_filter.statistics()['super_tweeters'] == set()
+
+
+
+def test_tweets_without_keywords_are_removed(spam_tweets):
+    tweets = spam_tweets + [{'id': 'x', 'author_id': '9', 'text': 'bella giornata @amico', 'hashtags': []}]
+    spam_filter = SpamFilter(keywords=['febbre'], max_mentions=30)
+
+    assert [tw['id'] for tw in spam_filter.apply(tweets)] == [tw['id'] for tw in spam_tweets]
+    assert spam_filter.report['keywords'] == 1
+
+    # without keywords every tweet is kept, and its mentions are counted
+    spam_filter = SpamFilter(max_mentions=30)
+    assert len(spam_filter.apply(tweets)) == 0
+    assert spam_filter.report['popular_mentions'] == 31
+
+
+
+def test_super_tweeters_threshold_is_inclusive(spam_tweets):
+    spam_filter = SpamFilter(keywords=['febbre'], max_author_tweets=11)
+    assert len(spam_filter.apply(spam_tweets)) == 30
+
+    spam_filter = SpamFilter(keywords=['febbre'], max_author_tweets=10)
+    assert spam_filter.apply(spam_tweets) == []
+    assert spam_filter.report['super_tweeters'] == 30
+    assert spam_filter.statistics()['super_tweeters'] == {'0', '1', '2'}
+
+
+
+def test_popular_mentions_threshold_is_exclusive(spam_tweets):
+    spam_tweets[0]['text'] = 'ho la febbre @AMICO'
+    spam_filter = SpamFilter(keywords=['febbre'], max_mentions=30)
+    assert len(spam_filter.apply(spam_tweets)) == 30
+
+    spam_filter = SpamFilter(keywords=['febbre'], max_mentions=29)
+    assert spam_filter.apply(spam_tweets) == []
+    assert spam_filter.report['popular_mentions'] == 30
+    assert spam_filter.statistics()['popular_mentions'] == {'@amico'}
+
+
+
+def test_mentions_are_counted_after_removing_the_super_tweeters(spam_tweets):
+    spam_filter = SpamFilter(keywords=['febbre'], max_author_tweets=10, max_mentions=0)
+    spam_filter.apply(spam_tweets)
+
+    assert spam_filter.report['super_tweeters'] == 30
+    assert spam_filter.report['popular_mentions'] == 0
+    assert spam_filter.statistics()['popular_mentions'] == set()
+
+
+
+def test_popular_hashtags_except_the_allowed_ones(spam_tweets):
+    spam_filter = SpamFilter(keywords=['febbre'], max_hashtags=30)
+    assert len(spam_filter.apply(spam_tweets)) == 30
+
+    spam_filter = SpamFilter(keywords=['febbre'], max_hashtags=29)
+    assert spam_filter.apply(spam_tweets) == []
+    assert spam_filter.report['popular_hashtags'] == 30
+
+    for allowed in [dict(allowed_hashtags=['influenza']), dict(allowed_hashtags_substrings=['influ']), dict(keywords=['febbre', 'influenza'])]:
+        spam_filter = SpamFilter(**{'keywords': ['febbre'], 'max_hashtags': 29, **allowed})
+        assert len(spam_filter.apply(spam_tweets)) == 30
+
+
+
+def test_outliers_are_removed(spam_tweets):
+    spam_tweets[0]['text'] = 'ho la febbre per Sanremo'
+    spam_filter = SpamFilter(keywords=['febbre'], outliers=['sanremo'])
+
+    assert [tw['id'] for tw in spam_filter.apply(spam_tweets)] == [str(i) for i in range(1, 30)]
+    assert spam_filter.report['outliers'] == 1
+
+
+
+def test_report_counts_every_tweet_once(spam_tweets):
+    tweets = spam_tweets + [{'id': 'x', 'author_id': '9', 'text': 'bella giornata', 'hashtags': []}]
+    spam_filter = SpamFilter(keywords=['febbre'], max_author_tweets=10, max_mentions=0)
+    spam_filter.apply(tweets)
+
+    assert spam_filter.report == {'keywords': 1, 'super_tweeters': 30, 'popular_mentions': 0, 'popular_hashtags': 0, 'outliers': 0, 'kept': 0}
+
+
+
+def test_filter_file(spam_tweets, tmp_path):
+    spam_tweets[0]['text'] = 'bella giornata'
+    spam_tweets[1]['text'] = 'ho la febbre per Sanremo'
+    writer = FileWriter(str(tmp_path / 'tweets.jsonl'), 'jsonl')
+    for tw in spam_tweets:
+        writer.write(tw)
+    writer.close()
+
+    spam_filter = SpamFilter(keywords=['febbre'], outliers=['sanremo'])
+    report = spam_filter.filter_file(str(tmp_path / 'tweets.jsonl'), str(tmp_path / 'filtered.jsonl'))
+
+    assert list(iter_file(str(tmp_path / 'filtered.jsonl'))) == SpamFilter(keywords=['febbre'], outliers=['sanremo']).apply(spam_tweets)
+    assert report['keywords'] == 1 and report['outliers'] == 1 and report['kept'] == 28
@@ -0,0 +1,58 @@
+import pytest
+
+from TweetsGeocoders import NominatimGeocoder, GeocodingError
+
+
+
+REGIONS = {'lombardia', 'lazio'}
+
+
+
+def make_geocoder(stub_server):
+    return NominatimGeocoder(url=stub_server.url, min_interval=0)
+
+
+
+def test_geocode_hit(stub_server):
+    stub_server.routes['/search'] = lambda params: (200, [{'lat': '45.46', 'lon': '9.19', 'display_name': 'Milano, Lombardia, Italia'}])
+    geocoder = make_geocoder(stub_server)
+
+    assert geocoder.geocode('milano', REGIONS) == [45.46, 9.19, 'Italia']
+    assert geocoder.geocode('milano', REGIONS, italy_subset=True) == [45.46, 9.19, 'lombardia']
+    assert stub_server.requested('/search')[0]['q'] == 'milano'
+
+
+
+def test_geocode_miss(stub_server):
+    stub_server.routes['/search'] = lambda params: (200, [])
+    geocoder = make_geocoder(stub_server)
+
+    assert geocoder.geocode('nowhere', REGIONS) is None
+
+
+
+def test_geocode_outside_italy_in_the_italian_subset(stub_server):
+    stub_server.routes['/search'] = lambda params: (200, [{'lat': '48.85', 'lon': '2.35', 'display_name': 'Paris, France'}])
+    geocoder = make_geocoder(stub_server)
+
+    assert geocoder.geocode('paris', REGIONS) == [48.85, 2.35, 'France']
+    assert geocoder.geocode('paris', REGIONS, italy_subset=True) is None
+
+
+
+@pytest.mark.parametrize('response', [(500, {}), (200, {'error': 'invalid'}), (200, [{'lat': '45.46'}])])
+def test_geocode_error_responses(stub_server, response):
+    stub_server.routes['/search'] = lambda params: response
+    geocoder = make_geocoder(stub_server)
+
+    with pytest.raises(GeocodingError):
+        geocoder.geocode('milano', REGIONS)
+
+
+
+def test_geocode_connection_error(stub_server):
+    geocoder = make_geocoder(stub_server)
+    stub_server.close()
+
+    with pytest.raises(GeocodingError):
+        geocoder.geocode('milano', REGIONS)
@@ -0,0 +1,39 @@
+from TweetsNetwork import split_dates_range, split_counts_range, count_in_range
+
+
+
+def daily_counts(tweet_counts):
+    return [{'start': '2020-01-0%dT00:00:00.000Z' % (d + 1), 'end': '2020-01-0%dT00:00:00.000Z' % (d + 2), 'tweet_count': c}
+            for d, c in enumerate(tweet_counts)]
+
+
+
+def test_uniform_counts_give_slices_of_the_same_width():
+    dates_range = ('2020-01-01T12:00:00Z', '2020-01-08')
+    slices = split_counts_range(dates_range, daily_counts([10] * 7), 3)
+
+    assert [s[:13] for s, _ in slices] == ['2020-01-01T12', '2020-01-03T16', '2020-01-05T20']
+    assert slices[-1][1].startswith('2020-01-08T00')
+    assert all(abs(count_in_range(daily_counts([10] * 7), s) - 65 / 3) < 0.01 for s in slices)
+
+
+
+def test_slices_are_contiguous_and_balanced():
+    counts = daily_counts([10, 10, 500, 10, 10, 10, 10])
+    slices = split_counts_range(('2020-01-01', '2020-01-08'), counts, 4)
+
+    assert all(slices[i][1] == slices[i + 1][0] for i in range(len(slices) - 1))
+    assert [round(count_in_range(counts, s)) for s in slices] == [140, 140, 140, 140]
+
+
+
+def test_without_tweets_the_range_is_split_evenly():
+    dates_range = ('2020-01-01', '2020-01-02')
+    assert split_counts_range(dates_range, daily_counts([0]), 3) == split_dates_range(dates_range, 3)
+
+
+
+def test_count_in_range_scales_the_partial_buckets():
+    counts = daily_counts([10, 20])
+    assert count_in_range(counts, ('2020-01-01T12:00:00Z', '2020-01-02T06:00:00Z')) == 10
+    assert count_in_range(counts, ('2020-01-05', '2020-01-06')) == 0